@@ -0,0 +1,73 @@
+from collections.abc import Callable
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from charting import charting
+
+from .fixtures import historical_data, portfolio_stats
+from .harness import benchmark
+
+# the page pays for building a figure and for serializing it to the browser
+SERIALIZED = [False, True]
+
+def _uncached(builder: Callable[..., go.Figure]) -> Callable[..., go.Figure]:
+    # the cases below time building, which cached figures skip on reruns
+    return builder.__wrapped__
+
+def _timed(build: Callable[[], go.Figure], serialized: bool) -> Callable[[], object]:
+    if serialized:
+        return lambda: build().to_json()
+
+    return build
+
+@benchmark(years=[20, 60], show_mean=[False, True], serialized=SERIALIZED)
+def stats_figure(years: int, show_mean: bool, serialized: bool) -> Callable[[], object]:
+    stats = portfolio_stats(years)
+
+    build = _uncached(charting.get_stats_figure)
+
+    return _timed(lambda: build(stats, show_mean=show_mean), serialized)
+
+@benchmark(serialized=SERIALIZED)
+def hist_figure(serialized: bool) -> Callable[[], object]:
+    series = historical_data().series
+
+    return _timed(lambda: _uncached(charting.get_hist_figure)(series), serialized)
+
+@benchmark(years=[20, 60], serialized=SERIALIZED)
+def invested_withdrawn_figure(years: int, serialized: bool) -> Callable[[], object]:
+    stats = portfolio_stats(years)
+
+    return _timed(lambda: _uncached(charting.get_invested_withdrawn_figure)(stats), serialized)
+
+@benchmark(num_points=[20, 200], serialized=SERIALIZED)
+def success_probability_figure(num_points: int, serialized: bool) -> Callable[[], object]:
+    installments = np.linspace(0, 50_000, num_points)
+    probabilities = np.linspace(0, 1, num_points)
+
+    return _timed(lambda: _uncached(charting.get_success_probability_figure)(installments,
+                                                                             probabilities,
+                                                                             0.9),
+                  serialized)
+
+@benchmark(num_scenarios=[10_000, 100_000], serialized=SERIALIZED)
+def portfolio_dist_plot(num_scenarios: int, serialized: bool) -> Callable[[], object]:
+    values = pd.Series(np.random.default_rng(0).lognormal(13, 1, num_scenarios))
+
+    return _timed(lambda: _uncached(charting.get_portfolio_dist_plot)(values), serialized)
+
+@benchmark(years=[20, 60])
+def cached_stats_figure(years: int) -> Callable[[], go.Figure]:
+    # a rerun with unchanged statistics
+    stats = portfolio_stats(years)
+
+    return lambda: charting.get_stats_figure(stats, show_mean=True)
+
+@benchmark(num_scenarios=[10_000, 100_000], years=[20, 60])
+def fan_chart(num_scenarios: int, years: int) -> Callable[[], go.Figure]:
+    values = np.random.default_rng(0).lognormal(13, 1, (years + 1, num_scenarios))
+    build = _uncached(charting.get_fan_chart_figure)
+
+    return lambda: build(np.arange(years + 1), charting.fan_chart_bands(values))
@@ -0,0 +1,62 @@
+import tempfile
+from collections.abc import Callable
+from functools import cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from tools import HistoricalData, load_config
+from tools import data as data_module
+
+from .harness import benchmark
+
+SYNTHETIC_ROWS = 100_000
+SYNTHETIC_ASSETS = 4
+
+@cache
+def _temp_dir() -> tempfile.TemporaryDirectory:
+    # removed at exit
+    return tempfile.TemporaryDirectory(prefix="koala-benchmarks-")
+
+@cache
+def _source_path(source: str) -> str:
+    if source == "real":
+        return load_config().hist_returns_path
+
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame(rng.normal(0.07, 0.17, size=(SYNTHETIC_ROWS, SYNTHETIC_ASSETS)),
+                         index=pd.date_range("1800-01-01", periods=SYNTHETIC_ROWS, freq="D",
+                                             name="Date"),
+                         columns=[f"Asset {i}" for i in range(SYNTHETIC_ASSETS)])
+
+    path = Path(_temp_dir().name) / "synthetic_returns.csv"
+    frame.to_csv(path)
+
+    return str(path)
+
+@benchmark(source=["real", "synthetic"], tier=["csv", "binary", "memory"])
+def load(source: str, tier: str) -> Callable[[], HistoricalData]:
+    path = _source_path(source)
+    cache_dir = None if tier == "csv" else str(Path(_temp_dir().name) / "data")
+    HistoricalData(path, cache_dir=cache_dir)  # writes the binary copy
+
+    def call() -> HistoricalData:
+        if tier != "memory":
+            data_module._tables.clear()  # noqa: SLF001
+
+        return HistoricalData(path, cache_dir=cache_dir)
+
+    return call
+
+@benchmark(source=["real", "synthetic"], start_date=[None, "1950-01-01"])
+def window_stats(source: str, start_date: str | None) -> Callable[[], tuple]:
+    path = _source_path(source)
+    HistoricalData(path, cache_dir=None)
+
+    def call() -> tuple:
+        hist_data = HistoricalData(path, start_date=start_date, cache_dir=None)
+
+        return hist_data.mean, hist_data.volatility, hist_data.skewness
+
+    return call
@@ -0,0 +1,97 @@
+import importlib.util
+import tempfile
+from collections.abc import Callable
+from functools import partial
+
+import numpy as np
+
+from tools import configure_scenario_store, finance, simulate_and_stats
+from tools.scenarios import scenario_store
+
+from .fixtures import simulation_inputs
+from .harness import benchmark
+
+SCENARIOS = [1_000, 10_000, 100_000]
+YEARS = [20, 60]
+BACKENDS = [backend for backend in finance.BACKENDS
+            if backend != "numba" or importlib.util.find_spec("numba") is not None]
+
+@benchmark(num_scenarios=SCENARIOS, years=YEARS, backend=BACKENDS)
+def simulate_portfolio_values(num_scenarios: int, years: int, backend: str) -> partial:
+    return partial(finance.simulate_portfolio_values,
+                   **simulation_inputs(years),
+                   num_scenarios=num_scenarios,
+                   seed=0,
+                   backend=backend)
+
+@benchmark(num_scenarios=SCENARIOS, years=YEARS, chunk_size=[None, 10_000], backend=BACKENDS)
+def simulate_and_stats_uncached(num_scenarios: int,
+                                years: int,
+                                chunk_size: int | None,
+                                backend: str) -> Callable[[], object]:
+    call = partial(simulate_and_stats.__wrapped__,
+                   **simulation_inputs(years),
+                   num_scenarios=num_scenarios,
+                   chunk_size=chunk_size,
+                   seed=0,
+                   backend=backend)
+
+    def simulate() -> object:
+        # the undecorated function without stored checkpoints, so every call simulates
+        finance._checkpoints.clear()  # noqa: SLF001
+
+        return call()
+
+    return simulate
+
+@benchmark(num_scenarios=[100_000])
+def simulate_and_stats_cached(num_scenarios: int) -> partial:
+    # a page rerun with unchanged inputs: fingerprinting the arguments and unpickling
+    call = partial(simulate_and_stats,
+                   **simulation_inputs(60),
+                   num_scenarios=num_scenarios,
+                   seed=0)
+    call()
+
+    return call
+
+@benchmark(num_scenarios=[10_000, 100_000], stored=[False, True])
+def scenario_drill_down(num_scenarios: int, stored: bool) -> Callable[[], object]:
+    # the last year and the bankrupt paths of a run whose statistics are shown,
+    # stored in a directory that is removed with the callable
+    temp_dir = tempfile.TemporaryDirectory(prefix="koala-benchmarks-") if stored else None
+    call = partial(finance.simulate_scenarios,
+                   **simulation_inputs(60),
+                   num_scenarios=num_scenarios,
+                   seed=0)
+
+    def drill_down() -> object:
+        previous = scenario_store.directory, scenario_store.max_bytes
+        configure_scenario_store(None if temp_dir is None else temp_dir.name)
+
+        try:
+            scenarios = call()
+
+            return scenarios.year(-1), scenarios.ruined()
+        finally:
+            configure_scenario_store(*previous)
+
+    return drill_down
+
+@benchmark(num_scenarios=[10_000, 100_000], sampler=["iid", "block", "stationary"])
+def bootstrap_returns(num_scenarios: int, sampler: str) -> partial:
+    inputs = simulation_inputs(60)
+
+    return partial(finance.bootstrap_returns,
+                   hist_returns=inputs["hist_values"],
+                   num_years=60,
+                   num_scenarios=num_scenarios,
+                   mean=inputs["mean"],
+                   volatility=inputs["volatility"],
+                   rng=np.random.default_rng(0),
+                   sampler=sampler)
+
+@benchmark(years=YEARS)
+def backtest_and_stats(years: int) -> partial:
+    # every historical starting year, without the result cache
+    return partial(finance.backtest_and_stats.__wrapped__, **simulation_inputs(years))
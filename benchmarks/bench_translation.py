@@ -0,0 +1,78 @@
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache, partial
+from pathlib import Path
+
+from tools import load_config, translation
+from tools.cache import ResultCache
+from tools.scheduler import TranslationScheduler
+
+from .harness import benchmark
+from .stand_in_model import STAND_IN_DECODER_NAME, STAND_IN_MODEL_NAME
+
+WORDS = "der Hund läuft heute schnell über die grüne Wiese und sieht einen Vogel".split()
+
+config = load_config()
+
+# timings of the stand-ins are not comparable to the real models, so cases are named apart
+GRAPHS = {"single": ("stand-in" if Path(config.translator_model_path).name == STAND_IN_MODEL_NAME
+                     else "real")}
+if config.translator_decoder_path is not None and Path(config.translator_decoder_path).exists():
+    GRAPHS["split"] = ("stand-in" if Path(config.translator_decoder_path).name
+                       == STAND_IN_DECODER_NAME else "real")
+
+@cache
+def _translator(graphs: str, cached: bool = False) -> translation.Translator:
+    split = graphs == "split"
+
+    return translation.Translator(model_path=config.translator_model_path,
+                                  src_tokenizer_path=config.de_tokenizer_path,
+                                  tgt_tokenizer_path=config.en_tokenizer_path,
+                                  encoder_path=config.translator_encoder_path if split else None,
+                                  decoder_path=config.translator_decoder_path if split else None,
+                                  cache=ResultCache(max_bytes=2**20) if cached else None)
+
+def _sentence(num_words: int) -> str:
+    return " ".join(WORDS[i % len(WORDS)] for i in range(num_words))
+
+@benchmark(model=[f"{graphs}-{kind}" for graphs, kind in GRAPHS.items()], num_words=[4, 16, 64])
+def translate(model: str, num_words: int) -> Callable[[], str]:
+    graphs = model.split("-", 1)[0]
+
+    return partial(_translator(graphs).translate, _sentence(num_words))
+
+@benchmark(model=[f"{graphs}-{kind}" for graphs, kind in GRAPHS.items()],
+           num_sentences=[8, 32],
+           batch_size=[1, 16])
+def translate_batch(model: str, num_sentences: int, batch_size: int) -> partial:
+    graphs = model.split("-", 1)[0]
+    sentences = [_sentence(4 + 3 * (i % 5)) for i in range(num_sentences)]
+
+    return partial(_translator(graphs).translate_batch, sentences, batch_size=batch_size)
+
+@benchmark(model=[f"{graphs}-{kind}" for graphs, kind in GRAPHS.items()], cached=[False, True])
+def translate_rerun(model: str, cached: bool) -> partial:
+    # a page rerun translating the same text again, after the first (warm-up) run
+    graphs = model.split("-", 1)[0]
+    sentences = [_sentence(4 + 3 * (i % 5)) for i in range(32)]
+
+    return partial(_translator(graphs, cached).translate_batch, sentences)
+
+@benchmark(model=[f"{graphs}-{kind}" for graphs, kind in GRAPHS.items()], num_words=[16, 64])
+def first_token(model: str, num_words: int) -> Callable[[], str]:
+    # what users of the streaming translator page wait for
+    graphs = model.split("-", 1)[0]
+    translate_stream = _translator(graphs).translate_stream
+
+    return lambda: next(translate_stream(_sentence(num_words)))
+
+@benchmark(model=[f"{graphs}-{kind}" for graphs, kind in GRAPHS.items()], scheduled=[False, True])
+def concurrent_sessions(model: str, scheduled: bool) -> Callable[[], list]:
+    # 8 sessions translating 4 sentences each at the same time
+    translator = _translator(model.split("-", 1)[0])
+    documents = [[_sentence(4 + 3 * ((i + j) % 5)) for j in range(4)] for i in range(8)]
+    sessions = ThreadPoolExecutor(max_workers=len(documents))
+    translate_batch = (TranslationScheduler(translator).translate if scheduled
+                       else translator.translate_batch)
+
+    return lambda: list(sessions.map(translate_batch, documents))
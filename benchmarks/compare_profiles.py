@@ -0,0 +1,130 @@
+"""
+Accuracy and latency of the translator under different inference profiles:
+
+    python -m benchmarks.compare_profiles [--min-agreement 0.95]
+
+Every profile translates the same German sentences. Its outputs are compared with
+those of the configured profile (exact matches and token F1), so quantization or other
+settings that change the translations show up next to the time they save.
+The fastest profile that agrees well enough with the configured one is recommended.
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING
+
+from .stand_in_model import use_stand_in_models_if_missing
+
+if TYPE_CHECKING:  # tools reads the configuration path on import, after the stand-ins are set up
+    from tools.configuration import InferenceProfile
+
+CORPUS = ["Hallo Welt, wie geht es?",
+          "Der Hund läuft heute schnell über die grüne Wiese.",
+          "Wir sehen uns morgen im Büro.",
+          "Das Wetter ist heute sehr schön.",
+          "Ich habe das Buch gestern Abend gelesen.",
+          "Kannst du mir bitte helfen?",
+          "Die Kinder spielen im Garten.",
+          "Unser Zug fährt um acht Uhr ab.",
+          "Danke für die schnelle Antwort!",
+          "Er arbeitet seit zehn Jahren in dieser Firma."]
+
+@dataclass
+class ProfileResult:
+    name: str
+    load_seconds: float
+    median_seconds: float  # of translating the whole corpus
+    exact_match: float
+    token_f1: float
+
+def _token_f1(candidate: str, reference: str) -> float:
+    candidate_tokens, reference_tokens = Counter(candidate.split()), Counter(reference.split())
+    common = sum((candidate_tokens & reference_tokens).values())
+
+    if not candidate_tokens and not reference_tokens:
+        return 1.0
+    if common == 0:
+        return 0.0
+
+    precision = common / sum(candidate_tokens.values())
+    recall = common / sum(reference_tokens.values())
+
+    return 2 * precision * recall / (precision + recall)
+
+def profiles(base: "InferenceProfile", model_dir: str) -> dict[str, "InferenceProfile"]:
+    """
+    The configured profile and variations of it, all caching their models in `model_dir`.
+    """
+    base = replace(base, optimized_model_dir=model_dir)
+
+    return {"configured": base,
+            "single thread": replace(base, intra_op_threads=1, inter_op_threads=1),
+            **{f"optimization {level}": replace(base, optimization_level=level)
+               for level in ("disabled", "basic", "extended", "all")},
+            "int8": replace(base, quantize=True)}
+
+def compare(repeat: int = 5) -> list[ProfileResult]:
+    from tools import load_config
+    from tools.translation import Translator
+
+    config = load_config()
+    results = []
+    reference = None
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        for name, profile in profiles(config.translator_profile, model_dir).items():
+            start = time.perf_counter()
+            translator = Translator(model_path=config.translator_model_path,
+                                    src_tokenizer_path=config.de_tokenizer_path,
+                                    tgt_tokenizer_path=config.en_tokenizer_path,
+                                    encoder_path=config.translator_encoder_path,
+                                    decoder_path=config.translator_decoder_path,
+                                    profile=profile)
+            load_seconds = time.perf_counter() - start
+
+            outputs = translator.translate_batch(CORPUS)  # also the warm-up
+            reference = reference or outputs
+
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                translator.translate_batch(CORPUS)
+                samples.append(time.perf_counter() - start)
+
+            pairs = list(zip(outputs, reference, strict=True))
+            results.append(ProfileResult(
+                name=name,
+                load_seconds=load_seconds,
+                median_seconds=statistics.median(samples),
+                exact_match=sum(output == expected for output, expected in pairs) / len(pairs),
+                token_f1=statistics.fmean(_token_f1(*pair) for pair in pairs)))
+
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per profile")
+    parser.add_argument("--min-agreement", type=float, default=0.95,
+                        help="token F1 against the configured profile a recommendation needs")
+    args = parser.parse_args()
+
+    if use_stand_in_models_if_missing():
+        print("translator models missing, comparing stand-in models\n")
+
+    results = compare(repeat=args.repeat)
+
+    print(f"{'profile':<24} {'load':>8} {'corpus':>9} {'exact':>6} {'F1':>6}")
+    for result in results:
+        print(f"{result.name:<24} {result.load_seconds:7.3f}s {result.median_seconds:8.4f}s "
+              f"{result.exact_match:6.0%} {result.token_f1:6.3f}")
+
+    accepted = [result for result in results if result.token_f1 >= args.min_agreement]
+    fastest = min(accepted, key=lambda result: result.median_seconds)
+    print(f"\nrecommended: {fastest.name}")
+
+if __name__ == "__main__":
+    main()
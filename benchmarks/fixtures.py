@@ -0,0 +1,35 @@
+from functools import cache
+
+import pandas as pd
+
+from tools import HistoricalData, load_config, simulate_and_stats
+
+START_VALUE = 10_000
+YEARLY_INSTALLMENT = 6_000
+YEARLY_WITHDRAWL = 24_000
+
+@cache
+def historical_data() -> HistoricalData:
+    return HistoricalData(load_config().hist_returns_path)
+
+def simulation_inputs(years: int) -> dict:
+    """
+    Arguments of the simulate_* functions for a horizon of `years`,
+    half of them before retirement.
+    """
+    hist_data = historical_data()
+
+    return {"hist_values": hist_data.series,
+            "start_value": START_VALUE,
+            "years_before_ret": years // 2,
+            "years_after_ret": years - years // 2,
+            "yearly_installment": YEARLY_INSTALLMENT,
+            "yearly_withdrawls": YEARLY_WITHDRAWL,
+            "mean": hist_data.mean,
+            "volatility": hist_data.volatility}
+
+@cache
+def portfolio_stats(years: int) -> pd.DataFrame:
+    return simulate_and_stats.__wrapped__(**simulation_inputs(years),
+                                          num_scenarios=10_000,
+                                          seed=0)
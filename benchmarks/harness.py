@@ -0,0 +1,178 @@
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+# peaks below this are noise (interpreter caches, small temporaries) and never regress
+MIN_PEAK_BYTES = 2**20
+
+@dataclass
+class Benchmark:
+    """
+    A benchmark case generator. `setup` is called once per combination of `params`
+    and returns the zero-argument callable that is timed.
+    """
+
+    name: str
+    setup: Callable[..., Callable[[], Any]]
+    params: dict[str, list]
+
+    def cases(self) -> list[tuple[str, dict[str, Any]]]:
+        combinations = itertools.product(*self.params.values())
+        cases = []
+
+        for values in combinations:
+            case_params = dict(zip(self.params, values, strict=True))
+            label = ",".join(f"{key}={value}" for key, value in case_params.items())
+            cases.append((f"{self.name}[{label}]" if label else self.name, case_params))
+
+        return cases
+
+BENCHMARKS: list[Benchmark] = []
+
+def benchmark(**params: list) -> Callable[[Callable[..., Callable[[], Any]]],
+                                         Callable[..., Callable[[], Any]]]:
+    """
+    Register a benchmark, one case per combination of `params`.
+    """
+    def decorator(setup: Callable[..., Callable[[], Any]]) -> Callable[..., Callable[[], Any]]:
+        module = setup.__module__.rsplit(".", 1)[-1].removeprefix("bench_")
+        BENCHMARKS.append(Benchmark(name=f"{module}.{setup.__name__}",
+                                    setup=setup,
+                                    params=params))
+        return setup
+
+    return decorator
+
+@dataclass
+class Measurement:
+    median_seconds: float
+    min_seconds: float
+    number: int  # calls per timed sample
+    repeat: int
+    peak_bytes: int
+
+def measure(call: Callable[[], Any],
+            repeat: int = 5,
+            min_sample_seconds: float = 0.05) -> Measurement:
+    """
+    Time `call` asv style: one warm-up call (imports, JIT compilation), then `repeat`
+    samples of as many calls as needed to last `min_sample_seconds`.
+    Peak memory comes from one extra call under tracemalloc, kept out of the timings
+    since tracing slows allocations down. Memory allocated outside of Python
+    (for example by onnxruntime) is not traced.
+    """
+    start = time.perf_counter()
+    call()
+    elapsed = time.perf_counter() - start
+
+    number = 1
+    while elapsed * number < min_sample_seconds and number < 10**6:
+        number *= 10
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            call()
+        samples.append((time.perf_counter() - start) / number)
+
+    tracemalloc.start()
+    try:
+        call()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return Measurement(median_seconds=statistics.median(samples),
+                       min_seconds=min(samples),
+                       number=number,
+                       repeat=repeat,
+                       peak_bytes=peak_bytes)
+
+@dataclass
+class Regression:
+    name: str
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline
+
+def find_regressions(results: dict[str, Measurement],
+                     baseline: dict[str, dict[str, Any]],
+                     threshold: float) -> list[Regression]:
+    """
+    Cases whose time or peak memory grew by more than `threshold` (relative)
+    over `baseline`. Times compare the fastest samples, which are the least disturbed
+    by other load on the machine. Cases missing from the baseline are never flagged.
+    """
+    regressions = []
+
+    for name, measurement in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+
+        if measurement.min_seconds > reference["min_seconds"] * (1 + threshold):
+            regressions.append(Regression(name=name,
+                                          metric="min_seconds",
+                                          baseline=reference["min_seconds"],
+                                          current=measurement.min_seconds))
+
+        if (measurement.peak_bytes > MIN_PEAK_BYTES
+                and measurement.peak_bytes > reference["peak_bytes"] * (1 + threshold)):
+            regressions.append(Regression(name=name,
+                                          metric="peak_bytes",
+                                          baseline=max(reference["peak_bytes"], 1),
+                                          current=measurement.peak_bytes))
+
+    return regressions
+
+def _commit() -> str | None:
+    try:
+        output = subprocess.run(["git", "rev-parse", "--short", "HEAD"],  # noqa: S607
+                                capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return output.stdout.strip()
+
+def make_run(results: dict[str, Measurement]) -> dict[str, Any]:
+    return {"timestamp": datetime.now(UTC).isoformat(timespec="seconds"),
+            "commit": _commit(),
+            "machine": {"python": platform.python_version(),
+                        "platform": platform.platform(),
+                        "processor": platform.machine()},
+            "results": {name: asdict(measurement) for name, measurement in results.items()}}
+
+def append_history(path: Path, run: dict[str, Any]) -> None:
+    history = json.loads(path.read_text()) if path.exists() else []
+    history.append(run)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(history, indent=2))
+
+def load_baseline(path: Path) -> dict[str, dict[str, Any]]:
+    if not path.exists():
+        return {}
+
+    return json.loads(path.read_text())["results"]
+
+def save_baseline(path: Path, run: dict[str, Any]) -> None:
+    """
+    Store `run` as the baseline. Cases not in `run` keep their stored results,
+    so a filtered run only updates its own cases.
+    """
+    results = load_baseline(path) | run["results"]
+    path.write_text(json.dumps(run | {"results": results}, indent=2) + "\n")
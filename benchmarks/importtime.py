@@ -0,0 +1,93 @@
+"""
+Cold-start import cost of the app pages, measured with `python -X importtime`:
+
+    python -m benchmarks.importtime
+
+The top-level imports of each page run in a fresh interpreter (the page bodies are
+streamlit code). A page fails its check if the fastest of a few runs exceeds its
+target or if it imports a module it must not load.
+"""
+import ast
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass
+class StartupTarget:
+    max_seconds: float
+    forbidden: tuple[str, ...] = ()
+
+# streamlit alone takes about 0.4s and pandas about 0.3s. Targets leave room for noisy
+# machines, the modules a page must not load catch deferred imports becoming eager
+TARGETS = {
+    "home.py": StartupTarget(max_seconds=1.0,
+                             forbidden=("pandas", "onnxruntime", "tokenizers")),
+    "pages/📈_finance.py": StartupTarget(max_seconds=1.5,
+                                        forbidden=("onnxruntime", "tokenizers", "numba",
+                                                   "tools.translation")),
+    "pages/📚_translator.py": StartupTarget(max_seconds=1.5,
+                                           forbidden=("pandas",)),
+}
+
+@dataclass
+class ImportProfile:
+    seconds: float
+    modules: set[str]
+
+def page_imports(page_path: str) -> str:
+    """
+    Top-level import statements of a page.
+    """
+    tree = ast.parse(Path(page_path).read_text(encoding="utf-8"))
+    statements = [node for node in tree.body if isinstance(node, ast.Import | ast.ImportFrom)]
+
+    return "\n".join(ast.unparse(statement) for statement in statements)
+
+def profile_imports(code: str) -> ImportProfile:
+    """
+    Run `code` in a fresh interpreter with -X importtime and sum the cumulative time
+    of its top-level imports.
+    """
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True, check=True, env=os.environ)
+
+    seconds = 0.0
+    modules = set()
+
+    # lines look like "import time:  self [us] | cumulative | <indented module name>"
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or line.endswith("imported package"):
+            continue
+
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        modules.add(name.strip())
+
+        if not name.startswith("  "):  # nested imports are indented further
+            seconds += int(cumulative) / 1e6
+
+    return ImportProfile(seconds=seconds, modules=modules)
+
+def main(repeat: int = 3) -> int:
+    failures = 0
+
+    for page, target in TARGETS.items():
+        code = page_imports(page)
+        profiles = [profile_imports(code) for _ in range(repeat)]
+        seconds = min(profile.seconds for profile in profiles)
+        loaded = sorted(set(target.forbidden) & profiles[0].modules)
+
+        status = "ok"
+        if seconds > target.max_seconds or loaded:
+            status = "FAILED"
+            failures += 1
+
+        print(f"{page:<28} {seconds:6.3f}s (target {target.max_seconds:.1f}s)"
+              f"{'  imports ' + ', '.join(loaded) if loaded else ''}  {status}")
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Run the benchmarks from the repository root:
+
+    python -m benchmarks.run [-k filter] [--save-baseline]
+
+Every run is appended to the JSON history and compared against the stored baseline.
+The exit code is 1 if any case regressed by more than the threshold.
+"""
+import argparse
+import importlib
+import sys
+from pathlib import Path
+
+from .harness import (
+    BENCHMARKS,
+    append_history,
+    find_regressions,
+    load_baseline,
+    make_run,
+    measure,
+    save_baseline,
+)
+from .stand_in_model import use_stand_in_models_if_missing
+
+MODULES = ["bench_data", "bench_finance", "bench_charting", "bench_translation"]
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+HISTORY_PATH = Path(".cache/benchmarks/history.json")
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="keyword", default="",
+                        help="only run cases whose name contains this string")
+    parser.add_argument("--repeat", type=int, default=5, help="timed samples per case")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="relative slowdown or memory growth flagged as a regression")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--history", type=Path, default=HISTORY_PATH)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store this run as the baseline, merged into the existing one")
+
+    return parser.parse_args()
+
+def _format_bytes(num_bytes: int) -> str:
+    return f"{num_bytes / 2**20:8.2f} MiB"
+
+def main() -> int:
+    args = _parse_args()
+
+    if use_stand_in_models_if_missing():
+        print("Translator models not found, translation cases use stand-in models")
+
+    # importing registers the benchmarks (and `tools` loads the translator model)
+    for module in MODULES:
+        importlib.import_module(f"{__package__}.{module}")
+
+    baseline = load_baseline(args.baseline)
+    results = {}
+
+    for bench in BENCHMARKS:
+        for name, params in bench.cases():
+            if args.keyword not in name:
+                continue
+
+            measurement = measure(bench.setup(**params), repeat=args.repeat)
+            results[name] = measurement
+
+            reference = baseline.get(name)
+            change = ("" if reference is None
+                      else f"  {measurement.min_seconds / reference['min_seconds']:5.2f}x")
+            print(f"{name:<90} {measurement.median_seconds * 1e3:10.3f} ms"
+                  f"  {_format_bytes(measurement.peak_bytes)}{change}", flush=True)
+
+    run = make_run(results)
+    append_history(args.history, run)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, run)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    regressions = find_regressions(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression.name} {regression.metric}: "
+              f"{regression.baseline:.6g} -> {regression.current:.6g} "
+              f"({regression.ratio:.2f}x)", file=sys.stderr)
+
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""
+Tiny stand-ins for the translator models, so the translation benchmarks run offline
+when the real models are not present.
+They have the inputs and outputs of the real models and "translate" by copying the source
+tokens, so the number of decoding steps grows with the input length as for real text.
+"""
+import json
+import os
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+
+import numpy as np
+from tokenizers import Tokenizer
+
+STAND_IN_DIR = Path(".cache/benchmarks")
+STAND_IN_MODEL_NAME = "stand_in_translator.onnx"
+STAND_IN_ENCODER_NAME = "stand_in_translator_encoder.onnx"
+STAND_IN_DECODER_NAME = "stand_in_translator_decoder.onnx"
+
+def _import_onnx() -> ModuleType:
+    try:
+        import onnx
+    except ImportError as e:
+        msg = """The translator model is missing and onnx is not installed to build
+                    a stand-in, install it with `pip install -r benchmarks/requirements.txt`"""
+        raise RuntimeError(msg) from e
+
+    return onnx
+
+def _constant(onnx: ModuleType, name: str, data_type: int, values: list) -> Any:
+    return onnx.helper.make_node(
+        "Constant", [], [name],
+        value=onnx.helper.make_tensor(name, data_type, [len(values)], values))
+
+def _shift_nodes(onnx: ModuleType, tokens: str, shifted: str, pad_id: int) -> list:
+    # drop the first token and append a padding token
+    int64 = onnx.TensorProto.INT64
+
+    return [_constant(onnx, "starts", int64, [1]),
+            _constant(onnx, "ends", int64, [np.iinfo(np.int64).max]),
+            _constant(onnx, "axes", int64, [1]),
+            onnx.helper.make_node("Slice", [tokens, "starts", "ends", "axes"], ["next_tokens"]),
+            _constant(onnx, "pads", int64, [0, 0, 0, 1]),
+            onnx.helper.make_node("Constant", [], ["pad_id"],
+                                  value=onnx.helper.make_tensor("pad_id", int64, [], [pad_id])),
+            onnx.helper.make_node("Pad", ["next_tokens", "pads", "pad_id"], [shifted])]
+
+def _one_hot_nodes(onnx: ModuleType, tokens: str, logits: str, vocab_size: int) -> list:
+    return [_constant(onnx, "depth", onnx.TensorProto.INT64, [vocab_size]),
+            _constant(onnx, "one_hot_values", onnx.TensorProto.FLOAT, [0.0, 1.0]),
+            onnx.helper.make_node("OneHot", [tokens, "depth", "one_hot_values"], [logits])]
+
+def _save(onnx: ModuleType, graph: Any, path: Path) -> None:
+    model = onnx.helper.make_model(graph, opset_imports=[onnx.helper.make_opsetid("", 17)])
+    model.ir_version = 8  # readable by older onnxruntime releases too
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    onnx.save(model, str(path))
+
+def build_stand_in_model(path: Path,
+                         vocab_size: int,
+                         pad_id: int,
+                         seq_length: int = 128) -> None:
+    """
+    Write an ONNX model mapping l_src_ and l_tgt_ of shape (batch, seq_length) to logits
+    of shape (batch, seq_length, vocab_size) that predict source token t + 1 at step t.
+    """
+    onnx = _import_onnx()
+    TensorProto, helper = onnx.TensorProto, onnx.helper  # noqa: N806
+
+    nodes = [
+        *_shift_nodes(onnx, "l_src_", "shifted", pad_id),
+        *_one_hot_nodes(onnx, "shifted", "logits", vocab_size),
+    ]
+
+    graph = helper.make_graph(
+        nodes,
+        "stand_in_translator",
+        inputs=[helper.make_tensor_value_info("l_src_", TensorProto.INT64, ["batch", seq_length]),
+                helper.make_tensor_value_info("l_tgt_", TensorProto.INT64, ["batch", seq_length])],
+        outputs=[helper.make_tensor_value_info("logits", TensorProto.FLOAT,
+                                               ["batch", seq_length, vocab_size])])
+
+    _save(onnx, graph, path)
+
+def build_stand_in_split_models(encoder_path: Path,
+                                decoder_path: Path,
+                                vocab_size: int,
+                                pad_id: int) -> None:
+    """
+    Write encoder and decoder graphs translating as `build_stand_in_model` does,
+    for incremental decoding. The encoder output is the shifted source, and the decoder
+    step t predicts its token t. The past keys and values only count the steps.
+    """
+    onnx = _import_onnx()
+    TensorProto, helper = onnx.TensorProto, onnx.helper  # noqa: N806
+
+    encoder = helper.make_graph(
+        _shift_nodes(onnx, "src_ids", "memory", pad_id),
+        "stand_in_encoder",
+        inputs=[helper.make_tensor_value_info("src_ids", TensorProto.INT64,
+                                              ["batch", "src_length"])],
+        outputs=[helper.make_tensor_value_info("memory", TensorProto.INT64,
+                                               ["batch", "src_length"])])
+
+    past_shape = ["batch", 1, "past_length", 1]
+    present_shape = ["batch", 1, "present_length", 1]
+    decoder = helper.make_graph(
+        [
+            # step t is the past length, clipped to the source
+            helper.make_node("Shape", ["past_key_values.0.key"], ["step"], start=2, end=3),
+            helper.make_node("Shape", ["memory"], ["src_length"], start=1, end=2),
+            _constant(onnx, "one", TensorProto.INT64, [1]),
+            helper.make_node("Sub", ["src_length", "one"], ["last"]),
+            helper.make_node("Min", ["step", "last"], ["position"]),
+            helper.make_node("Gather", ["memory", "position"], ["token"], axis=1),
+            *_one_hot_nodes(onnx, "token", "logits", vocab_size),
+            # one more (zero) position per step
+            _constant(onnx, "past_pads", TensorProto.INT64, [0, 0, 0, 0, 0, 0, 1, 0]),
+            helper.make_node("Pad", ["past_key_values.0.key", "past_pads"], ["present.0.key"]),
+            helper.make_node("Pad", ["past_key_values.0.value", "past_pads"],
+                             ["present.0.value"]),
+        ],
+        "stand_in_decoder",
+        inputs=[helper.make_tensor_value_info("tgt_ids", TensorProto.INT64, ["batch", 1]),
+                helper.make_tensor_value_info("memory", TensorProto.INT64, ["batch", "src_length"]),
+                helper.make_tensor_value_info("past_key_values.0.key", TensorProto.FLOAT,
+                                              past_shape),
+                helper.make_tensor_value_info("past_key_values.0.value", TensorProto.FLOAT,
+                                              past_shape)],
+        outputs=[helper.make_tensor_value_info("logits", TensorProto.FLOAT,
+                                               ["batch", 1, vocab_size]),
+                 helper.make_tensor_value_info("present.0.key", TensorProto.FLOAT,
+                                               present_shape),
+                 helper.make_tensor_value_info("present.0.value", TensorProto.FLOAT,
+                                               present_shape)])
+
+    _save(onnx, encoder, encoder_path)
+    _save(onnx, decoder, decoder_path)
+
+def use_stand_in_models_if_missing() -> bool:
+    """
+    Point the app configuration at stand-in models for the configured models that are
+    missing, the single graph and the split graphs separately. The split graphs are
+    optional in the app, so stand-ins are also used when they are not configured.
+    Must run before `tools` is imported, which loads the models.
+    Returns whether any stand-in is used.
+    """
+    config_path = Path(os.environ.get("KOALA_CONFIG_PATH", "./app_config.json"))
+    config = json.loads(config_path.read_text())
+
+    src_lang = Tokenizer.from_file(config["de_tokenizer_path"])
+    tgt_lang = Tokenizer.from_file(config["en_tokenizer_path"])
+    vocab_size, pad_id = tgt_lang.get_vocab_size(), src_lang.token_to_id("<PAD>")
+
+    stand_in_used = False
+
+    if not Path(config["translator_model_path"]).exists():
+        model_path = STAND_IN_DIR / STAND_IN_MODEL_NAME
+        if not model_path.exists():
+            build_stand_in_model(model_path, vocab_size=vocab_size, pad_id=pad_id)
+
+        config["translator_model_path"] = str(model_path)
+        stand_in_used = True
+
+    split_paths = [config.get("translator_encoder_path"), config.get("translator_decoder_path")]
+
+    if not all(path is not None and Path(path).exists() for path in split_paths):
+        encoder_path = STAND_IN_DIR / STAND_IN_ENCODER_NAME
+        decoder_path = STAND_IN_DIR / STAND_IN_DECODER_NAME
+        if not (encoder_path.exists() and decoder_path.exists()):
+            build_stand_in_split_models(encoder_path, decoder_path,
+                                        vocab_size=vocab_size, pad_id=pad_id)
+
+        config["translator_encoder_path"] = str(encoder_path)
+        config["translator_decoder_path"] = str(decoder_path)
+        stand_in_used = True
+
+    if stand_in_used:
+        stand_in_config_path = STAND_IN_DIR / "app_config.json"
+        stand_in_config_path.write_text(json.dumps(config, indent=4))
+        os.environ["KOALA_CONFIG_PATH"] = str(stand_in_config_path)
+
+    return stand_in_used
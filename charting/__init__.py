@@ -1,5 +1,9 @@
 from .charting import (
+    fan_chart_bands,
+    get_fan_chart_figure,
     get_hist_figure,
     get_invested_withdrawn_figure,
+    get_portfolio_dist_plot,
     get_stats_figure,
+    get_success_probability_figure,
 )
@@ -1,34 +1,103 @@
+import functools
+import inspect
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 
-
+from tools.cache import LRUCache, fingerprint
+from tools.tracing import span, traced
+
+# series longer than this are drawn with WebGL
+DENSE_POINTS = 1000
+
+# percentiles of the fan chart, in pairs around the median
+FAN_PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+
+def _figure_nbytes(figure: go.Figure) -> int:
+    """
+    Size of the arrays plotted by `figure`, which dominate its memory.
+    """
+    return sum(getattr(values, "nbytes", 0)
+               for trace in figure.data
+               for values in (trace["x"], trace["y"]))
+
+# finished figures by a fingerprint of their inputs
+_figures = LRUCache(max_bytes=256 * 2**20, sizeof=_figure_nbytes, max_entries=256)
+
+def cached_figure(builder: Callable[..., go.Figure]) -> Callable[..., go.Figure]:
+    """
+    Reuse the figure built from the same inputs, so a rerun with unchanged statistics
+    skips building and validating it. Cached figures are shared and must not be modified.
+    """
+    signature = inspect.signature(builder)
+
+    @functools.wraps(builder)
+    def wrapper(*args: Any, **kwargs: Any) -> go.Figure:
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+
+        with span("charting.fingerprint"):
+            key = fingerprint(builder.__qualname__,
+                              *(part for item in bound.arguments.items() for part in item))
+
+        figure = _figures.get(key)
+        if figure is None:
+            figure = builder(*args, **kwargs)
+            _figures.put(key, figure)
+
+        return figure
+
+    wrapper.clear = _figures.clear
+
+    return wrapper
+
+def _line_trace(num_points: int) -> type[go.Scatter] | type[go.Scattergl]:
+    return go.Scattergl if num_points > DENSE_POINTS else go.Scatter
+
+def _band(x: np.ndarray,
+          lower: np.ndarray,
+          upper: np.ndarray,
+          fillcolor: str,
+          name: str) -> go.Scatter:
+    # a closed polygon: along the upper bound and back along the lower one
+    return go.Scatter(x=np.concatenate([x, x[::-1]]),
+                      y=np.concatenate([upper, lower[::-1]]),
+                      fill="toself",
+                      fillcolor=fillcolor,
+                      line_color="rgba(255,255,255,0)",
+                      hoverinfo="skip",
+                      name=name,
+                      showlegend=False)
+
+
+@cached_figure
+@traced("charting.stats_figure")
 def get_stats_figure(portfolio_stats: pd.DataFrame, show_mean: bool = False) -> go.Figure:
     fig = go.Figure()
 
-    x_axis_shade_area = portfolio_stats.index.to_list()
-    x_axis_shade_area += portfolio_stats.index.to_list()[::-1]
-
-    y_axis_shade_area = portfolio_stats["Percentile 75"].to_list()
-    y_axis_shade_area += portfolio_stats["Percentile 25"].to_list()[::-1]
+    years = portfolio_stats.index.to_numpy()
+    line_trace = _line_trace(len(years))
 
-    fig.add_trace(go.Scatter(x=x_axis_shade_area,
-                            y=y_axis_shade_area,
-                            fill="toself",
-                            fillcolor="rgba(0,150,200,0.1)",
-                            line_color="rgba(255,255,255,0)",
-                            showlegend=False))
+    fig.add_trace(_band(years,
+                        lower=portfolio_stats["Percentile 25"].to_numpy(),
+                        upper=portfolio_stats["Percentile 75"].to_numpy(),
+                        fillcolor="rgba(0,150,200,0.1)",
+                        name="Percentiles 25 to 75"))
 
-    fig.add_trace(go.Scatter(x=portfolio_stats.index,
-                            y=portfolio_stats["Median"],
-                            mode="lines+markers",
-                            name="Median"))
+    fig.add_trace(line_trace(x=years,
+                             y=portfolio_stats["Median"].to_numpy(),
+                             mode="lines+markers",
+                             name="Median"))
 
     if show_mean:
-        fig.add_trace(go.Scatter(x=portfolio_stats.index,
-                                y=portfolio_stats["Mean"],
-                                mode="lines+markers",
-                                name="Mean",
-                                line={"color": "red"}))
+        fig.add_trace(line_trace(x=years,
+                                 y=portfolio_stats["Mean"].to_numpy(),
+                                 mode="lines+markers",
+                                 name="Mean",
+                                 line={"color": "red"}))
 
     fig.update_layout(xaxis_title="Years from now",
                     yaxis_title="Portfolio value",
@@ -40,28 +109,35 @@ def get_stats_figure(portfolio_stats: pd.DataFrame, show_mean: bool = False) ->
 
     return fig
 
+@cached_figure
+@traced("charting.hist_figure")
 def get_hist_figure(hist_series: pd.Series) -> go.Figure:
     fig = go.Figure()
 
-    fig.add_trace(go.Scatter(x=hist_series.index,
-                             y=hist_series,
-                             mode="lines+markers",
-                             line={"color": "lightblue"}))
+    fig.add_trace(_line_trace(len(hist_series))(x=hist_series.index.to_numpy(),
+                                                y=hist_series.to_numpy(),
+                                                mode="lines+markers",
+                                                line={"color": "lightblue"}))
 
     fig.update_layout(yaxis_title="Real return",
                       title="Historical real returns")
 
     return fig
 
+@cached_figure
+@traced("charting.invested_withdrawn_figure")
 def get_invested_withdrawn_figure(portfolio_stats: pd.DataFrame) -> go.Figure:
     fig = go.Figure()
 
-    fig.add_trace(go.Scatter(x=portfolio_stats.index,
-                             y=portfolio_stats["Total invested"],
+    years = portfolio_stats.index.to_numpy()
+    line_trace = _line_trace(len(years))
+
+    fig.add_trace(line_trace(x=years,
+                             y=portfolio_stats["Total invested"].to_numpy(),
                              name="Total invested"))
 
-    fig.add_trace(go.Scatter(x=portfolio_stats.index,
-                             y=portfolio_stats["Total withdrawn"],
+    fig.add_trace(line_trace(x=years,
+                             y=portfolio_stats["Total withdrawn"].to_numpy(),
                              name="Total withdrawn"))
 
     fig.update_layout(xaxis_title="Years from now",
@@ -74,7 +150,89 @@ def get_invested_withdrawn_figure(portfolio_stats: pd.DataFrame) -> go.Figure:
 
     return fig
 
-def get_portfolio_dist_plot(portfolio_values: pd.Series) -> go.Figure:
-    fig = go.Figure(data=[go.Histogram(portfolio_values.values)])
+@cached_figure
+@traced("charting.success_probability_figure")
+def get_success_probability_figure(yearly_installments: np.ndarray,
+                                   success_probabilities: np.ndarray,
+                                   target_probability: float) -> go.Figure:
+    fig = go.Figure()
+
+    fig.add_trace(_line_trace(len(yearly_installments))(x=yearly_installments,
+                                                        y=success_probabilities,
+                                                        mode="lines",
+                                                        name="Success probability"))
+
+    fig.add_hline(y=target_probability,
+                  line={"color": "red", "dash": "dash"},
+                  annotation_text="Target")
+
+    fig.update_layout(xaxis_title="Yearly installment",
+                      yaxis_title="Probability of non-negative final value",
+                      yaxis={"range": [0, 1]},
+                      title="Success probability by yearly installment")
+
+    return fig
+
+@cached_figure
+@traced("charting.portfolio_dist_plot")
+def get_portfolio_dist_plot(portfolio_values: pd.Series | np.ndarray,
+                            num_bins: int = 100) -> go.Figure:
+    """
+    Histogram of simulated values, binned here so the browser gets `num_bins` bars
+    instead of every value.
+    """
+    values = np.asarray(portfolio_values, dtype=np.float64)
+    counts, edges = np.histogram(values[np.isfinite(values)], bins=num_bins)
+
+    fig = go.Figure(data=[go.Bar(x=(edges[:-1] + edges[1:]) / 2,
+                                 y=counts,
+                                 width=np.diff(edges),
+                                 marker_line_width=0)])
+
+    fig.update_layout(xaxis_title="Portfolio value",
+                      yaxis_title="Scenarios",
+                      bargap=0)
+
+    return fig
+
+def fan_chart_bands(portfolio_values: np.ndarray,
+                    percentiles: tuple[float, ...] = FAN_PERCENTILES) -> np.ndarray:
+    """
+    Percentiles of simulated values of shape (num_years, num_scenarios) for every year,
+    in one pass over all years. Returns shape (len(percentiles), num_years).
+    """
+    return np.percentile(portfolio_values, percentiles, axis=1)
+
+@cached_figure
+@traced("charting.fan_chart_figure")
+def get_fan_chart_figure(years: np.ndarray,
+                         bands: np.ndarray,
+                         percentiles: tuple[float, ...] = FAN_PERCENTILES) -> go.Figure:
+    """
+    Fan chart of `fan_chart_bands`: nested shaded bands between symmetric percentiles,
+    darker towards the median line.
+    """
+    fig = go.Figure()
+
+    num_bands = len(percentiles) // 2
+    for i in range(num_bands):
+        opacity = 0.1 + 0.2 * i / max(num_bands - 1, 1)
+        fig.add_trace(_band(years,
+                            lower=bands[i],
+                            upper=bands[-1 - i],
+                            fillcolor=f"rgba(0,150,200,{opacity:.2f})",
+                            name=f"Percentiles {percentiles[i]:g} to {percentiles[-1 - i]:g}"))
+
+    if len(percentiles) % 2:
+        fig.add_trace(_line_trace(len(years))(x=years,
+                                              y=bands[num_bands],
+                                              mode="lines",
+                                              name=f"Percentile {percentiles[num_bands]:g}",
+                                              line={"color": "rgb(0,100,150)"}))
+
+    fig.update_layout(xaxis_title="Years from now",
+                      yaxis_title="Portfolio value",
+                      title="Distribution of portfolio values",
+                      showlegend=False)
 
     return fig
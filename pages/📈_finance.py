@@ -1,14 +1,35 @@
+import numpy as np
 import pandas as pd
 import streamlit as st
 
 from charting import (
+    fan_chart_bands,
+    get_fan_chart_figure,
     get_hist_figure,
     get_invested_withdrawn_figure,
+    get_portfolio_dist_plot,
     get_stats_figure,
+    get_success_probability_figure,
+)
+from tools import (
+    HistoricalData,
+    backtest_and_stats,
+    configure_result_cache,
+    configure_scenario_store,
+    configure_tracing,
+    load_config,
+    simulate_and_stats_adaptive,
+    simulate_scenarios,
+    simulate_terminal_decomposition,
+    tracer,
 )
-from tools import HistoricalData, load_config, simulate_and_stats
 
 config = load_config()
+configure_result_cache(max_bytes=config.result_cache_max_bytes,
+                       disk_path=config.result_cache_path)
+configure_scenario_store(directory=config.scenario_store_path,
+                         max_bytes=config.scenario_store_max_bytes)
+configure_tracing(enabled=config.tracing_enabled, trace_memory=config.tracing_memory)
 
 st.markdown("""
 ## Financial Planner
@@ -91,15 +112,31 @@ with st.expander("Advanced settings"):
                                      step=0.01,
                                      help="Volatility of yearly returns")
 
-portfolio_stats = simulate_and_stats(hist_values=hist_data.series,
-                                          start_value=start_value,
-                                          years_before_ret=years_before_retire,
-                                          years_after_ret=years_after_retire,
-                                          yearly_installment=yearly_installment,
-                                          yearly_withdrawls=yearly_withdrawl,
-                                          num_scenarios=100_000,
-                                          mean=mean,
-                                          volatility=volatility)
+    sampler = st.selectbox("Bootstrap",
+                           options=["iid", "block", "stationary"],
+                           format_func={"iid": "Single years",
+                                        "block": "Blocks of 5 years",
+                                        "stationary": "Blocks of 5 years on average"}.get,
+                           help="Blocks of consecutive historical years keep booms and busts "
+                                "that last several years")
+
+# scenarios per batch of the statistics, the scenario distribution redraws the same batches
+ADAPTIVE_BATCH_SIZE = 5_000
+
+portfolio_stats, convergence = simulate_and_stats_adaptive(hist_values=hist_data.series,
+                                                          start_value=start_value,
+                                                          years_before_ret=years_before_retire,
+                                                          years_after_ret=years_after_retire,
+                                                          yearly_installment=yearly_installment,
+                                                          yearly_withdrawls=yearly_withdrawl,
+                                                          mean=mean,
+                                                          volatility=volatility,
+                                                          batch_size=ADAPTIVE_BATCH_SIZE,
+                                                          max_scenarios=100_000,
+                                                          seed=config.simulation_seed,
+                                                          workers=config.simulation_workers,
+                                                          sampler=sampler,
+                                                          backend=config.simulation_backend)
 
 show_mean = st.checkbox("Show mean")
 
@@ -112,10 +149,117 @@ stat_columns_dict = {
     "Percentile 25": "VaR 75%",
     "Percentile 5": "VaR 95%",
 }
-df_last_timestep = portfolio_stats[stat_columns_dict.keys()].rename(columns=stat_columns_dict).iloc[-1]
+df_last_timestep = (portfolio_stats[stat_columns_dict.keys()]
+                    .rename(columns=stat_columns_dict)
+                    .iloc[-1])
 df_last_timestep.name = "Last year"
 st.dataframe(df_last_timestep)
 
+last_year_errors = convergence.standard_errors[stat_columns_dict.keys()].iloc[-1]
+st.caption(f"Based on {convergence.num_scenarios:,} simulated scenarios. "
+           f"Standard error of the last year values is at most {last_year_errors.max():,.0f}.")
+
+if st.checkbox("Goal seek"):
+    success_probability = st.slider(label="Target success probability",
+                                    min_value=0.50,
+                                    max_value=0.99,
+                                    value=0.95,
+                                    step=0.01,
+                                    help="Share of scenarios that should end with a non-negative "
+                                         "portfolio value")
+
+    decomposition = simulate_terminal_decomposition(hist_values=hist_data.series,
+                                                    start_value=start_value,
+                                                    years_before_ret=years_before_retire,
+                                                    years_after_ret=years_after_retire,
+                                                    num_scenarios=100_000,
+                                                    mean=mean,
+                                                    volatility=volatility,
+                                                    chunk_size=config.simulation_chunk_size,
+                                                    seed=config.simulation_seed,
+                                                    workers=config.simulation_workers,
+                                                    sampler=sampler,
+                                                    backend=config.simulation_backend)
+
+    goal_col_1, goal_col_2 = st.columns(2)
+    with goal_col_1:
+        required_installment = decomposition.required_installment(success_probability,
+                                                                  yearly_withdrawl)
+        st.metric("Required yearly installment",
+                  f"{max(required_installment, 0):,.0f}",
+                  help="Given the yearly withdrawl above")
+    with goal_col_2:
+        max_withdrawl = decomposition.max_withdrawl(success_probability, yearly_installment)
+        st.metric("Maximum yearly withdrawl",
+                  f"{max(max_withdrawl, 0):,.0f}",
+                  help="Given the yearly installment above")
+
+    yearly_installments = np.linspace(0, 100_000, 201)
+    st.plotly_chart(get_success_probability_figure(
+        yearly_installments,
+        decomposition.success_probability(yearly_installments, yearly_withdrawl),
+        success_probability))
+
+if st.checkbox("Show scenario distribution"):
+    scenarios = simulate_scenarios(hist_values=hist_data.series,
+                                   start_value=start_value,
+                                   years_before_ret=years_before_retire,
+                                   years_after_ret=years_after_retire,
+                                   yearly_installment=yearly_installment,
+                                   yearly_withdrawls=yearly_withdrawl,
+                                   num_scenarios=convergence.num_scenarios,
+                                   mean=mean,
+                                   volatility=volatility,
+                                   chunk_size=ADAPTIVE_BATCH_SIZE,
+                                   seed=config.simulation_seed,
+                                   workers=config.simulation_workers,
+                                   sampler=sampler,
+                                   backend=config.simulation_backend)
+
+    st.plotly_chart(get_fan_chart_figure(np.arange(scenarios.num_years + 1),
+                                         fan_chart_bands(scenarios.values)))
+
+    year = st.slider(label="Year",
+                     min_value=0,
+                     max_value=scenarios.num_years,
+                     value=scenarios.num_years,
+                     help="Year of the distribution below")
+    st.plotly_chart(get_portfolio_dist_plot(scenarios.year(year)))
+
+    ruined = scenarios.ruined()
+    st.metric("Scenarios going bankrupt", f"{ruined.mean():.1%}",
+              help="Share of scenarios with a negative portfolio value in some year")
+    if ruined.any() and not ruined.all():
+        solvent_median = np.median(scenarios.year(year)[~ruined])
+        st.caption(f"Median value in year {year} is {solvent_median:,.0f} "
+                   f"in scenarios that never go bankrupt.")
+    # unseeded runs cannot be drawn again
+    sample = ("of the statistics above" if config.simulation_seed is not None
+              else "independent of the statistics above")
+    st.caption(f"Based on {scenarios.num_scenarios:,} simulated scenarios, {sample}.")
+
+if st.checkbox("Historical backtest"):
+    num_years = years_before_retire + years_after_retire
+    num_starts = hist_data.num_timesteps - num_years + 1
+
+    if num_starts < 1:
+        st.warning(f"The historical data has {hist_data.num_timesteps} years, "
+                   f"fewer than the {num_years} years to simulate.")
+    else:
+        backtest_stats = backtest_and_stats(hist_values=hist_data.series,
+                                            start_value=start_value,
+                                            years_before_ret=years_before_retire,
+                                            years_after_ret=years_after_retire,
+                                            yearly_installment=yearly_installment,
+                                            yearly_withdrawls=yearly_withdrawl,
+                                            mean=mean,
+                                            volatility=volatility)
+
+        st.plotly_chart(get_stats_figure(backtest_stats, show_mean))
+        last_start = pd.Timestamp(hist_data.dates[num_starts - 1])
+        st.caption(f"Based on the {num_starts} historical sequences of {num_years} years, "
+                   f"starting from {hist_data.first_date.year} to {last_start.year}.")
+
 if st.checkbox("Show hist data (chart)"):
     st.plotly_chart(get_hist_figure(hist_data.series))
 
@@ -164,11 +308,16 @@ This is currently not configurable, and negative values should be thought of as
 i.e., a scenario we want to avoid.
 
 #### Simulation methodology
-We use bootstrapping to simulate 100,000 time series scenarios.
-We denote this 100,000 values at time $t$ as $r(t)$, i.e. $r(t)$ is a random variable.
+We use bootstrapping to simulate up to 100,000 time series scenarios.
+Scenarios are simulated in batches until the reported percentiles
+stop changing (their standard error falls below 1%), so fewer scenarios may be needed.
+We denote these values at time $t$ as $r(t)$, i.e. $r(t)$ is a random variable.
 Each scenario represents a possible sequence of future yearly real returns.
 By default, we use data from the post-World War II period (starting from 1949-12-31).
 We assume that yearly returns are i.i.d. (but not (log-)normal).
+In the advanced settings, returns can be drawn in blocks of consecutive years instead,
+which keeps multi-year booms and busts. The historical backtest replays every sequence of
+consecutive years in the data.
 Data from {hist_data.first_date.year} to 2023 ({hist_data.num_timesteps} datapoints)
 has an average yearly return of {hist_data.mean * 100:.1f}% and
 volatility of {hist_data.volatility * 100:.1f}% (skewness {hist_data.skewness:.1f}).
@@ -179,8 +328,10 @@ Portfolio values are simulated as
 $$
 V(t) =
 \begin{cases}
-V(t-1) \times (1 + r(t)) + \text{installment} &\text{if} \quad t \leq \text{years before retirement} \\
-V(t-1) \times (1 + r(t)) - \text{withdrawl} &\text{if} \quad t > \text{years before retirement}, \\
+V(t-1) \times (1 + r(t)) + \text{installment}
+&\text{if} \quad t \leq \text{years before retirement} \\
+V(t-1) \times (1 + r(t)) - \text{withdrawl}
+&\text{if} \quad t > \text{years before retirement}, \\
 \end{cases}
 $$
 where $t=1,...,T$ with $T=\text{years before retirement} + \text{years before retirement}$.
@@ -201,4 +352,13 @@ Value at Risk (VaR) at 5%. You can interpret it as the portfolio value in a bad
 market environment.
 """)
 
+if config.tracing_enabled:
+    if config.tracing_metrics_path is not None:
+        tracer.write_prometheus(config.tracing_metrics_path)
+
+    # hidden unless the page is opened with ?diagnostics
+    if "diagnostics" in st.query_params:
+        with st.expander("Diagnostics"):
+            st.dataframe(tracer.summary())
+
 st.page_link("home.py", icon="🏠")
@@ -1,8 +1,22 @@
+from contextlib import closing
+from dataclasses import asdict
+
 import streamlit as st
 
-from tools import load_config, translate
+from tools import (
+    configure_tracing,
+    configure_translation_cache,
+    get_scheduler,
+    load_config,
+    tracer,
+    translate_stream,
+)
 
 config = load_config()
+configure_tracing(enabled=config.tracing_enabled, trace_memory=config.tracing_memory)
+configure_translation_cache(max_bytes=config.translation_cache_max_bytes,
+                            disk_path=config.translation_cache_path,
+                            max_entries=config.translation_cache_max_entries)
 
 st.set_page_config(page_title="Translator",
                    page_icon="📚")
@@ -11,8 +25,18 @@ st.header("Translator")
 
 input_text = st.text_area("Input (German)", key="input", value="Hallo Welt, wie geht es?")
 
-translation = translate(st.session_state["input"])
-output_text = st.text_area("Output (English)", value=translation, key="output")
+output = st.empty()
+translation = ""
+
+# an edit of the input reruns the page, which interrupts this loop and closes the stream
+with closing(translate_stream(st.session_state["input"])) as stream:
+    for step, translation in enumerate(stream):
+        output.text_area("Output (English)", value=translation, key=f"partial_{step}",
+                         disabled=True)
+
+# the keyed widget keeps its previous value unless the state is set
+st.session_state["output"] = translation
+output_text = output.text_area("Output (English)", key="output")
 
 st.markdown("""
 Translation above is enabled by training a custom neural machine translation model.
@@ -20,9 +44,22 @@ It is based on an encoder-decoder transformer architecture.
 The model was trained on 200k German-English sentence pairs from an ISWLT [dataset](https://huggingface.co/datasets/IWSLT/iwslt2017).
 The model is tiny by current standards. It contains 10M parameters and its weight is 40MB.
 Therefore, translations might not be accurate. It works best with short sentences.
-Note: maximum sequence length is 128 tokens (roughly 100 words).
-Longer input sequences will be trimmed.
+Longer texts are translated sentence by sentence, and sentences translated before are reused.
+Note: maximum sentence length is 128 tokens (roughly 100 words).
+Longer sentences will be trimmed.
 The source code for training the model can be found [here](https://github.com/nikita-ivanov/neural_translation/blob/main/translator_transformer.ipynb).
 """)
 
+if config.tracing_enabled:
+    if config.tracing_metrics_path is not None:
+        tracer.write_prometheus(config.tracing_metrics_path)
+
+    # hidden unless the page is opened with ?diagnostics
+    if "diagnostics" in st.query_params:
+        with st.expander("Diagnostics"):
+            st.dataframe(tracer.summary())
+
+            if (scheduler := get_scheduler()) is not None:
+                st.json(asdict(scheduler.stats()))
+
 st.page_link("home.py", icon="🏠")
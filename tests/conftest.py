@@ -0,0 +1,41 @@
+import pytest
+from tokenizers import Tokenizer
+
+from tools import load_config
+from tools.translation import Translator
+
+
+@pytest.fixture(scope="session")
+def stand_in_model_dir(tmp_path_factory):
+    """
+    Directory with the stand-in single graph (model.onnx) and split graphs
+    (encoder.onnx, decoder.onnx), in place of the translator models.
+    """
+    pytest.importorskip("onnx")
+    from benchmarks.stand_in_model import build_stand_in_model, build_stand_in_split_models
+
+    model_dir = tmp_path_factory.mktemp("models")
+    config = load_config()
+    vocab_size = Tokenizer.from_file(config.en_tokenizer_path).get_vocab_size()
+    pad_id = Tokenizer.from_file(config.de_tokenizer_path).token_to_id("<PAD>")
+
+    build_stand_in_model(model_dir / "model.onnx", vocab_size=vocab_size, pad_id=pad_id)
+    build_stand_in_split_models(model_dir / "encoder.onnx", model_dir / "decoder.onnx",
+                                vocab_size=vocab_size, pad_id=pad_id)
+
+    return model_dir
+
+@pytest.fixture(scope="session")
+def stand_in_translators(stand_in_model_dir):
+    model_dir = stand_in_model_dir
+    config = load_config()
+
+    tokenizer_paths = {"src_tokenizer_path": config.de_tokenizer_path,
+                       "tgt_tokenizer_path": config.en_tokenizer_path}
+    single = Translator(model_path=str(model_dir / "model.onnx"), **tokenizer_paths)
+    split = Translator(model_path=str(model_dir / "missing.onnx"),
+                       encoder_path=str(model_dir / "encoder.onnx"),
+                       decoder_path=str(model_dir / "decoder.onnx"),
+                       **tokenizer_paths)
+
+    return single, split
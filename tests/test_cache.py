@@ -0,0 +1,128 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from tools.cache import (
+    LRUCache,
+    ResultCache,
+    cached,
+    code_version,
+    fingerprint,
+    remember_fingerprint,
+)
+
+
+def test_fingerprint():
+    array = np.arange(10, dtype=np.float64)
+    series = pd.Series(array, index=pd.date_range("2000-01-01", periods=10, freq="YE"))
+
+    assert fingerprint(array, 1) == fingerprint(array.copy(), 1)
+    assert fingerprint(array, 1) != fingerprint(array, 2)
+    assert fingerprint(array) != fingerprint(array.astype(np.float32))
+    assert fingerprint(series) != fingerprint(series.shift(1, freq="YE"))
+
+def test_remember_fingerprint():
+    array = np.arange(10, dtype=np.float64)
+    series, same_returns = pd.Series(array), pd.Series(array + 1)
+    remember_fingerprint(series, "returns")
+    remember_fingerprint(same_returns, "returns")
+
+    # only the object itself is fingerprinted by the key, copies are hashed
+    assert fingerprint(series) == fingerprint(same_returns)
+    assert fingerprint(series.copy()) == fingerprint(pd.Series(array))
+    assert fingerprint(series.copy()) != fingerprint(series)
+
+def test_lru_cache_byte_budget():
+    cache = LRUCache(max_bytes=10)
+
+    cache.put("a", b"12345")
+    cache.put("b", b"12345")
+    assert cache.get("a") == b"12345"  # "b" is now least recently used
+
+    cache.put("c", b"12345")
+    stats = cache.stats
+
+    assert cache.get("b") is None
+    assert stats.evictions == 1
+    assert stats.num_entries == 2
+    assert stats.num_bytes == 10
+
+def test_lru_cache_entry_budget():
+    cache = LRUCache(max_bytes=100, max_entries=2)
+
+    for key in "abc":
+        cache.put(key, b"1")
+
+    assert cache.get("a") is None
+    assert cache.stats.num_entries == 2
+
+def test_result_cache_disk_tier(tmp_path):
+    disk_path = str(tmp_path / "results.sqlite")
+    first = ResultCache(max_bytes=2**20, disk_path=disk_path)
+    second = ResultCache(max_bytes=2**20, disk_path=disk_path)
+
+    first.put("key", {"value": np.arange(3)})
+    result = second.get("key")
+
+    assert np.array_equal(result["value"], np.arange(3))
+    assert second.stats.disk_hits == 1
+    assert second.stats.hits == 1
+
+def test_result_cache_disk_budget(tmp_path):
+    disk_path = str(tmp_path / "results.sqlite")
+    cache = ResultCache(max_bytes=0, disk_path=disk_path, disk_max_bytes=250)
+
+    for key in ["a", "b", "a", "c"]:
+        cache.put(key, b"x" * 100)
+
+    # the oldest entry is pruned and the running total matches the stored values
+    connection = sqlite3.connect(disk_path)
+    (num_bytes,), = connection.execute("SELECT num_bytes FROM usage").fetchall()
+    (total_bytes,), = connection.execute("SELECT SUM(LENGTH(value)) FROM results").fetchall()
+    keys = {key for key, in connection.execute("SELECT key FROM results")}
+    connection.close()
+
+    assert num_bytes == total_bytes
+    assert keys == {"a", "c"}
+
+def test_cached():
+    cache = ResultCache(max_bytes=2**20)
+    calls = []
+
+    @cached(cache)
+    def double(values, factor=2):
+        calls.append(values)
+        return values * factor
+
+    values = np.arange(5)
+
+    assert np.array_equal(double(values), double(values, factor=2))
+    assert len(calls) == 1
+
+    double(values, factor=3)
+    assert len(calls) == 2
+    assert cache.stats.hits == 1
+
+def test_cached_key():
+    cache = ResultCache(max_bytes=2**20)
+    calls = []
+
+    @cached(cache, ignore=("workers",))
+    def total(values, workers=1):
+        calls.append(workers)
+        return values.sum()
+
+    values = np.arange(5)
+
+    # the number of workers does not change the result, so it is not part of the key
+    assert total(values, workers=1) == total(values, workers=4)
+    assert calls == [1]
+
+def test_code_version(tmp_path):
+    # results cached by an earlier version of the code are not served
+    for version in ["old", "new"]:
+        (tmp_path / version).mkdir()
+        (tmp_path / version / "finance.py").write_text(f"VERSION = {version!r}")
+
+    assert code_version(tmp_path / "old") != code_version(tmp_path / "new")
@@ -0,0 +1,41 @@
+import numpy as np
+import plotly.graph_objects as go
+
+from charting import charting
+
+
+def test_portfolio_dist_plot_is_pre_binned():
+    values = np.random.default_rng(0).lognormal(13, 1, 100_000)
+    figure = charting.get_portfolio_dist_plot(values, num_bins=50)
+    bars = figure.data[0]
+
+    assert isinstance(bars, go.Bar)
+    assert len(bars.x) == 50
+    assert bars.y.sum() == len(values)
+
+def test_fan_chart_bands():
+    values = np.random.default_rng(0).normal(size=(21, 1000)).cumsum(axis=0)
+    bands = charting.fan_chart_bands(values)
+
+    assert bands.shape == (len(charting.FAN_PERCENTILES), 21)
+    assert np.all(np.diff(bands, axis=0) >= 0)
+
+    figure = charting.get_fan_chart_figure(np.arange(21), bands)
+    assert len(figure.data) == len(charting.FAN_PERCENTILES) // 2 + 1
+
+def test_cached_figure():
+    years = np.arange(2 * charting.DENSE_POINTS)
+    probabilities = np.linspace(0, 1, len(years))
+
+    figure = charting.get_success_probability_figure(years, probabilities, 0.9)
+
+    assert isinstance(figure.data[0], go.Scattergl)
+    assert charting.get_success_probability_figure(years.copy(), probabilities, 0.9) is figure
+    assert charting.get_success_probability_figure(years, probabilities, 0.8) is not figure
+
+def test_figure_cache_bounds():
+    # bounded by the number of figures and by the bytes of their plotted arrays
+    assert charting._figures.max_entries == 256
+    figure = charting.get_success_probability_figure(np.arange(10), np.linspace(0, 1, 10), 0.5)
+    assert charting._figure_nbytes(figure) == sum(trace.x.nbytes + trace.y.nbytes
+                                                  for trace in figure.data)
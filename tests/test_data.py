@@ -0,0 +1,110 @@
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tools.data import HistoricalData
+
+
+@pytest.fixture
+def returns_path(tmp_path):
+    rng = np.random.default_rng(0)
+    returns = pd.Series(rng.normal(0.07, 0.18, size=60),
+                        index=pd.date_range("1960-12-31", periods=60, freq="YE").date,
+                        name="0")
+    returns.iloc[3] = np.nan
+    returns.rename_axis("Date").to_csv(tmp_path / "returns.csv")
+
+    return str(tmp_path / "returns.csv")
+
+@pytest.mark.parametrize("start_date", [None, "1970-01-01", "1985", "2019-12-31"])
+def test_historical_data_window(returns_path, tmp_path, start_date):
+    expected = pd.read_csv(returns_path, index_col="Date").iloc[:, 0].dropna()
+    expected.index = pd.to_datetime(expected.index).as_unit("ns").rename(None)
+    expected = expected.loc[start_date:]
+
+    hist_data = HistoricalData(returns_path, start_date, cache_dir=str(tmp_path / "cache"))
+
+    pd.testing.assert_series_equal(hist_data.series, expected, check_freq=False)
+    assert hist_data.num_timesteps == len(expected)
+    assert hist_data.first_date == expected.index[0]
+    assert np.isclose(hist_data.mean, expected.mean(), rtol=0, atol=1e-12, equal_nan=True)
+    assert np.isclose(hist_data.volatility, expected.std(), rtol=0, atol=1e-12, equal_nan=True)
+    assert np.isclose(hist_data.skewness, expected.skew(), rtol=0, atol=1e-10, equal_nan=True)
+
+def test_historical_data_binary_cache(returns_path, tmp_path):
+    cache_dir = tmp_path / "cache"
+    hist_data = HistoricalData(returns_path, cache_dir=str(cache_dir))
+    cache_files = list(cache_dir.glob("returns-*.npy"))
+
+    assert len(cache_files) == 1
+
+    # a new version of the source file replaces the stale binary copy
+    frame = pd.read_csv(returns_path)
+    frame.iloc[-1, 1] = 0.5
+    frame.to_csv(returns_path, index=False)
+    os.utime(returns_path, ns=(0, 0))
+
+    updated = HistoricalData(returns_path, cache_dir=str(cache_dir))
+
+    assert updated.values[-1] == 0.5
+    assert updated.fingerprint != hist_data.fingerprint
+    assert list(cache_dir.glob("returns-*.npy")) != cache_files
+    assert len(list(cache_dir.glob("returns-*.npy"))) == 1
+
+def test_historical_data_binary_cache_same_name(returns_path, tmp_path):
+    cache_dir = tmp_path / "cache"
+    other_path = tmp_path / "other" / Path(returns_path).name
+    other_path.parent.mkdir()
+    shutil.copy(returns_path, other_path)
+
+    # files of the same name in other directories keep their own binary copies
+    HistoricalData(returns_path, cache_dir=str(cache_dir))
+    HistoricalData(str(other_path), cache_dir=str(cache_dir))
+
+    assert len(list(cache_dir.glob("returns-*.npy"))) == 2
+
+@pytest.fixture
+def multi_asset_path(tmp_path):
+    rng = np.random.default_rng(1)
+    returns = pd.DataFrame(rng.normal([0.07, 0.02], [0.18, 0.06], size=(40, 2)),
+                           index=pd.date_range("1980-12-31", periods=40, freq="YE").date,
+                           columns=["stocks", "bonds"])
+    returns.iloc[5, 1] = np.nan
+    returns.rename_axis("Date").to_csv(tmp_path / "assets.csv")
+
+    return str(tmp_path / "assets.csv")
+
+def test_historical_data_multiple_assets(multi_asset_path, tmp_path):
+    expected = pd.read_csv(multi_asset_path, index_col="Date").dropna().loc["1990-12-31":]
+
+    hist_data = HistoricalData(multi_asset_path, "1990", cache_dir=str(tmp_path / "cache"))
+
+    assert hist_data.num_assets == 2
+    assert hist_data.assets == ["stocks", "bonds"]
+    assert hist_data.num_timesteps == len(expected)
+    assert np.array_equal(hist_data.returns, expected.to_numpy())
+    assert np.allclose(hist_data.mean, expected.mean(), rtol=0, atol=1e-12)
+    assert np.allclose(hist_data.volatility, expected.std(), rtol=0, atol=1e-12)
+    assert np.allclose(hist_data.skewness, expected.skew(), rtol=0, atol=1e-10)
+
+    with pytest.raises(ValueError, match="assets"):
+        hist_data.series  # noqa: B018
+
+def test_allocation_returns(multi_asset_path, tmp_path):
+    hist_data = HistoricalData(multi_asset_path, cache_dir=str(tmp_path / "cache"))
+    weights = np.array([[0.8, 0.2], [0.5, 0.5], [0.2, 0.8]])
+
+    constant = hist_data.allocation_returns(weights[0])
+    glide = hist_data.allocation_returns(weights)
+
+    assert isinstance(constant, pd.Series)
+    assert np.allclose(constant, hist_data.returns @ weights[0])
+    assert glide.shape == (hist_data.num_timesteps, 3)
+    assert np.allclose(glide[1], constant)
+
+    with pytest.raises(ValueError, match="weights"):
+        hist_data.allocation_returns([1.0])
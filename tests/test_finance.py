@@ -1,10 +1,32 @@
+import importlib.util
+import sys
 from dataclasses import dataclass
 
+import numpy as np
 import pandas as pd
 import pytest
 from pandas.api.types import is_numeric_dtype
 
-from tools.finance import simulate_and_stats, simulate_payoffs, simulate_portfolio_values
+import tools
+from tools import finance
+from tools.finance import (
+    BLOCK_LENGTH,
+    SAMPLERS,
+    QuantileSketch,
+    backtest_and_stats,
+    bootstrap_returns,
+    effective_sample_size,
+    glide_path,
+    rolling_returns,
+    simulate_and_stats,
+    simulate_and_stats_adaptive,
+    simulate_payoffs,
+    simulate_portfolio_values,
+    simulate_profiles_and_stats,
+    simulate_streaming_stats,
+    simulate_terminal_decomposition,
+)
+from tools.tracing import tracer
 
 sample_series = pd.Series({
         pd.to_datetime("2013-12-31"): 0.25,
@@ -25,23 +47,98 @@ class TestParameters:
 
 parameters = TestParameters()
 
+# statistical tests run on every backend installed
+backends = pytest.mark.parametrize("backend", [
+    "numpy",
+    pytest.param("numba", marks=pytest.mark.skipif(importlib.util.find_spec("numba") is None,
+                                                   reason="numba is not installed")),
+])
+
+@backends
+def test_max_workers(backend: str) -> None:
+    # numba kernels use all cores and serialize launches, so their chunks run in turn
+    expected = 1 if backend == "numba" else 4
+    assert finance._max_workers(4, backend, "iid") == expected
+    assert finance._max_workers(4, backend, "block") == 4
+    assert finance._max_workers(0, backend, "iid") == 1
+
 @pytest.mark.parametrize("mean", [sample_series.mean(), 0.05])
 @pytest.mark.parametrize("volatility", [sample_series.std(), 0.24])
-def test_sim_payoff(mean: float, volatility: float) -> None:
+@backends
+def test_sim_payoff(mean: float, volatility: float, backend: str) -> None:
     simulated_payoff = simulate_payoffs(hist_returns=sample_series,
                                                num_scenarios=parameters.num_scenarios,
                                                start_value=parameters.start_value,
                                                mean=mean,
-                                               volatility=volatility)
+                                               volatility=volatility,
+                                               backend=backend)
 
     assert simulated_payoff.mean() == pytest.approx(mean * parameters.start_value)
     assert simulated_payoff.std() == pytest.approx(volatility * parameters.start_value)
     assert len(simulated_payoff) == parameters.num_scenarios
 
 
+@pytest.mark.parametrize("sampler", SAMPLERS)
+def test_sim_payoff_samplers(sampler: str) -> None:
+    if sampler == "sobol":
+        pytest.importorskip("scipy")
+
+    simulated_payoff = simulate_payoffs(hist_returns=sample_series,
+                                        num_scenarios=parameters.num_scenarios,
+                                        start_value=parameters.start_value,
+                                        mean=0.05,
+                                        volatility=0.24,
+                                        seed=7,
+                                        sampler=sampler)
+
+    assert simulated_payoff.mean() == pytest.approx(0.05 * parameters.start_value)
+    assert simulated_payoff.std() == pytest.approx(0.24 * parameters.start_value)
+    assert len(simulated_payoff) == parameters.num_scenarios
+
+@pytest.mark.parametrize("sampler", ["block", "stationary"])
+def test_block_samplers(sampler: str) -> None:
+    num_hist, num_years = 7, 23
+    indices = SAMPLERS[sampler](np.random.default_rng(7), num_hist, num_years, 1_000)
+    continued = np.diff(indices, axis=0) % num_hist == 1
+
+    assert indices.shape == (num_years, 1_000)
+    assert indices.min() >= 0
+    assert indices.max() < num_hist
+
+    if sampler == "block":
+        # consecutive historical years within a block, new blocks start anywhere
+        is_block_start = np.arange(1, num_years) % BLOCK_LENGTH == 0
+        assert continued[~is_block_start].all()
+    else:
+        # a new block every BLOCK_LENGTH years on average
+        assert 1 - continued.mean() == pytest.approx(1 / BLOCK_LENGTH * (1 - 1 / num_hist),
+                                                     abs=0.01)
+
+def test_numba_backend_fallback(monkeypatch: pytest.MonkeyPatch) -> None:
+    kwargs = {"hist_returns": sample_series,
+              "num_scenarios": parameters.num_scenarios,
+              "start_value": parameters.start_value,
+              "mean": 0.05,
+              "volatility": 0.24,
+              "seed": 7}
+
+    # numba can't be imported
+    monkeypatch.setitem(sys.modules, "numba", None)
+    monkeypatch.delitem(sys.modules, "tools.finance_numba", raising=False)
+    monkeypatch.delattr(tools, "finance_numba", raising=False)
+
+    with pytest.warns(UserWarning, match="numba is not installed"):
+        simulated_payoff = simulate_payoffs(**kwargs, backend="numba")
+
+    np.testing.assert_array_equal(simulated_payoff, simulate_payoffs(**kwargs))
+
+    with pytest.raises(ValueError, match="Unknown backend"):
+        simulate_payoffs(**kwargs, backend="cuda")
+
 @pytest.mark.parametrize("mean", [sample_series.mean(), 0.05])
 @pytest.mark.parametrize("volatility", [sample_series.std(), 0.24])
-def test_simulate(mean: float, volatility: float) -> None:
+@backends
+def test_simulate(mean: float, volatility: float, backend: str) -> None:
     scenarios, _ = simulate_portfolio_values(hist_values=sample_series,
                             start_value=parameters.start_value,
                             years_before_ret=parameters.years_before_retirement,
@@ -50,7 +147,8 @@ def test_simulate(mean: float, volatility: float) -> None:
                             yearly_withdrawls=parameters.yearly_withdrawl,
                             num_scenarios=parameters.num_scenarios,
                             mean=mean,
-                            volatility=volatility)
+                            volatility=volatility,
+                            backend=backend)
 
     # before retirement portfolio value V(t) is defined as
     # V(t) = V(t-1) * (1 + r(t)) + yearly_installment
@@ -76,7 +174,8 @@ def test_simulate(mean: float, volatility: float) -> None:
 
 @pytest.mark.parametrize("mean", [sample_series.mean(), 0.05])
 @pytest.mark.parametrize("volatility", [sample_series.std(), 0.24])
-def test_simulate_and_stats(mean: float, volatility: float) -> None:
+@backends
+def test_simulate_and_stats(mean: float, volatility: float, backend: str) -> None:
     stats = simulate_and_stats(hist_values=sample_series,
                                start_value=parameters.start_value,
                                years_before_ret=parameters.years_before_retirement,
@@ -85,7 +184,504 @@ def test_simulate_and_stats(mean: float, volatility: float) -> None:
                                yearly_withdrawls=parameters.yearly_withdrawl,
                                num_scenarios=parameters.num_scenarios,
                                mean=mean,
-                               volatility=volatility)
+                               volatility=volatility,
+                               backend=backend)
 
     assert all(is_numeric_dtype(dtype) for dtype in stats.dtypes)
     assert stats.isna().sum().sum() == 0
+
+@backends
+def test_simulate_and_stats_risk_columns(backend: str) -> None:
+    kwargs = {"hist_values": sample_series,
+              "backend": backend,
+              "start_value": parameters.start_value,
+              "years_before_ret": parameters.years_before_retirement,
+              "years_after_ret": parameters.years_after_retiirement,
+              "yearly_installment": parameters.yearly_installment,
+              "yearly_withdrawls": parameters.yearly_withdrawl,
+              "num_scenarios": 1_000,
+              "mean": 0.02,
+              "volatility": 0.24,
+              "seed": 11}
+
+    scenarios, _ = simulate_portfolio_values(**kwargs)
+    stats = simulate_and_stats(**kwargs)
+    streaming_stats = simulate_and_stats(**kwargs, chunk_size=300)
+
+    # brute force reference from the full paths
+    values = scenarios.to_numpy()
+    ruined = values < 0
+    first_ruin_years = np.argmax(ruined, axis=0)[ruined.any(axis=0)]
+    peaks = np.maximum.accumulate(values, axis=0)
+    drawdowns = np.clip(1 - np.divide(values, peaks, out=np.ones_like(values), where=peaks > 0),
+                        0, 1)
+    max_drawdowns = np.maximum.accumulate(drawdowns, axis=0)
+
+    assert 0 < ruined[-1].mean() < 1
+    np.testing.assert_allclose(stats["Probability of ruin"], ruined.mean(axis=1))
+    np.testing.assert_allclose(stats["Probability of first ruin"],
+                               np.bincount(first_ruin_years, minlength=len(values)) / 1_000)
+    np.testing.assert_allclose(stats["Max drawdown median"],
+                               np.quantile(max_drawdowns, 0.5, axis=1))
+    np.testing.assert_allclose(stats["Max drawdown percentile 95"],
+                               np.quantile(max_drawdowns, 0.95, axis=1))
+    np.testing.assert_allclose(stats["Median"], scenarios.median(axis=1))
+
+    assert list(streaming_stats.columns) == list(stats.columns)
+    # chunks draw from other streams, so only the distributions agree
+    np.testing.assert_allclose(streaming_stats["Probability of first ruin"].cumsum(),
+                               stats["Probability of first ruin"].cumsum(),
+                               atol=0.05)
+
+def test_simulate_and_stats_streaming() -> None:
+    kwargs = {"hist_values": sample_series,
+              "start_value": parameters.start_value,
+              "years_before_ret": parameters.years_before_retirement,
+              "years_after_ret": parameters.years_after_retiirement,
+              "yearly_installment": parameters.yearly_installment,
+              "yearly_withdrawls": parameters.yearly_withdrawl,
+              "num_scenarios": parameters.num_scenarios,
+              "mean": 0.05,
+              "volatility": 0.24}
+
+    stats = simulate_and_stats(**kwargs)
+    streaming_stats = simulate_and_stats(**kwargs, chunk_size=parameters.num_scenarios // 4)
+
+    assert list(streaming_stats.columns) == list(stats.columns)
+    assert streaming_stats.index.equals(stats.index)
+    assert streaming_stats.isna().sum().sum() == 0
+
+def test_streaming_stats_remainder_chunk() -> None:
+    kwargs = {"hist_values": sample_series,
+              "start_value": parameters.start_value,
+              "years_before_ret": parameters.years_before_retirement,
+              "years_after_ret": parameters.years_after_retiirement,
+              "yearly_installment": parameters.yearly_installment,
+              "yearly_withdrawls": parameters.yearly_withdrawl,
+              "num_scenarios": 101,
+              "mean": 0.05,
+              "volatility": 0.24,
+              "seed": 7}
+
+    # 101 scenarios in chunks of at most 50 are split 34, 34, 33, not 50, 50, 1
+    assert finance._chunk_sizes(101, 50) == [34, 34, 33]
+
+    streaming_stats = simulate_streaming_stats(**kwargs, chunk_size=50)
+    decomposition = simulate_terminal_decomposition.__wrapped__(
+        **{name: value for name, value in kwargs.items()
+           if name not in {"yearly_installment", "yearly_withdrawls"}},
+        chunk_size=50)
+
+    assert streaming_stats.num_scenarios == 101
+    assert np.isfinite(streaming_stats.quantile(0.05)).all()
+    assert np.isfinite(streaming_stats.mean).all()
+    assert np.isfinite(decomposition.base).all()
+
+@backends
+def test_simulate_seed_reproducible(backend: str) -> None:
+    kwargs = {"hist_values": sample_series,
+              "backend": backend,
+              "start_value": parameters.start_value,
+              "years_before_ret": parameters.years_before_retirement,
+              "years_after_ret": parameters.years_after_retiirement,
+              "yearly_installment": parameters.yearly_installment,
+              "yearly_withdrawls": parameters.yearly_withdrawl,
+              "num_scenarios": parameters.num_scenarios,
+              "mean": 0.05,
+              "volatility": 0.24}
+
+    scenarios, metadata = simulate_portfolio_values(**kwargs, seed=7)
+    scenarios_same_seed, metadata_same_seed = simulate_portfolio_values(**kwargs, seed=7)
+    scenarios_other_seed, _ = simulate_portfolio_values(**kwargs, seed=8)
+
+    pd.testing.assert_frame_equal(scenarios, scenarios_same_seed)
+    assert metadata == metadata_same_seed
+    assert not scenarios.equals(scenarios_other_seed)
+
+    streaming_stats = simulate_streaming_stats(**kwargs, chunk_size=30, seed=7)
+    streaming_stats_same_seed = simulate_streaming_stats(**kwargs, chunk_size=30, seed=7)
+
+    np.testing.assert_array_equal(streaming_stats.quantile(0.05),
+                                  streaming_stats_same_seed.quantile(0.05))
+
+@pytest.mark.parametrize("workers", [2, 3])
+@backends
+def test_streaming_stats_independent_of_workers(workers: int, backend: str) -> None:
+    kwargs = {"hist_values": sample_series,
+              "backend": backend,
+              "start_value": parameters.start_value,
+              "years_before_ret": parameters.years_before_retirement,
+              "years_after_ret": parameters.years_after_retiirement,
+              "yearly_installment": parameters.yearly_installment,
+              "yearly_withdrawls": parameters.yearly_withdrawl,
+              "num_scenarios": parameters.num_scenarios,
+              "mean": 0.05,
+              "volatility": 0.24,
+              "chunk_size": 15,
+              "seed": 7}
+
+    serial_stats = simulate_streaming_stats(**kwargs)
+    parallel_stats = simulate_streaming_stats(**kwargs, workers=workers)
+
+    np.testing.assert_array_equal(parallel_stats.mean, serial_stats.mean)
+    np.testing.assert_array_equal(parallel_stats.ruin_counts, serial_stats.ruin_counts)
+    for q in [0.05, 0.5, 0.95]:
+        np.testing.assert_array_equal(parallel_stats.quantile(q), serial_stats.quantile(q))
+
+def test_simulate_and_stats_adaptive() -> None:
+    kwargs = {"hist_values": sample_series,
+              "start_value": parameters.start_value,
+              "years_before_ret": parameters.years_before_retirement,
+              "years_after_ret": parameters.years_after_retiirement,
+              "yearly_installment": parameters.yearly_installment,
+              "yearly_withdrawls": parameters.yearly_withdrawl,
+              "mean": 0.05,
+              "volatility": 0.24,
+              "batch_size": 500,
+              "max_scenarios": 20_000,
+              "seed": 7}
+
+    stats, report = simulate_and_stats_adaptive(**kwargs, tolerance=0.05, ruin_tolerance=0.05)
+    exhausted_stats, exhausted_report = simulate_and_stats_adaptive(**kwargs, tolerance=0.0)
+
+    assert report.converged
+    assert report.num_scenarios < kwargs["max_scenarios"]
+    assert not exhausted_report.converged
+    assert exhausted_report.num_scenarios == kwargs["max_scenarios"]
+
+    assert list(stats.columns) == list(exhausted_stats.columns)
+    assert report.standard_errors.shape[0] == stats.shape[0]
+    assert report.standard_errors.isna().sum().sum() == 0
+
+def test_simulate_and_stats_adaptive_stops_early(monkeypatch: pytest.MonkeyPatch) -> None:
+    simulate_chunk_stats = finance._simulate_chunk_stats
+    batch_sizes = []
+
+    def counted(chunk_size: int, *args: object, **kwargs: object) -> object:
+        batch_sizes.append(chunk_size)
+        return simulate_chunk_stats(chunk_size, *args, **kwargs)
+
+    monkeypatch.setattr(finance, "_simulate_chunk_stats", counted)
+
+    _, report = simulate_and_stats_adaptive.__wrapped__(
+        hist_values=sample_series,
+        start_value=parameters.start_value,
+        years_before_ret=parameters.years_before_retirement,
+        years_after_ret=parameters.years_after_retiirement,
+        yearly_installment=parameters.yearly_installment,
+        yearly_withdrawls=parameters.yearly_withdrawl,
+        mean=0.05,
+        volatility=0.24,
+        tolerance=0.05,
+        ruin_tolerance=0.05,
+        batch_size=500,
+        max_scenarios=100_000,
+        seed=7,
+        workers=3)
+
+    # besides the merged batches, at most the other workers' batches were simulated
+    assert report.converged
+    assert report.num_scenarios <= sum(batch_sizes) <= report.num_scenarios + 2 * 500
+
+@pytest.mark.parametrize("max_scenarios", [300, 1_201])
+def test_simulate_and_stats_adaptive_budget(max_scenarios: int) -> None:
+    # the budget is smaller than a batch, or leaves a remainder of one scenario
+    _, report = simulate_and_stats_adaptive(hist_values=sample_series,
+                                            start_value=parameters.start_value,
+                                            years_before_ret=parameters.years_before_retirement,
+                                            years_after_ret=parameters.years_after_retiirement,
+                                            yearly_installment=parameters.yearly_installment,
+                                            yearly_withdrawls=parameters.yearly_withdrawl,
+                                            mean=0.05,
+                                            volatility=0.24,
+                                            tolerance=0.0,
+                                            batch_size=400,
+                                            max_scenarios=max_scenarios,
+                                            seed=7)
+
+    assert report.num_scenarios == max_scenarios
+    assert report.standard_errors.isna().sum().sum() == 0
+
+def test_effective_sample_size() -> None:
+    report = effective_sample_size(hist_values=sample_series,
+                                   start_value=parameters.start_value,
+                                   years_before_ret=parameters.years_before_retirement,
+                                   years_after_ret=parameters.years_after_retiirement,
+                                   yearly_installment=parameters.yearly_installment,
+                                   yearly_withdrawls=parameters.yearly_withdrawl,
+                                   num_scenarios=parameters.num_scenarios,
+                                   mean=0.05,
+                                   volatility=0.24,
+                                   sampler="stratified",
+                                   num_replications=8,
+                                   seed=7)
+
+    assert list(report.index) == ["Mean", "Median", "Percentile 5", "Percentile 25",
+                                  "Percentile 75", "Percentile 95"]
+    assert (report["Effective sample size"] > 0).all()
+
+@backends
+def test_terminal_decomposition(backend: str) -> None:
+    kwargs = {"hist_values": sample_series,
+              "backend": backend,
+              "start_value": parameters.start_value,
+              "years_before_ret": parameters.years_before_retirement,
+              "years_after_ret": parameters.years_after_retiirement,
+              "num_scenarios": parameters.num_scenarios,
+              "mean": 0.05,
+              "volatility": 0.24,
+              "seed": 7}
+
+    decomposition = simulate_terminal_decomposition(**kwargs)
+    scenarios, _ = simulate_portfolio_values(**kwargs,
+                                             yearly_installment=parameters.yearly_installment,
+                                             yearly_withdrawls=parameters.yearly_withdrawl)
+
+    # same seed, same return paths
+    terminal_values = decomposition.terminal_values(parameters.yearly_installment,
+                                                    parameters.yearly_withdrawl)
+    np.testing.assert_allclose(terminal_values, scenarios.iloc[-1], rtol=1e-9, atol=1e-6)
+
+    installment = decomposition.required_installment(0.9, parameters.yearly_withdrawl)
+    assert decomposition.success_probability(installment, parameters.yearly_withdrawl) >= 0.9
+    assert decomposition.success_probability(installment - 1, parameters.yearly_withdrawl) < 0.9
+
+    withdrawl = decomposition.max_withdrawl(0.9, parameters.yearly_installment)
+    # the scenario at the boundary ends at zero up to rounding
+    success_rates = [
+        (decomposition.terminal_values(parameters.yearly_installment, w) >= -1e-6).mean()
+        for w in [withdrawl, withdrawl + 1]
+    ]
+    assert success_rates[0] >= 0.9
+    assert success_rates[1] < 0.9
+
+def test_simulate_profiles_and_stats() -> None:
+    profiles = pd.DataFrame({
+        "start_value": [42_000, 0, 10_000],
+        "years_before_ret": [30, 10, 5],
+        "years_after_ret": [20, 5, 0],
+        "yearly_installment": [20_000, 5_000, 1_000],
+        "yearly_withdrawls": [50_000, 10_000, 0],
+        "mean": [0.05, 0.05, sample_series.mean()],
+        "volatility": [0.24, 0.24, sample_series.std()],
+    }, index=["a", "b", "c"])
+
+    results = simulate_profiles_and_stats(hist_values=sample_series,
+                                          profiles=profiles,
+                                          num_scenarios=parameters.num_scenarios,
+                                          seed=7)
+
+    reference_stats = simulate_and_stats(hist_values=sample_series,
+                                         start_value=parameters.start_value,
+                                         years_before_ret=parameters.years_before_retirement,
+                                         years_after_ret=parameters.years_after_retiirement,
+                                         yearly_installment=parameters.yearly_installment,
+                                         yearly_withdrawls=parameters.yearly_withdrawl,
+                                         num_scenarios=parameters.num_scenarios,
+                                         mean=0.05,
+                                         volatility=0.24)
+
+    assert list(results) == ["a", "b", "c"]
+
+    for index, profile in profiles.iterrows():
+        stats = results[index]
+        horizon = profile["years_before_ret"] + profile["years_after_ret"]
+
+        assert list(stats.columns) == list(reference_stats.columns)
+        assert len(stats) == horizon + 1
+        assert stats.isna().sum().sum() == 0
+        assert stats["Total invested"].iloc[-1] == pytest.approx(
+            profile["years_before_ret"] * profile["yearly_installment"])
+        assert stats["Median"].iloc[0] == profile["start_value"]
+
+@pytest.mark.parametrize("sampler", ["iid", "antithetic"])
+def test_streaming_stats_incremental(sampler: str) -> None:
+    kwargs = {"hist_values": sample_series,
+              "start_value": parameters.start_value,
+              "years_before_ret": parameters.years_before_retirement,
+              "yearly_installment": parameters.yearly_installment,
+              "num_scenarios": parameters.num_scenarios,
+              "mean": 0.05,
+              "volatility": 0.24,
+              "chunk_size": 30,
+              "seed": 7,
+              "sampler": sampler}
+
+    # warm up checkpoints with a different withdrawl and a shorter retirement
+    finance._checkpoints.clear()
+    simulate_streaming_stats(**kwargs, years_after_ret=10, yearly_withdrawls=10_000)
+    simulate_streaming_stats(**kwargs, years_after_ret=10, yearly_withdrawls=20_000)
+    incremental_stats = simulate_streaming_stats(**kwargs, years_after_ret=25,
+                                                 yearly_withdrawls=20_000)
+
+    finance._checkpoints.clear()
+    full_stats = simulate_streaming_stats(**kwargs, years_after_ret=25,
+                                          yearly_withdrawls=20_000)
+
+    np.testing.assert_array_equal(incremental_stats.mean, full_stats.mean)
+    np.testing.assert_array_equal(incremental_stats.ruin_counts, full_stats.ruin_counts)
+    np.testing.assert_array_equal(incremental_stats.first_ruin_counts,
+                                  full_stats.first_ruin_counts)
+    for q in [0.05, 0.5, 0.95]:
+        np.testing.assert_array_equal(incremental_stats.quantile(q), full_stats.quantile(q))
+        np.testing.assert_array_equal(incremental_stats.drawdown_quantile(q),
+                                      full_stats.drawdown_quantile(q))
+
+def test_simulate_and_stats_no_retirement() -> None:
+    kwargs = {"hist_values": sample_series,
+              "start_value": parameters.start_value,
+              "years_before_ret": parameters.years_before_retirement,
+              "years_after_ret": 0,
+              "yearly_installment": parameters.yearly_installment,
+              "yearly_withdrawls": parameters.yearly_withdrawl,
+              "mean": 0.05,
+              "volatility": 0.24,
+              "seed": 1}
+
+    # seeded chunks take the incremental path, whose segment after retirement is empty
+    finance._checkpoints.clear()
+    stats = simulate_and_stats.__wrapped__(**kwargs, num_scenarios=100, chunk_size=50)
+    adaptive_stats, _ = simulate_and_stats_adaptive(**kwargs, batch_size=500,
+                                                    max_scenarios=1_000)
+
+    assert len(stats) == len(adaptive_stats) == parameters.years_before_retirement + 1
+    assert stats.isna().sum().sum() == 0
+
+def test_simulate_chunk_traced_once() -> None:
+    tracer.configure(enabled=True)
+    tracer.reset()
+    finance._checkpoints.clear()
+
+    try:
+        simulate_streaming_stats(hist_values=sample_series,
+                                 start_value=parameters.start_value,
+                                 years_before_ret=parameters.years_before_retirement,
+                                 years_after_ret=parameters.years_after_retiirement,
+                                 yearly_installment=parameters.yearly_installment,
+                                 yearly_withdrawls=parameters.yearly_withdrawl,
+                                 num_scenarios=parameters.num_scenarios,
+                                 mean=0.05,
+                                 volatility=0.24,
+                                 chunk_size=parameters.num_scenarios // 2,
+                                 seed=7)
+
+        assert tracer.summary().loc["finance.simulate_chunk", "Count"] == 2
+    finally:
+        tracer.configure(enabled=False)
+        tracer.reset()
+
+def test_simulate_float32() -> None:
+    kwargs = {"hist_values": sample_series,
+              "start_value": parameters.start_value,
+              "years_before_ret": parameters.years_before_retirement,
+              "years_after_ret": parameters.years_after_retiirement,
+              "yearly_installment": parameters.yearly_installment,
+              "yearly_withdrawls": parameters.yearly_withdrawl,
+              "num_scenarios": parameters.num_scenarios,
+              "mean": 0.05,
+              "volatility": 0.24,
+              "seed": 7}
+
+    scenarios, _ = simulate_portfolio_values(**kwargs)
+    scenarios_float32, _ = simulate_portfolio_values(**kwargs, dtype=np.float32)
+
+    assert all(dtype == np.float32 for dtype in scenarios_float32.dtypes)
+    np.testing.assert_allclose(scenarios_float32.iloc[:parameters.years_before_retirement],
+                               scenarios.iloc[:parameters.years_before_retirement],
+                               rtol=1e-3)
+
+def test_bootstrap_glide_path() -> None:
+    num_years = parameters.years_before_retirement + parameters.years_after_retiirement
+    constant_path = pd.DataFrame(np.repeat(sample_series.to_numpy()[:, np.newaxis], num_years,
+                                           axis=1))
+    kwargs = {"num_years": num_years,
+              "num_scenarios": parameters.num_scenarios,
+              "mean": 0.05,
+              "volatility": 0.24}
+
+    # identical yearly columns draw the same returns as the single series
+    np.testing.assert_array_equal(
+        bootstrap_returns(constant_path, **kwargs, rng=np.random.default_rng(3)),
+        bootstrap_returns(sample_series, **kwargs, rng=np.random.default_rng(3)))
+
+    with pytest.raises(ValueError, match="yearly columns"):
+        bootstrap_returns(constant_path.iloc[:, 1:], **kwargs, rng=np.random.default_rng(3))
+
+@backends
+def test_simulate_and_stats_glide_path(backend: str) -> None:
+    num_years = parameters.years_before_retirement + parameters.years_after_retiirement
+    hist_returns = np.column_stack([sample_series.to_numpy(), sample_series.to_numpy() / 4])
+    weights = glide_path([1.0, 0.0], [0.2, 0.8], num_years)
+    allocation_returns = pd.DataFrame(hist_returns @ weights.T)
+
+    kwargs = {"hist_values": allocation_returns,
+              "backend": backend,
+              "start_value": parameters.start_value,
+              "years_before_ret": parameters.years_before_retirement,
+              "years_after_ret": parameters.years_after_retiirement,
+              "yearly_installment": parameters.yearly_installment,
+              "yearly_withdrawls": parameters.yearly_withdrawl,
+              "num_scenarios": parameters.num_scenarios,
+              "mean": allocation_returns.mean().to_numpy(),
+              "volatility": allocation_returns.std().to_numpy(),
+              "seed": 5}
+
+    returns = bootstrap_returns(allocation_returns,
+                                num_years=num_years,
+                                num_scenarios=parameters.num_scenarios,
+                                mean=kwargs["mean"],
+                                volatility=kwargs["volatility"],
+                                rng=np.random.default_rng(5),
+                                backend=backend)
+
+    assert weights.shape == (num_years, 2)
+    # every year is matched to the moments of its own allocation
+    np.testing.assert_allclose(returns.mean(axis=1), kwargs["mean"])
+    np.testing.assert_allclose(returns.std(axis=1), kwargs["volatility"])
+
+    streaming_stats = simulate_and_stats(**kwargs, chunk_size=parameters.num_scenarios // 4)
+    assert streaming_stats.isna().sum().sum() == 0
+
+@pytest.mark.parametrize("q", [0.05, 0.25, 0.5, 0.75, 0.95])
+def test_quantile_sketch(q: float) -> None:
+    values = np.random.default_rng(42).standard_normal((3, 20_000))
+
+    sketch = QuantileSketch(num_rows=3, num_centroids=500)
+    for chunk in np.split(values, 4, axis=1):
+        sketch.update(chunk)
+
+    assert sketch.quantile(q) == pytest.approx(np.quantile(values, q, axis=1), abs=0.01)
+
+def test_backtest_and_stats() -> None:
+    kwargs = {"start_value": parameters.start_value,
+              "years_before_ret": 2,
+              "years_after_ret": 1,
+              "yearly_installment": parameters.yearly_installment,
+              "yearly_withdrawls": parameters.yearly_withdrawl}
+
+    windows = rolling_returns(sample_series, num_years=3)
+
+    assert windows.shape == (3, len(sample_series) - 2)
+    assert np.shares_memory(windows, sample_series.to_numpy())
+    np.testing.assert_array_equal(windows[:, 1], sample_series.iloc[1:4])
+
+    stats = backtest_and_stats(sample_series, **kwargs)
+    expected_values = parameters.start_value * np.ones(windows.shape[1])
+    for t, cashflow in enumerate([parameters.yearly_installment] * 2
+                                 + [-parameters.yearly_withdrawl]):
+        expected_values = expected_values * (1 + windows[t]) + cashflow
+
+    assert list(stats.columns) == list(simulate_and_stats(sample_series, **kwargs,
+                                                          num_scenarios=10,
+                                                          mean=0.05,
+                                                          volatility=0.24).columns)
+    assert stats["Mean"].iloc[-1] == pytest.approx(expected_values.mean())
+
+    # the history moved to its own moments leaves the sequences unchanged
+    moved_stats = backtest_and_stats(sample_series, **kwargs,
+                                     mean=sample_series.mean(),
+                                     volatility=sample_series.std())
+    pd.testing.assert_frame_equal(moved_stats, stats)
+
+    with pytest.raises(ValueError, match="needs as many historical years"):
+        backtest_and_stats(sample_series, **{**kwargs, "years_after_ret": 10})
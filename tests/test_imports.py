@@ -0,0 +1,22 @@
+import subprocess
+import sys
+
+import tools
+
+
+def test_lazy_names():
+    assert "HistoricalData" in dir(tools)
+    assert tools.HistoricalData is tools.data.HistoricalData
+    assert sorted(tools.__all__) == sorted(["load_config", *tools._LAZY_NAMES])
+
+def test_finance_imports_skip_translator():
+    code = """
+import sys
+from tools import HistoricalData, simulate_and_stats
+from charting import get_stats_figure
+print(",".join(sorted({"onnxruntime", "tokenizers", "tools.translation"} & set(sys.modules))))
+"""
+    output = subprocess.run([sys.executable, "-c", code],
+                            capture_output=True, text=True, check=True)
+
+    assert output.stdout.strip() == ""
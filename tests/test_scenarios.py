@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tools.finance import (
+    simulate_and_stats_adaptive,
+    simulate_portfolio_values,
+    simulate_scenarios,
+)
+from tools.scenarios import Scenarios, ScenarioStore, configure_scenario_store
+
+sample_series = pd.Series([0.25, 0.42, -0.25, -0.33, 0.02],
+                          index=pd.date_range("2013-12-31", periods=5, freq="YE"))
+
+kwargs = {"hist_values": sample_series,
+          "start_value": 42_000,
+          "years_before_ret": 30,
+          "years_after_ret": 20,
+          "yearly_installment": 20_000,
+          "yearly_withdrawls": 50_000,
+          "num_scenarios": 100,
+          "mean": 0.05,
+          "volatility": 0.24}
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    configure_scenario_store(str(tmp_path))
+    yield tmp_path
+    configure_scenario_store(None)
+
+def test_scenarios_slices():
+    values = np.array([[1, 1, 1], [2, -1, 3], [-1, 2, 4]], dtype=np.float32)
+    scenarios = Scenarios(values)
+
+    assert scenarios.num_years == 2
+    assert np.shares_memory(scenarios.year(1), values)
+    assert np.shares_memory(scenarios.paths(slice(1, 3)), values)
+    np.testing.assert_array_equal(scenarios.first_ruin_years(), [2, 1, -1])
+    np.testing.assert_array_equal(scenarios.ruined(), [True, True, False])
+
+def test_scenario_store(tmp_path):
+    store = ScenarioStore(str(tmp_path), max_bytes=2 * 100 * 4 + 256)
+
+    for key in "abc":
+        with store.write(key, (10, 10)) as values:
+            values[:] = ord(key)
+
+    # the oldest run is pruned, the others are read back memory-mapped
+    assert store.get("a") is None
+    scenarios = store.get("c")
+    assert isinstance(scenarios.values, np.memmap)
+    assert np.all(scenarios.year(0) == ord("c"))
+    assert not list(tmp_path.glob("*.tmp"))
+
+    with pytest.raises(RuntimeError), store.write("d", (10, 10)):
+        raise RuntimeError
+
+    assert store.get("d") is None
+    assert not list(tmp_path.glob("*.tmp"))
+
+def test_simulate_scenarios(store_path):
+    portfolio_values, _ = simulate_portfolio_values(**kwargs, seed=7)
+    scenarios = simulate_scenarios(**kwargs, seed=7)
+
+    # the paths of the statistics, stored and read back on the next call
+    np.testing.assert_allclose(scenarios.values, portfolio_values.to_numpy(), rtol=1e-6)
+    assert isinstance(scenarios.values, np.memmap)
+    assert len(list(store_path.glob("*.npy"))) == 1
+
+    np.testing.assert_array_equal(simulate_scenarios(**kwargs, seed=7).values, scenarios.values)
+    assert len(list(store_path.glob("*.npy"))) == 1
+
+    chunked = simulate_scenarios(**kwargs, seed=7, chunk_size=30)
+    parallel = simulate_scenarios(**kwargs, seed=7, chunk_size=30, workers=3)
+    np.testing.assert_array_equal(parallel.values, chunked.values)
+
+    # unseeded runs cannot be asked for again, so they are not stored
+    unseeded = simulate_scenarios(**kwargs)
+    assert not isinstance(unseeded.values, np.memmap)
+    assert unseeded.values.shape == scenarios.values.shape
+
+def test_simulate_scenarios_match_adaptive_stats():
+    adaptive_kwargs = {key: value for key, value in kwargs.items() if key != "num_scenarios"}
+    stats, report = simulate_and_stats_adaptive(**adaptive_kwargs, batch_size=50,
+                                                max_scenarios=1_000, tolerance=0.5,
+                                                ruin_tolerance=0.5, seed=7)
+    assert report.num_scenarios < 1_000
+
+    # the batches merged into the statistics, chunk by chunk
+    scenarios = simulate_scenarios(**{**kwargs, "num_scenarios": report.num_scenarios},
+                                   chunk_size=50, seed=7)
+
+    assert scenarios.ruined().mean() == pytest.approx(stats["Probability of first ruin"].sum())
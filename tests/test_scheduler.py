@@ -0,0 +1,82 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from tools.scheduler import TranslationScheduler
+
+SENTENCES = ["Hallo Welt, wie geht es?",
+             "Der Hund läuft heute schnell über die grüne Wiese und sieht einen Vogel.",
+             "Danke!",
+             "Wir sehen uns morgen.",
+             "Das Wetter ist heute sehr schön, aber morgen soll es regnen.",
+             "Kannst du mir bitte helfen?"]
+
+def test_scheduler_matches_translator(stand_in_translators):
+    for translator in stand_in_translators:
+        expected = translator.translate_batch(SENTENCES)
+        expected_short = translator.translate_batch(SENTENCES, max_tgt_length=3)
+        scheduler = TranslationScheduler(translator, max_batch_size=4, num_workers=2)
+
+        # requests of many sessions at once, more than fit into the batches
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [executor.submit(scheduler.translate, SENTENCES) for _ in range(8)]
+            short = scheduler.translate(SENTENCES, max_tgt_length=3)
+
+            assert all(future.result() == expected for future in futures)
+            assert short == expected_short
+
+        scheduler.close()
+        stats = scheduler.stats()
+
+        assert stats.completed == 9 * len(SENTENCES)
+        assert stats.queue_depth == 0
+        assert stats.in_flight == 0
+        assert 0 < stats.occupancy <= 1
+        assert 0 < stats.p50_latency_seconds <= stats.p99_latency_seconds
+
+def test_scheduler_stream(stand_in_translators):
+    for translator in stand_in_translators:
+        scheduler = TranslationScheduler(translator)
+
+        partials = list(scheduler.stream(SENTENCES[1]))
+        assert partials[-1] == translator.translate(SENTENCES[1])
+
+        # a cancelled stream leaves the batch
+        cancel = threading.Event()
+        stream = scheduler.stream(SENTENCES[1], cancel=cancel)
+        next(stream)
+        cancel.set()
+
+        assert list(stream) == []
+
+        scheduler.close()
+        assert scheduler.stats().in_flight == 0
+
+class _FailingEncoder:
+    def __init__(self, encoder):
+        self._encoder = encoder
+
+    def __getattr__(self, name):
+        return getattr(self._encoder, name)
+
+    def run(self, *args):
+        msg = "encoder failed"
+        raise RuntimeError(msg)
+
+def test_scheduler_encoder_error(stand_in_translators, monkeypatch):
+    _, split = stand_in_translators
+    scheduler = TranslationScheduler(split)
+    encoder = split._encoder
+
+    # the admitted requests get the error and the worker keeps running
+    monkeypatch.setattr(split, "_encoder", _FailingEncoder(encoder))
+    future = scheduler.submit(SENTENCES[0])
+    with pytest.raises(RuntimeError, match="encoder failed"):
+        future.result(timeout=60)
+
+    monkeypatch.setattr(split, "_encoder", encoder)
+    assert scheduler.translate(SENTENCES) == split.translate_batch(SENTENCES)
+
+    scheduler.close()
+    assert scheduler.stats().in_flight == 0
@@ -0,0 +1,51 @@
+import time
+
+from tools.tracing import Tracer
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+
+    @tracer.traced("stage")
+    def stage(value):
+        return value + 1
+
+    with tracer.span("other"):
+        pass
+
+    assert stage(1) == 2
+    assert tracer.summary().empty
+
+def test_tracer_summary():
+    tracer = Tracer(enabled=True)
+
+    @tracer.traced("stage")
+    def stage():
+        time.sleep(0.01)
+
+    for _ in range(3):
+        stage()
+
+    with tracer.span("other"):
+        pass
+
+    summary = tracer.summary()
+
+    assert list(summary.index) == ["other", "stage"]
+    assert summary.loc["stage", "Count"] == 3
+    assert summary.loc["stage", "Median seconds"] >= 0.01
+    assert summary.loc["stage", "Max seconds"] <= summary.loc["stage", "Total seconds"]
+
+def test_tracer_prometheus(tmp_path):
+    tracer = Tracer(enabled=True)
+
+    with tracer.span("finance.simulate"):
+        pass
+
+    metrics_path = tmp_path / "metrics.prom"
+    tracer.write_prometheus(str(metrics_path))
+    text = metrics_path.read_text()
+
+    assert "# TYPE koala_span_seconds summary" in text
+    assert 'koala_span_seconds{span="finance.simulate",quantile="0.99"}' in text
+    assert 'koala_span_seconds_count{span="finance.simulate"} 1\n' in text
@@ -1,4 +1,13 @@
-from tools import translate
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from tokenizers import Tokenizer
+
+from tools import load_config, translate, translation
+from tools.cache import ResultCache
+from tools.configuration import InferenceProfile
+from tools.translation import Translator, get_translator, split_sentences
 
 
 def test_translate():
@@ -8,3 +17,111 @@ def test_translate():
     assert isinstance(translated_setnence, str)
     assert len(translated_setnence) >= 10  # at least 10 characters
     assert len(translated_setnence.split()) >= 4  # at least 4 words
+
+SENTENCES = ["Hallo Welt, wie geht es?",
+             "Der Hund läuft heute schnell über die grüne Wiese und sieht einen Vogel.",
+             "Danke!",
+             "Wir sehen uns morgen."]
+
+def test_incremental_decoding_matches_single_graph(stand_in_translators):
+    single, split = stand_in_translators
+
+    assert split.incremental
+    assert not single.incremental
+
+    for sentence in SENTENCES:
+        assert split.translate(sentence) == single.translate(sentence)
+
+@pytest.mark.parametrize("batch_size", [1, 3, 16])
+def test_translate_batch_keeps_order(stand_in_translators, batch_size):
+    for translator in stand_in_translators:
+        expected = [translator.translate(sentence) for sentence in SENTENCES]
+
+        assert translator.translate_batch(SENTENCES, batch_size=batch_size) == expected
+
+def test_optimized_model_is_cached(tmp_path):
+    pytest.importorskip("onnx")
+    from benchmarks.stand_in_model import build_stand_in_model
+
+    config = load_config()
+    vocab_size = Tokenizer.from_file(config.en_tokenizer_path).get_vocab_size()
+    pad_id = Tokenizer.from_file(config.de_tokenizer_path).token_to_id("<PAD>")
+    build_stand_in_model(tmp_path / "model.onnx", vocab_size=vocab_size, pad_id=pad_id)
+
+    def make_translator(profile):
+        return Translator(model_path=str(tmp_path / "model.onnx"),
+                          src_tokenizer_path=config.de_tokenizer_path,
+                          tgt_tokenizer_path=config.en_tokenizer_path,
+                          profile=profile)
+
+    expected = make_translator(None).translate(SENTENCES[0])
+    profile = InferenceProfile(intra_op_threads=1, optimized_model_dir=str(tmp_path / "cache"))
+
+    assert make_translator(profile).translate(SENTENCES[0]) == expected
+    cached = sorted((tmp_path / "cache").iterdir())
+    assert len(cached) == 1
+    assert make_translator(profile).translate(SENTENCES[0]) == expected
+    assert sorted((tmp_path / "cache").iterdir()) == cached
+
+    quantized = InferenceProfile(optimized_model_dir=str(tmp_path / "cache"), quantize=True)
+    assert make_translator(quantized).translate(SENTENCES[0]) == expected
+
+    with pytest.raises(ValueError, match="optimization level"):
+        make_translator(InferenceProfile(optimization_level="fastest"))
+
+def test_translation_cache(stand_in_translators, tmp_path, monkeypatch):
+    single, _ = stand_in_translators
+    expected = single.translate_batch(SENTENCES)
+
+    disk_path = str(tmp_path / "translations.sqlite")
+    monkeypatch.setattr(single, "cache", ResultCache(max_bytes=2**20, disk_path=disk_path))
+    translated = []
+    translate_batch = single._translate_batch
+    monkeypatch.setattr(single, "_translate_batch",
+                        lambda sentences, *args: translated.extend(sentences)
+                        or translate_batch(sentences, *args))
+
+    assert single.translate_batch([*SENTENCES, SENTENCES[0]]) == [*expected, expected[0]]
+    assert len(translated) == len(SENTENCES)  # the repeated sentence once
+
+    edited = ["Hallo  Welt,\twie geht es?", "Ein neuer Satz."]
+    assert single.translate_batch(edited)[0] == expected[0]
+    assert translated[len(SENTENCES):] == ["Ein neuer Satz."]
+
+    # another process sharing the file finds the translations on disk
+    monkeypatch.setattr(single, "cache", ResultCache(max_bytes=2**20, disk_path=disk_path))
+    assert single.translate_batch(SENTENCES) == expected
+    assert single.cache.stats.disk_hits == len(SENTENCES)
+
+def test_translate_stream(stand_in_translators):
+    for translator in stand_in_translators:
+        for sentence in SENTENCES:
+            partials = list(translator.translate_stream(sentence))
+
+            assert partials[-1] == translator.translate(sentence)
+            assert len(partials) == len(set(partials))  # only changes are yielded
+
+        cancel = threading.Event()
+        stream = translator.translate_stream(SENTENCES[1], cancel=cancel)
+        next(stream)
+        cancel.set()
+
+        assert list(stream) == []
+
+def test_split_sentences():
+    text = "Hallo Welt! Wie geht es?  Gut.\n\nNeuer Absatz ohne Punkt"
+
+    assert split_sentences(text) == [["Hallo Welt!", "Wie geht es?", "Gut."],
+                                     ["Neuer Absatz ohne Punkt"]]
+
+def test_get_translator_is_shared(stand_in_model_dir, monkeypatch):
+    config = load_config()
+    config.translator_model_path = str(stand_in_model_dir / "model.onnx")
+    config.translator_encoder_path = config.translator_decoder_path = None
+    monkeypatch.setattr(translation, "load_config", lambda: config)
+    monkeypatch.setattr(translation, "_translator", None)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        translators = list(executor.map(lambda _: get_translator(), range(8)))
+
+    assert all(translator is translators[0] for translator in translators)
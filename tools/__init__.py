@@ -1,4 +1,90 @@
+"""
+Names of the heavier modules (pandas, onnxruntime and the translation model) are
+imported on first access (PEP 562), so importing the package itself is cheap and
+the finance page never loads the translator.
+"""
+import importlib
+from typing import TYPE_CHECKING
+
 from .configuration import load_config
-from .data import HistoricalData
-from .finance import simulate_and_stats
-from .translation import translate
+
+if TYPE_CHECKING:
+    from .data import HistoricalData
+    from .finance import (
+        backtest_and_stats,
+        configure_result_cache,
+        glide_path,
+        simulate_and_stats,
+        simulate_and_stats_adaptive,
+        simulate_portfolio_values,
+        simulate_profiles_and_stats,
+        simulate_scenarios,
+        simulate_terminal_decomposition,
+    )
+    from .scenarios import configure_scenario_store
+    from .scheduler import get_scheduler
+    from .tracing import configure_tracing, tracer
+    from .translation import (
+        configure_translation_cache,
+        translate,
+        translate_document,
+        translate_stream,
+    )
+
+_LAZY_NAMES = {
+    "HistoricalData": "data",
+    "backtest_and_stats": "finance",
+    "configure_result_cache": "finance",
+    "glide_path": "finance",
+    "simulate_and_stats": "finance",
+    "simulate_and_stats_adaptive": "finance",
+    "simulate_portfolio_values": "finance",
+    "simulate_profiles_and_stats": "finance",
+    "simulate_scenarios": "finance",
+    "simulate_terminal_decomposition": "finance",
+    "configure_scenario_store": "scenarios",
+    "get_scheduler": "scheduler",
+    "configure_tracing": "tracing",
+    "tracer": "tracing",
+    "configure_translation_cache": "translation",
+    "translate": "translation",
+    "translate_document": "translation",
+    "translate_stream": "translation",
+}
+
+__all__ = [
+    "HistoricalData",
+    "backtest_and_stats",
+    "configure_result_cache",
+    "configure_scenario_store",
+    "configure_tracing",
+    "configure_translation_cache",
+    "get_scheduler",
+    "glide_path",
+    "load_config",
+    "simulate_and_stats",
+    "simulate_and_stats_adaptive",
+    "simulate_portfolio_values",
+    "simulate_profiles_and_stats",
+    "simulate_scenarios",
+    "simulate_terminal_decomposition",
+    "tracer",
+    "translate",
+    "translate_document",
+    "translate_stream",
+]
+
+def __getattr__(name: str) -> object:
+    module_name = _LAZY_NAMES.get(name)
+
+    if module_name is None:
+        msg = f"module {__name__!r} has no attribute {name!r}"
+        raise AttributeError(msg)
+
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value  # later accesses skip __getattr__
+
+    return value
+
+def __dir__() -> list[str]:
+    return sorted(__all__)
@@ -0,0 +1,324 @@
+import functools
+import hashlib
+import inspect
+import math
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from .tracing import span
+
+# fingerprints of live objects that know theirs, see `remember_fingerprint`
+_remembered: dict[int, tuple[weakref.ref, str]] = {}
+
+def remember_fingerprint(part: object, key: str) -> None:
+    """
+    Let `fingerprint` use `key` for `part` instead of hashing it, while `part` is alive.
+    Only for objects that cannot change, e.g. pandas objects over read-only arrays.
+    """
+    part_id = id(part)
+    _remembered[part_id] = (weakref.ref(part, lambda _: _remembered.pop(part_id, None)), key)
+
+def _update_digest(digest: "hashlib.blake2b", part: object) -> None:
+    # pandas objects can only exist once pandas is imported, so the translator need not load it
+    pd = sys.modules.get("pandas")
+    remembered = _remembered.get(id(part))
+
+    if remembered is not None and remembered[0]() is part:
+        digest.update(remembered[1].encode())
+    elif pd is not None and isinstance(part, pd.Series | pd.DataFrame):
+        _update_digest(digest, part.to_numpy())
+        _update_digest(digest, part.index.to_numpy())
+    elif isinstance(part, np.ndarray) and part.dtype != object:
+        digest.update(f"{part.dtype.str}{part.shape}".encode())
+        digest.update(np.ascontiguousarray(part).view(np.uint8).data)
+    else:
+        digest.update(repr(part).encode())
+
+    digest.update(b"\x00")
+
+def fingerprint(*parts: object) -> str:
+    """
+    Cheap fingerprint of arguments.
+    Arrays and pandas objects are hashed straight from their buffers (one blake2b pass),
+    everything else by its repr.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        _update_digest(digest, part)
+
+    return digest.hexdigest()
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    disk_hits: int = 0
+    num_entries: int = 0
+    num_bytes: int = 0
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU cache bounded by the total size of its values in bytes
+    and optionally by the number of entries.
+    """
+
+    def __init__(self,
+                 max_bytes: int,
+                 sizeof: Callable[[Any], int] = len,
+                 max_entries: int | None = None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._sizeof = sizeof
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self._stats.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self._sizeof(value)
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._stats.num_bytes -= previous[1]
+
+            self._entries[key] = (value, size)
+            self._stats.num_bytes += size
+            self._evict()
+
+    def resize(self, max_bytes: int, max_entries: int | None = None) -> None:
+        with self._lock:
+            self.max_bytes = max_bytes
+            self.max_entries = max_entries
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._stats.num_bytes = 0
+
+    @property
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(hits=self._stats.hits,
+                              misses=self._stats.misses,
+                              evictions=self._stats.evictions,
+                              num_entries=len(self._entries),
+                              num_bytes=self._stats.num_bytes)
+
+    def _evict(self) -> None:
+        while self._entries and (self._stats.num_bytes > self.max_bytes
+                                 or len(self._entries) > (self.max_entries or math.inf)):
+            _, (_, size) = self._entries.popitem(last=False)
+            self._stats.num_bytes -= size
+            self._stats.evictions += 1
+
+class ResultCache:
+    """
+    Cache of pickled results with an in-memory LRU tier bounded in bytes and an optional
+    sqlite tier on disk that is shared by all processes using the same file.
+    Values are stored pickled, so callers always get their own copy.
+    """
+
+    def __init__(self,
+                 max_bytes: int,
+                 disk_path: str | None = None,
+                 disk_max_bytes: int = 1024 * 2**20,
+                 max_entries: int | None = None):
+        self._memory = LRUCache(max_bytes, max_entries=max_entries)
+        self._disk_path = None
+        self._disk_max_bytes = disk_max_bytes
+        self._disk_hits = 0
+        self.configure(max_bytes=max_bytes, disk_path=disk_path, disk_max_bytes=disk_max_bytes,
+                       max_entries=max_entries)
+
+    def configure(self,
+                  max_bytes: int,
+                  disk_path: str | None = None,
+                  disk_max_bytes: int = 1024 * 2**20,
+                  max_entries: int | None = None) -> None:
+        self._memory.resize(max_bytes, max_entries)
+        self._disk_max_bytes = disk_max_bytes
+
+        if disk_path != self._disk_path and disk_path is not None:
+            Path(disk_path).parent.mkdir(parents=True, exist_ok=True)
+            with self._connect(disk_path) as connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("""CREATE TABLE IF NOT EXISTS results (
+                                        key TEXT PRIMARY KEY,
+                                        value BLOB NOT NULL,
+                                        accessed REAL NOT NULL)""")
+                # total size of the values kept up to date by triggers, so checking the
+                # budget on every put needs no scan
+                connection.execute("""CREATE TABLE IF NOT EXISTS usage (
+                                        id INTEGER PRIMARY KEY CHECK (id = 0),
+                                        num_bytes INTEGER NOT NULL)""")
+                connection.execute("""CREATE TRIGGER IF NOT EXISTS results_insert
+                                        AFTER INSERT ON results BEGIN
+                                        UPDATE usage SET num_bytes = num_bytes
+                                                                     + LENGTH(NEW.value);
+                                        END""")
+                connection.execute("""CREATE TRIGGER IF NOT EXISTS results_update
+                                        AFTER UPDATE OF value ON results BEGIN
+                                        UPDATE usage SET num_bytes = num_bytes
+                                                                     + LENGTH(NEW.value)
+                                                                     - LENGTH(OLD.value);
+                                        END""")
+                connection.execute("""CREATE TRIGGER IF NOT EXISTS results_delete
+                                        AFTER DELETE ON results BEGIN
+                                        UPDATE usage SET num_bytes = num_bytes
+                                                                     - LENGTH(OLD.value);
+                                        END""")
+                # files written before the triggers existed are summed up once
+                connection.execute("""INSERT OR IGNORE INTO usage
+                                        SELECT 0, COALESCE(SUM(LENGTH(value)), 0)
+                                        FROM results""")
+
+        self._disk_path = disk_path
+
+    def get(self, key: str) -> Any | None:
+        payload = self._memory.get(key)
+
+        if payload is None and self._disk_path is not None:
+            with self._connect(self._disk_path) as connection:
+                row = connection.execute("SELECT value FROM results WHERE key = ?",
+                                         (key,)).fetchone()
+                if row is not None:
+                    connection.execute("UPDATE results SET accessed = ? WHERE key = ?",
+                                       (time.time(), key))
+
+            if row is not None:
+                payload = row[0]
+                self._disk_hits += 1
+                self._memory.put(key, payload)
+
+        return None if payload is None else pickle.loads(payload)  # noqa: S301 (own data)
+
+    def put(self, key: str, value: Any) -> None:
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._memory.put(key, payload)
+
+        if self._disk_path is not None:
+            with self._connect(self._disk_path) as connection:
+                # an upsert, unlike INSERT OR REPLACE, fires the triggers of the replaced row
+                connection.execute("""INSERT INTO results VALUES (?, ?, ?)
+                                        ON CONFLICT (key) DO UPDATE
+                                        SET value = excluded.value,
+                                            accessed = excluded.accessed""",
+                                   (key, payload, time.time()))
+                self._prune_disk(connection)
+
+    def clear(self) -> None:
+        self._memory.clear()
+
+        if self._disk_path is not None:
+            with self._connect(self._disk_path) as connection:
+                connection.execute("DELETE FROM results")
+
+    @property
+    def stats(self) -> CacheStats:
+        stats = self._memory.stats
+        stats.disk_hits = self._disk_hits
+        # a disk hit is a memory miss, but not a miss of the cache
+        stats.misses -= self._disk_hits
+        stats.hits += self._disk_hits
+
+        return stats
+
+    def _prune_disk(self, connection: sqlite3.Connection) -> None:
+        total_bytes, = connection.execute("SELECT num_bytes FROM usage").fetchone()
+
+        if total_bytes > self._disk_max_bytes:
+            # drop least recently accessed entries until within budget
+            connection.execute("""DELETE FROM results WHERE key IN (
+                                    SELECT key FROM (
+                                        SELECT key, SUM(LENGTH(value)) OVER (
+                                            ORDER BY accessed DESC) AS cumulative
+                                        FROM results)
+                                    WHERE cumulative > ?)""", (self._disk_max_bytes,))
+
+    @staticmethod
+    @contextmanager
+    def _connect(path: str) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(path, timeout=30)
+        try:
+            with connection:  # commits or rolls back
+                yield connection
+        finally:
+            connection.close()
+
+# bumped when the layout of cached results changes without a change of the code computing them
+CACHE_VERSION = 1
+
+@functools.cache
+def code_version(package_dir: Path) -> str:
+    """
+    Fingerprint of the sources of a package and the NumPy version, so results cached on
+    disk by an earlier deploy are not served once the code computing them changed.
+    """
+    sources = sorted(package_dir.glob("*.py"))
+
+    return fingerprint(CACHE_VERSION, np.__version__,
+                       *(part for path in sources for part in (path.name, path.read_bytes())))
+
+def cached(cache: ResultCache,
+           ignore: tuple[str, ...] = ()) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Memoize a function in `cache`, keyed by a fingerprint of its arguments (except those
+    in `ignore`, which must not change the result) and of the code of its package.
+    """
+    def decorator(function: Callable[..., Any]) -> Callable[..., Any]:
+        signature = inspect.signature(function)
+        version = code_version(Path(inspect.getfile(function)).parent)
+
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+
+            with span("cache.fingerprint"):
+                key = fingerprint(version, function.__module__, function.__qualname__,
+                                  *(part for item in bound.arguments.items()
+                                    if item[0] not in ignore for part in item))
+
+            with span("cache.get"):
+                result = cache.get(key)
+
+            if result is None:
+                result = function(*args, **kwargs)
+
+                with span("cache.put"):
+                    cache.put(key, result)
+
+            return result
+
+        wrapper.clear = cache.clear
+
+        return wrapper
+
+    return decorator
@@ -1,7 +1,24 @@
 import json
-from dataclasses import dataclass
+import os
+from dataclasses import dataclass, field
 
-CONFIG_PATH = "./app_config.json"  # loaded from home.py
+# loaded from home.py, KOALA_CONFIG_PATH points elsewhere (benchmarks use a stand-in model)
+CONFIG_PATH = os.environ.get("KOALA_CONFIG_PATH", "./app_config.json")
+
+@dataclass
+class InferenceProfile:
+    """
+    ONNX Runtime settings of the translator sessions.
+    Zero threads leave the choice to ONNX Runtime. With `optimized_model_dir` set,
+    optimized (and quantized) models are cached there across restarts.
+    """
+
+    intra_op_threads: int = 0
+    inter_op_threads: int = 0
+    optimization_level: str = "all"  # one of "disabled", "basic", "extended", "all"
+    memory_arena: bool = True
+    optimized_model_dir: str | None = None
+    quantize: bool = False  # int8 dynamic quantization of the weights
 
 @dataclass
 class Configuration:
@@ -9,6 +26,28 @@ class Configuration:
     translator_model_path: str
     de_tokenizer_path: str
     en_tokenizer_path: str
+    # encoder and decoder exported as separate graphs for incremental decoding, both or
+    # none, otherwise the single graph at `translator_model_path` is used
+    translator_encoder_path: str | None = None
+    translator_decoder_path: str | None = None
+    translator_profile: InferenceProfile = field(default_factory=InferenceProfile)
+    simulation_chunk_size: int | None = None
+    simulation_workers: int = 1
+    simulation_seed: int | None = None
+    simulation_backend: str = "numpy"
+    result_cache_max_bytes: int = 64 * 2**20
+    result_cache_path: str | None = None
+    scenario_store_path: str | None = None  # directory of simulated scenarios, None for none
+    scenario_store_max_bytes: int = 1024 * 2**20
+    translation_cache_max_bytes: int = 8 * 2**20
+    translation_cache_max_entries: int | None = None
+    translation_cache_path: str | None = None
+    translation_workers: int = 0  # threads batching requests of all sessions, 0 for none
+    translation_batch_size: int = 16
+    translation_queue_size: int = 256
+    tracing_enabled: bool = False
+    tracing_memory: bool = False
+    tracing_metrics_path: str | None = None
 
 def load_config() -> Configuration:
     try:
@@ -18,7 +57,37 @@ def load_config() -> Configuration:
             return Configuration(hist_returns_path=json_config["hist_returns_path"],
                                  translator_model_path=json_config["translator_model_path"],
                                  de_tokenizer_path=json_config["de_tokenizer_path"],
-                                 en_tokenizer_path=json_config["en_tokenizer_path"])
+                                 en_tokenizer_path=json_config["en_tokenizer_path"],
+                                 translator_encoder_path=json_config.get(
+                                     "translator_encoder_path"),
+                                 translator_decoder_path=json_config.get(
+                                     "translator_decoder_path"),
+                                 translator_profile=InferenceProfile(
+                                     **json_config.get("translator_profile", {})),
+                                 simulation_chunk_size=json_config.get("simulation_chunk_size"),
+                                 simulation_workers=json_config.get("simulation_workers", 1),
+                                 simulation_seed=json_config.get("simulation_seed"),
+                                 simulation_backend=json_config.get("simulation_backend",
+                                                                    "numpy"),
+                                 result_cache_max_bytes=json_config.get("result_cache_max_bytes",
+                                                                        64 * 2**20),
+                                 result_cache_path=json_config.get("result_cache_path"),
+                                 scenario_store_path=json_config.get("scenario_store_path"),
+                                 scenario_store_max_bytes=json_config.get(
+                                     "scenario_store_max_bytes", 1024 * 2**20),
+                                 translation_cache_max_bytes=json_config.get(
+                                     "translation_cache_max_bytes", 8 * 2**20),
+                                 translation_cache_max_entries=json_config.get(
+                                     "translation_cache_max_entries"),
+                                 translation_cache_path=json_config.get("translation_cache_path"),
+                                 translation_workers=json_config.get("translation_workers", 0),
+                                 translation_batch_size=json_config.get("translation_batch_size",
+                                                                        16),
+                                 translation_queue_size=json_config.get("translation_queue_size",
+                                                                        256),
+                                 tracing_enabled=json_config.get("tracing_enabled", False),
+                                 tracing_memory=json_config.get("tracing_memory", False),
+                                 tracing_metrics_path=json_config.get("tracing_metrics_path"))
     except (FileNotFoundError, KeyError) as e:
         msg = "There was an error loading configuration file"
         raise RuntimeError(msg) from e
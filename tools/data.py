@@ -1,49 +1,303 @@
+import csv
+import os
+import threading
+from dataclasses import dataclass
+from functools import cached_property
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
 
+from .cache import fingerprint, remember_fingerprint
+from .tracing import span, traced
 
-class HistoricalData:
-    def __init__(self, data_path: str, start_date: str | None = None):
-        self._time_series = self._load(data_path, start_date)
+DATA_CACHE_DIR = ".cache/data"
 
-    def _load(self, path: str, start_date: str | None) -> pd.Series:
-        hist_data = pd.read_csv(path, index_col="Date")
+@dataclass(frozen=True)
+class _ReturnsTable:
+    """
+    Parsed returns file: dates and a (num_assets, n) array of returns, one contiguous
+    row per asset (both possibly memory-mapped), plus prefix sums of the first three
+    powers of the returns shifted by `shift`.
+    Windows starting at row `i` are then summarized in O(1).
+    """
 
-        if hist_data.shape[1] > 1:
-            msg = f"""Historical data expected to have one column
-                        only (representing time series of returns).
-                        Got {hist_data.shape[1]} instead"""
+    key: str
+    names: list[str]
+    dates: np.ndarray
+    columns: np.ndarray
+    shift: np.ndarray
+    prefix_sums: np.ndarray  # shape (3, num_assets, n + 1)
 
-            raise ValueError(msg)
+    @classmethod
+    def from_arrays(cls,
+                    key: str,
+                    names: list[str],
+                    dates: np.ndarray,
+                    columns: np.ndarray) -> "_ReturnsTable":
+        # shifting by the mean keeps the power sums small and avoids cancellation
+        shift = columns.mean(axis=1) if len(dates) else np.zeros(len(columns))
+        shifted = columns - shift[:, np.newaxis]
+
+        prefix_sums = np.zeros((3, *columns.shape[:-1], len(dates) + 1))
+        np.cumsum(shifted, axis=-1, out=prefix_sums[0, :, 1:])
+        np.cumsum(shifted**2, axis=-1, out=prefix_sums[1, :, 1:])
+        np.cumsum(shifted**3, axis=-1, out=prefix_sums[2, :, 1:])
+
+        return cls(key=key,
+                   names=names,
+                   dates=dates,
+                   columns=columns,
+                   shift=shift,
+                   prefix_sums=prefix_sums)
+
+    def window_sums(self, start: int) -> tuple[int, np.ndarray, np.ndarray, np.ndarray]:
+        sums = self.prefix_sums[..., -1] - self.prefix_sums[..., start]
+
+        return len(self.dates) - start, *sums
+
+_tables: dict[str, _ReturnsTable] = {}
+_tables_lock = threading.Lock()
+
+def _read_header(path: str) -> list[str]:
+    with Path(path).open(newline="") as file:
+        return next(csv.reader(file))
+
+@traced("data.parse_csv")
+def _parse_csv(path: str) -> tuple[np.ndarray, np.ndarray]:
+    # years with a missing return of any asset are dropped, so rows stay complete
+    hist_data = pd.read_csv(path, index_col="Date").dropna()
+
+    dates = pd.to_datetime(hist_data.index).to_numpy(dtype="datetime64[ns]")
+    columns = np.ascontiguousarray(hist_data.to_numpy(dtype=np.float64).T)
+
+    return dates, columns
+
+@traced("data.load")
+def _load_table(path: str, cache_dir: str | None) -> _ReturnsTable:
+    """
+    Load the returns file at `path`, preferring in order the copy already parsed
+    by this process, the binary copy in `cache_dir` and finally the CSV itself.
+    Both copies are keyed by the modification time and size of the source file.
+    """
+    header = _read_header(path)
+    names = [column for column in header if column != "Date"]
+
+    if "Date" not in header or not names:
+        msg = f"""Historical data expected to have a Date column and at least
+                    one column of returns. Got columns {header} instead"""
+
+        raise ValueError(msg)
+
+    source = Path(path).stat()
+    source_id = fingerprint(str(Path(path).resolve()))[:16]
+    key = fingerprint(source_id, source.st_mtime_ns, source.st_size)
 
-        time_series = hist_data.iloc[:, 0].dropna()
+    with _tables_lock:
+        table = _tables.get(path)
 
-        # ensure that the index has pd.Timestamp type
-        time_series.index = [pd.to_datetime(d) for d in time_series.index]
+        if table is not None and table.key == key:
+            return table
 
-        time_series = time_series.loc[start_date:]
+        cache_path = None
+        if cache_dir is not None:
+            # files of the same name in other directories keep their own copies
+            cache_path = Path(cache_dir) / f"{Path(path).stem}-{source_id}-{key}.npy"
 
-        return time_series
+        if cache_path is not None and cache_path.exists():
+            # row 0 holds the dates and the other rows the bits of the returns of every
+            # asset, so all columns are contiguous
+            with span("data.read_cache"):
+                rows = np.load(cache_path, mmap_mode="r")
+                dates, columns = rows[0].view("datetime64[ns]"), rows[1:].view(np.float64)
+        else:
+            dates, columns = _parse_csv(path)
+
+            if cache_path is not None:
+                _write_cache(cache_path, dates, columns)
+
+        table = _ReturnsTable.from_arrays(key=key, names=names, dates=dates, columns=columns)
+        _tables[path] = table
+
+        return table
+
+def _write_cache(cache_path: Path, dates: np.ndarray, columns: np.ndarray) -> None:
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # copies of previous versions of the source file are stale
+    source_prefix = cache_path.stem.rsplit("-", 1)[0]  # name and hash of the source path
+    for stale_path in cache_path.parent.glob(f"{source_prefix}-*.npy"):
+        if stale_path.stem.rsplit("-", 1)[0] == source_prefix:
+            stale_path.unlink(missing_ok=True)
+
+    rows = np.concatenate([dates.view(np.int64)[np.newaxis], columns.view(np.int64)])
+
+    temp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+    with temp_path.open("wb") as file:
+        np.save(file, rows)
+    temp_path.replace(cache_path)
+
+class HistoricalData:
+    """
+    Historical yearly returns of one or more assets starting at `start_date`.
+    Statistics are floats for a single asset and per-asset arrays otherwise.
+    """
+
+    def __init__(self,
+                 data_path: str,
+                 start_date: str | None = None,
+                 cache_dir: str | None = DATA_CACHE_DIR):
+        self._table = _load_table(data_path, cache_dir)
+
+        if start_date is None:
+            self._start = 0
+        else:
+            self._start = int(np.searchsorted(self._table.dates,
+                                              np.datetime64(pd.Timestamp(start_date), "ns")))
 
     @property
     def num_timesteps(self) -> int:
-        return len(self._time_series)
+        return len(self._table.dates) - self._start
+
+    @property
+    def num_assets(self) -> int:
+        return len(self._table.names)
+
+    @property
+    def assets(self) -> list[str]:
+        return self._table.names
 
     @property
     def first_date(self) -> pd.Timestamp:
-        return self._time_series.index[0]
+        return pd.Timestamp(self.dates[0])
+
+    @property
+    def dates(self) -> np.ndarray:
+        return self._table.dates[self._start:]
+
+    @property
+    def returns(self) -> np.ndarray:
+        """
+        (num_timesteps, num_assets) view of the returns, a row per historical year.
+        """
+        return self._table.columns[:, self._start:].T
 
     @property
+    def values(self) -> np.ndarray:
+        """
+        Returns of a single asset, shape (num_timesteps,).
+        """
+        self._check_single_asset()
+
+        return self._table.columns[0, self._start:]
+
+    @cached_property
     def series(self) -> pd.Series:
-        return self._time_series
+        self._check_single_asset()
+
+        series = pd.Series(self.values,
+                           index=pd.DatetimeIndex(self.dates),
+                           name=self._table.names[0],
+                           copy=False)
+        self._remember_fingerprint(series, "series")
+
+        return series
+
+    @cached_property
+    def frame(self) -> pd.DataFrame:
+        frame = pd.DataFrame(self.returns,
+                             index=pd.DatetimeIndex(self.dates),
+                             columns=self._table.names,
+                             copy=False)
+        self._remember_fingerprint(frame, "frame")
+
+        return frame
+
+    def allocation_returns(self, weights: npt.ArrayLike) -> pd.Series | pd.DataFrame:
+        """
+        Historical returns of a portfolio, one product of the returns matrix with `weights`.
+        Weights of shape (num_assets,) give a Series. A glide path of shape
+        (num_years, num_assets) gives a DataFrame with a column per simulated year.
+        Bootstrapping either draws whole historical years, so the correlation between
+        assets is kept.
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+
+        if weights.shape[-1] != self.num_assets:
+            msg = f"Expected weights for {self.num_assets} assets, got shape {weights.shape}"
+            raise ValueError(msg)
+
+        returns = self.returns @ weights.T
+        index = pd.DatetimeIndex(self.dates)
+
+        if weights.ndim == 1:
+            return pd.Series(returns, index=index, name="Allocation")
+
+        return pd.DataFrame(returns,
+                            index=index,
+                            columns=pd.RangeIndex(1, len(weights) + 1, name="Year"))
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Identifies the source file version and the window, cheaper than hashing `series`.
+        """
+        return fingerprint(self._table.key, self._start)
 
     @property
-    def mean(self) -> float:
-        return self._time_series.mean()
+    def mean(self) -> float | np.ndarray:
+        num_points, sum_1, _, _ = self._table.window_sums(self._start)
+
+        if num_points == 0:
+            return self._unpack(np.full(self.num_assets, np.nan))
+
+        return self._unpack(self._table.shift + sum_1 / num_points)
 
     @property
-    def volatility(self) -> float:
-        return self._time_series.std()
+    def volatility(self) -> float | np.ndarray:
+        num_points, sum_1, sum_2, _ = self._table.window_sums(self._start)
+
+        if num_points < 2:
+            return self._unpack(np.full(self.num_assets, np.nan))
+
+        # sample standard deviation (ddof=1), as pd.Series.std
+        variance = (sum_2 - sum_1**2 / num_points) / (num_points - 1)
+
+        return self._unpack(np.sqrt(np.maximum(variance, 0.0)))
 
     @property
-    def skewness(self) -> float:
-        return self._time_series.skew()
+    def skewness(self) -> float | np.ndarray:
+        num_points, sum_1, sum_2, sum_3 = self._table.window_sums(self._start)
+
+        if num_points < 3:
+            return self._unpack(np.full(self.num_assets, np.nan))
+
+        mean = sum_1 / num_points
+        moment_2 = sum_2 / num_points - mean**2
+        moment_3 = sum_3 / num_points - 3 * mean * sum_2 / num_points + 2 * mean**3
+
+        # bias adjusted sample skewness, as pd.Series.skew
+        adjustment = np.sqrt(num_points * (num_points - 1)) / (num_points - 2)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            skewness = adjustment * moment_3 / moment_2**1.5
+
+        # zero variance up to rounding gives zero skewness, as in pandas
+        return self._unpack(np.where(moment_2 < 1e-14, 0.0, skewness))
+
+    def _remember_fingerprint(self, returns: pd.Series | pd.DataFrame, kind: str) -> None:
+        # cached simulations then key on the file version and window instead of hashing
+        # the returns on every call, safe as long as they cannot be changed in place
+        if not returns.to_numpy().flags.writeable:
+            remember_fingerprint(returns, fingerprint(self.fingerprint, kind))
+
+    def _unpack(self, statistics: np.ndarray) -> float | np.ndarray:
+        return float(statistics[0]) if self.num_assets == 1 else statistics
+
+    def _check_single_asset(self) -> None:
+        if self.num_assets > 1:
+            msg = f"""Historical data holds {self.num_assets} assets, use `frame`
+                        or `allocation_returns` instead"""
+
+            raise ValueError(msg)
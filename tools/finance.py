@@ -1,129 +1,1832 @@
+import hashlib
+import warnings
+from collections import deque
+from collections.abc import Callable, Hashable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from itertools import islice
+from types import ModuleType
+
 import numpy as np
+import numpy.typing as npt
 import pandas as pd
-import streamlit as st
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .cache import LRUCache, ResultCache, cached, fingerprint
+from .scenarios import Scenarios, ScenarioStore, scenario_store
+from .tracing import traced
+
+
+def _iid_indices(rng: np.random.Generator,
+                 num_hist: int,
+                 num_years: int,
+                 num_scenarios: int) -> np.ndarray:
+    """
+    Uniform indices from exactly one 64-bit draw each (unlike `rng.integers`, which
+    buffers and rejects), so drawing years in several calls gives the same indices
+    as drawing them at once. Incremental simulation relies on this.
+    """
+    uniforms = rng.random((num_years, num_scenarios))
+    uniforms *= num_hist
+
+    return uniforms.astype(np.intp)
+
+def _stratified_indices(rng: np.random.Generator,
+                        num_hist: int,
+                        num_years: int,
+                        num_scenarios: int) -> np.ndarray:
+    """
+    Every historical return is used equally often each year. The remainder is drawn
+    without replacement and the result is shuffled across scenarios.
+    """
+    num_repeats, remainder = divmod(num_scenarios, num_hist)
+
+    repeated = np.broadcast_to(np.tile(np.arange(num_hist), num_repeats),
+                               (num_years, num_repeats * num_hist))
+    rest = np.argsort(rng.random((num_years, num_hist)), axis=1)[:, :remainder]
+
+    return rng.permuted(np.concatenate([repeated, rest], axis=1), axis=1)
 
+def _latin_hypercube_indices(rng: np.random.Generator,
+                             num_hist: int,
+                             num_years: int,
+                             num_scenarios: int) -> np.ndarray:
+    """
+    Every year splits [0, 1) into num_scenarios strata with one uniform draw per stratum.
+    Strata are permuted independently per year.
+    """
+    strata = rng.permuted(np.broadcast_to(np.arange(num_scenarios), (num_years, num_scenarios)),
+                          axis=1)
+    uniforms = (strata + rng.random((num_years, num_scenarios))) / num_scenarios
+
+    return (uniforms * num_hist).astype(np.intp)
+
+def _sobol_indices(rng: np.random.Generator,
+                   num_hist: int,
+                   num_years: int,
+                   num_scenarios: int) -> np.ndarray:
+    """
+    Scrambled Sobol points, one dimension per year. Requires scipy.
+    """
+    try:
+        from scipy.stats import qmc
+    except ImportError as e:
+        msg = "Sobol sampling requires scipy to be installed"
+        raise ImportError(msg) from e
 
-def sample(array: np.ndarray | pd.Series, num_samples: int = 1) -> np.ndarray:
+    sobol = qmc.Sobol(d=num_years, scramble=True, seed=rng)
+    # balance properties only hold for powers of two, we take the leading points
+    num_points = 1 << max(num_scenarios - 1, 0).bit_length()
+    uniforms = sobol.random(num_points)[:num_scenarios].T
+
+    return (uniforms * num_hist).astype(np.intp)
+
+# years, of every block of the block bootstrap and on average of the stationary bootstrap
+BLOCK_LENGTH = 5
+
+def _block_indices(rng: np.random.Generator,
+                   num_hist: int,
+                   num_years: int,
+                   num_scenarios: int) -> np.ndarray:
     """
-    Randomly sample values from an array.
+    Circular block bootstrap: runs of BLOCK_LENGTH consecutive historical years from random
+    starts, wrapping around at the end so every year is equally likely. Paths keep the
+    autocorrelation of returns within a block.
     """
-    if isinstance(array, pd.Series):
-        array = array.to_numpy()
+    num_blocks = -(-num_years // BLOCK_LENGTH)
+    starts = _iid_indices(rng, num_hist, num_blocks, num_scenarios)
+    years = np.arange(num_years)
+
+    indices = starts[years // BLOCK_LENGTH]
+    indices += (years % BLOCK_LENGTH)[:, np.newaxis]
+    indices %= num_hist
+
+    return indices
+
+def _stationary_indices(rng: np.random.Generator,
+                        num_hist: int,
+                        num_years: int,
+                        num_scenarios: int) -> np.ndarray:
+    """
+    Stationary bootstrap (Politis and Romano): every year starts a new block at a random
+    historical year with probability 1 / BLOCK_LENGTH and otherwise continues the block,
+    so block lengths are geometric with mean BLOCK_LENGTH.
+    """
+    indices = _iid_indices(rng, num_hist, num_years, num_scenarios)
+    new_blocks = rng.random((num_years, num_scenarios)) < 1 / BLOCK_LENGTH
+
+    # a loop over years, every step is vectorized over scenarios (half the time and memory
+    # of finding the start of every block with a cumulative maximum)
+    for t in range(1, num_years):
+        continued = indices[t - 1] + 1
+        continued[continued == num_hist] = 0
+        np.copyto(indices[t], continued, where=~new_blocks[t])
+
+    return indices
+
+SAMPLERS = {
+    "iid": _iid_indices,
+    "stratified": _stratified_indices,
+    "latin_hypercube": _latin_hypercube_indices,
+    "sobol": _sobol_indices,
+    "antithetic": _iid_indices,
+    "block": _block_indices,
+    "stationary": _stationary_indices,
+}
+
+BACKENDS = ["numpy", "numba"]
+
+# samplers implemented by the fused numba kernels, others always run on NumPy
+_NUMBA_SAMPLERS = {"iid", "antithetic"}
+
+def _numba_kernels(backend: str, sampler: str) -> ModuleType | None:
+    """
+    Kernels of the numba backend if `backend` selects it and it supports `sampler`.
+    None means the NumPy backend, which is also used when numba is not installed.
+    """
+    if backend not in BACKENDS:
+        msg = f"Unknown backend {backend!r}, expected one of {BACKENDS}"
+        raise ValueError(msg)
+
+    if backend == "numpy" or sampler not in _NUMBA_SAMPLERS:
+        return None
+
+    try:
+        from . import finance_numba
+    except ImportError:
+        warnings.warn("numba is not installed, falling back to the NumPy backend",
+                      stacklevel=3)
+        return None
+
+    return finance_numba
+
+def _max_workers(workers: int, backend: str, sampler: str) -> int:
+    """
+    Threads for simulating chunks. The numba kernels already run on all cores and their
+    launches are serialized (see `finance_numba`), so that backend runs chunks in turn.
+    """
+    if _numba_kernels(backend, sampler) is not None:
+        return 1
+
+    return max(workers, 1)
+
+def bootstrap_returns(hist_returns: np.ndarray | pd.Series | pd.DataFrame,
+                      num_years: int,
+                      num_scenarios: int,
+                      mean: float | np.ndarray,
+                      volatility: float | np.ndarray,
+                      rng: np.random.Generator,
+                      out: np.ndarray | None = None,
+                      dtype: npt.DTypeLike = np.float64,
+                      sampler: str = "iid",
+                      backend: str = "numpy") -> np.ndarray:
+    """
+    Bootstrap a (num_years, num_scenarios) matrix of returns.
+    All indices are drawn at once by `sampler` (one of SAMPLERS). Every year (row) is then
+    moment-matched to the target mean and volatility and clipped at -100% in place.
+    The "antithetic" sampler draws half of the scenarios i.i.d. and mirrors them around
+    the target mean.
+    A (num_hist, num_years) `hist_returns` holds one column per simulated year, e.g.
+    returns of an allocation following a glide path (see
+    `HistoricalData.allocation_returns`). Indices then pick the same historical year
+    (row) in every column. `mean` and `volatility` may be per-year arrays.
+    `backend="numba"` draws from a different (counter-based) stream, see `finance_numba`.
+    """
+    if isinstance(hist_returns, pd.Series | pd.DataFrame):
+        hist_returns = hist_returns.to_numpy()
+
+    if hist_returns.ndim == 2 and hist_returns.shape[1] != num_years:
+        msg = f"""Historical returns have {hist_returns.shape[1]} yearly columns,
+                    but {num_years} years are simulated"""
+
+        raise ValueError(msg)
+
+    if out is None:
+        out = np.empty((num_years, num_scenarios), dtype=dtype)
 
-    return np.random.default_rng().choice(array, size=num_samples)
+    kernels = _numba_kernels(backend, sampler)
+    if kernels is not None:
+        return kernels.bootstrap_returns(hist_returns=hist_returns,
+                                         num_years=num_years,
+                                         num_scenarios=num_scenarios,
+                                         mean=mean,
+                                         volatility=volatility,
+                                         rng=rng,
+                                         out=out,
+                                         sampler=sampler)
+
+    num_drawn = (num_scenarios + 1) // 2 if sampler == "antithetic" else num_scenarios
+    drawn = out[:, :num_drawn]
+
+    indices = SAMPLERS[sampler](rng, len(hist_returns), num_years, num_drawn)
+
+    if hist_returns.ndim == 2:
+        # index of row i in the column of year t in the flattened (row-major) array
+        indices *= num_years
+        indices += np.arange(num_years)[:, np.newaxis]
+        hist_returns = hist_returns.ravel()
+
+    # indices are always in range, mode="clip" only avoids an extra buffer
+    np.take(hist_returns.astype(out.dtype, copy=False), indices, out=drawn, mode="clip")
+    del indices
+
+    # targets broadcast over scenarios if given per year
+    if np.ndim(mean) > 0:
+        mean = np.asarray(mean, dtype=out.dtype)[:, np.newaxis]
+    if np.ndim(volatility) > 0:
+        volatility = np.asarray(volatility, dtype=out.dtype)[:, np.newaxis]
+
+    # scale to mean 0, variance 1
+    drawn -= drawn.mean(axis=1, keepdims=True)
+    std = np.sqrt(np.einsum("ij,ij->i", drawn, drawn) / num_drawn)
+    drawn /= std[:, np.newaxis]
+
+    # adjust to target mean and volatility
+    drawn *= volatility
+    drawn += mean
+
+    if sampler == "antithetic":
+        # mirrored returns 2 * mean - r(t) keep the same mean and volatility
+        mirrored = out[:, num_drawn:]
+        np.subtract(2 * mean, drawn[:, :mirrored.shape[1]], out=mirrored)
+
+    # make sure that there are no returns lower than -100%
+    # i.e. we cannot lose more than we had
+    np.clip(out, a_min=-1.0, a_max=None, out=out)
+
+    return out
+
+def glide_path(start_weights: npt.ArrayLike,
+               end_weights: npt.ArrayLike,
+               num_years: int) -> np.ndarray:
+    """
+    Allocation weights moving linearly from `start_weights` in the first simulated year
+    to `end_weights` in the last one, shape (num_years, num_assets).
+    """
+    return np.linspace(np.asarray(start_weights, dtype=np.float64),
+                       np.asarray(end_weights, dtype=np.float64),
+                       num_years)
 
 def simulate_payoffs(hist_returns: pd.Series,
                      num_scenarios: int,
                      start_value: float,
                      mean: float,
-                     volatility: float) -> np.ndarray:
+                     volatility: float,
+                     seed: int | None = None,
+                     sampler: str = "iid",
+                     backend: str = "numpy") -> np.ndarray:
     """
     Simulate next period portfolio increase assuming returns are i.i.d.
     """
-    returns = sample(array=hist_returns, num_samples=num_scenarios)
+    returns = bootstrap_returns(hist_returns=hist_returns,
+                                num_years=1,
+                                num_scenarios=num_scenarios,
+                                mean=mean,
+                                volatility=volatility,
+                                rng=np.random.default_rng(seed),
+                                sampler=sampler,
+                                backend=backend)
 
-    # scale to mean 0, variance 1
-    returns -= returns.mean(keepdims=True)
-    returns /= returns.std(keepdims=True)
+    return start_value * returns[0]
 
-    # adjust to target mean and volatility
-    returns *= volatility
-    returns += mean
+def _simulate_segment(hist_values: np.ndarray | pd.Series,
+                      start_values: float | np.ndarray,
+                      cashflows: np.ndarray,
+                      num_scenarios: int,
+                      mean: float | np.ndarray,
+                      volatility: float | np.ndarray,
+                      rng: np.random.Generator,
+                      dtype: npt.DTypeLike = np.float64,
+                      sampler: str = "iid",
+                      backend: str = "numpy") -> tuple[np.ndarray, np.ndarray]:
+    """
+    Simulate V(t) = V(t-1) * (1 + r(t)) + cashflows[t-1] for len(cashflows) years.
+    Returns two arrays of shape (len(cashflows) + 1, num_scenarios): portfolio values
+    (starting at `start_values`) and portfolio growth V(t-1) * r(t) (zero in row 0).
+    The numba backend fuses bootstrapping and the recurrence into one pass.
+    """
+    kernels = _numba_kernels(backend, sampler)
+    if kernels is not None:
+        if isinstance(hist_values, pd.Series | pd.DataFrame):
+            hist_values = hist_values.to_numpy()
 
-    # make sure that there are no returns lower than -100%
-    # i.e. we cannot lose more than we had
-    returns = np.clip(returns, a_min=-1.0, a_max=None)
+        return kernels.simulate_segment(hist_values=hist_values,
+                                        start_values=start_values,
+                                        cashflows=cashflows,
+                                        num_scenarios=num_scenarios,
+                                        mean=mean,
+                                        volatility=volatility,
+                                        rng=rng,
+                                        dtype=dtype,
+                                        sampler=sampler)
+
+    num_years = len(cashflows)
+    portfolio_values = np.empty((num_years + 1, num_scenarios), dtype=dtype)
+    portfolio_growth = np.empty((num_years + 1, num_scenarios), dtype=dtype)
+    portfolio_values[0, :] = start_values
+    portfolio_growth[0, :] = 0.0
 
-    return start_value * returns
+    # returns are written straight into the growth buffer and scaled in place below
+    bootstrap_returns(hist_returns=hist_values,
+                      num_years=num_years,
+                      num_scenarios=num_scenarios,
+                      mean=mean,
+                      volatility=volatility,
+                      rng=rng,
+                      out=portfolio_growth[1:],
+                      sampler=sampler)
 
-def simulate_portfolio_values(hist_values: pd.Series,
+    _compound(portfolio_values, portfolio_growth, cashflows)
+
+    return portfolio_values, portfolio_growth
+
+def _compound(portfolio_values: np.ndarray,
+              portfolio_growth: np.ndarray,
+              cashflows: np.ndarray) -> None:
+    """
+    V(t) = V(t-1) * (1 + r(t)) + cashflows[t-1] in place, given V(0) in the first row of
+    `portfolio_values` and the returns r(t) in the following rows of `portfolio_growth`,
+    which become V(t-1) * r(t).
+    """
+    for t in range(1, len(cashflows) + 1):
+        np.multiply(portfolio_growth[t], portfolio_values[t - 1], out=portfolio_growth[t])
+        np.add(portfolio_values[t - 1], portfolio_growth[t], out=portfolio_values[t])
+        portfolio_values[t, :] += cashflows[t - 1]
+
+def _yearly_cashflows(years_before_ret: int,
+                      years_after_ret: int,
+                      yearly_installment: float,
+                      yearly_withdrawls: float) -> np.ndarray:
+    return np.concatenate([np.full(years_before_ret, float(yearly_installment)),
+                           np.full(years_after_ret, -float(yearly_withdrawls))])
+
+@traced("finance.simulate")
+def _simulate_paths(hist_values: np.ndarray | pd.Series,
+                    start_value: float,
+                    years_before_ret: int,
+                    years_after_ret: int,
+                    yearly_installment: float,
+                    yearly_withdrawls: float,
+                    num_scenarios: int,
+                    mean: float | np.ndarray,
+                    volatility: float | np.ndarray,
+                    rng: np.random.Generator,
+                    dtype: npt.DTypeLike = np.float64,
+                    sampler: str = "iid",
+                    backend: str = "numpy") -> tuple[np.ndarray, np.ndarray]:
+    """
+    Simulate raw portfolio paths.
+    Returns two arrays of shape (num_years + 1, num_scenarios): portfolio values V(t)
+    and portfolio growth V(t-1) * r(t) (zero in year 0).
+    """
+    cashflows = _yearly_cashflows(years_before_ret=years_before_ret,
+                                  years_after_ret=years_after_ret,
+                                  yearly_installment=yearly_installment,
+                                  yearly_withdrawls=yearly_withdrawls)
+
+    return _simulate_segment(hist_values=hist_values,
+                             start_values=start_value,
+                             cashflows=cashflows,
+                             num_scenarios=num_scenarios,
+                             mean=mean,
+                             volatility=volatility,
+                             rng=rng,
+                             dtype=dtype,
+                             sampler=sampler,
+                             backend=backend)
+
+def _cashflow_metadata(years_before_ret: int,
+                       years_after_ret: int,
+                       yearly_installment: float,
+                       yearly_withdrawls: float) -> dict[str, list[float]]:
+    return {
+        "Invested per year": [0.0] + [yearly_installment] * years_before_ret
+                             + [0.0] * years_after_ret,
+        "Withdrawn per year": [0.0] + [0.0] * years_before_ret
+                              + [yearly_withdrawls] * years_after_ret,
+    }
+
+def simulate_portfolio_values(hist_values: pd.Series | pd.DataFrame,
                               start_value: float,
                               years_before_ret: int,
                               years_after_ret: int,
                               yearly_installment: float,
                               yearly_withdrawls: float,
                               num_scenarios: int,
-                              mean: float,
-                              volatility: float) -> tuple[pd.DataFrame, dict[str, list[float]]]:
+                              mean: float | np.ndarray,
+                              volatility: float | np.ndarray,
+                              seed: int | None = None,
+                              dtype: npt.DTypeLike = np.float64,
+                              sampler: str = "iid",
+                              backend: str = "numpy",
+                              ) -> tuple[pd.DataFrame, dict[str, list[float]]]:
     """
     Simulate portfolio value V(t).
     If t <= years_before_ret, then V(t) = V(t-1) * (1 + r(t)) + yearly_installment.
     If t > years_before_ret, then V(t-1) * (1 + r(t)) - yearly_withdrawl.
     In words, we invest fixed amount each year before retirement.
     Once retired, we only withdraw from our account (but still earn interest).
+    Passing a `seed` makes the simulation reproducible.
     """
-    num_years = years_before_ret + years_after_ret
-    portfolio_values = np.zeros((num_years + 1, num_scenarios))
-    portfolio_values[0, :] = start_value
+    values, growth = _simulate_paths(hist_values=hist_values,
+                                     start_value=start_value,
+                                     years_before_ret=years_before_ret,
+                                     years_after_ret=years_after_ret,
+                                     yearly_installment=yearly_installment,
+                                     yearly_withdrawls=yearly_withdrawls,
+                                     num_scenarios=num_scenarios,
+                                     mean=mean,
+                                     volatility=volatility,
+                                     rng=np.random.default_rng(seed),
+                                     dtype=dtype,
+                                     sampler=sampler,
+                                     backend=backend)
+
+    cashflows = _cashflow_metadata(years_before_ret=years_before_ret,
+                                   years_after_ret=years_after_ret,
+                                   yearly_installment=yearly_installment,
+                                   yearly_withdrawls=yearly_withdrawls)
 
     metadata = {
-        "Invested per year": [0.0],
-        "Mean earnings per year": [0.0],
-        "Median earnings per year": [0.0],
-        "Withdrawn per year": [0.0],
+        "Invested per year": cashflows["Invested per year"],
+        "Mean earnings per year": growth.mean(axis=1).tolist(),
+        "Median earnings per year": np.median(growth, axis=1).tolist(),
+        "Withdrawn per year": cashflows["Withdrawn per year"],
     }
 
-    for t in range(1, num_years + 1):
-        portfolio_growth = simulate_payoffs(hist_returns=hist_values,
-                                                   num_scenarios=num_scenarios,
-                                                   start_value=portfolio_values[t - 1, :],
-                                                   mean=mean,
-                                                   volatility=volatility)
+    portfolio_values = pd.DataFrame(values)
+    portfolio_values.index.name = "Year"
 
-        metadata["Mean earnings per year"].append(np.mean(portfolio_growth))
-        metadata["Median earnings per year"].append(np.median(portfolio_growth))
+    return portfolio_values, metadata
 
-        portfolio_values[t, :] = portfolio_values[t - 1, :] + portfolio_growth
+class QuantileSketch:
+    """
+    Mergeable quantile summary for many rows (years) at once.
+    Every row keeps at most `num_centroids` weighted centroids, each covering an equal
+    share of the total weight (a simplified t-digest with uniform cluster sizes),
+    so memory does not grow with the number of values folded in.
+    """
 
-        if t <= years_before_ret:
-            portfolio_values[t, :] += yearly_installment
-            metadata["Invested per year"].append(yearly_installment)
-            metadata["Withdrawn per year"].append(0.0)
-        else:
-            portfolio_values[t, :] -= yearly_withdrawls
-            metadata["Invested per year"].append(0.0)
-            metadata["Withdrawn per year"].append(yearly_withdrawls)
+    def __init__(self, num_rows: int, num_centroids: int = 1_000):
+        self.num_centroids = num_centroids
+        self._means = np.empty((num_rows, 0))
+        self._weights = np.empty((num_rows, 0))
 
-    portfolio_values = pd.DataFrame(portfolio_values)
-    portfolio_values.index.name = "Year"
+    @property
+    def total_weight(self) -> float:
+        return self._weights[0].sum() if self._weights.size else 0.0
 
-    return portfolio_values, metadata
+    @property
+    def nbytes(self) -> int:
+        return self._means.nbytes + self._weights.nbytes
 
-@st.cache_data
-def simulate_and_stats(hist_values: pd.Series,
-                       start_value: float,
-                       years_before_ret: int,
-                       years_after_ret: int,
-                       yearly_installment: float,
-                       yearly_withdrawls: float,
-                       num_scenarios: int,
-                       mean: float,
-                       volatility: float) -> pd.DataFrame:
+    def take_rows(self, rows: slice) -> "QuantileSketch":
+        sketch = QuantileSketch(0, self.num_centroids)
+        sketch._means = self._means[rows]
+        sketch._weights = self._weights[rows]
+
+        return sketch
+
+    @staticmethod
+    def stack(sketches: list["QuantileSketch"]) -> "QuantileSketch":
+        """
+        Stack sketches of the same values (e.g. consecutive years) row-wise.
+        """
+        sketches = [part for part in sketches if len(part._means)] or sketches[:1]
+        sketch = QuantileSketch(0, sketches[0].num_centroids)
+        sketch._means = np.concatenate([part._means for part in sketches])
+        sketch._weights = np.concatenate([part._weights for part in sketches])
+
+        return sketch
+
+    def update(self, values: np.ndarray) -> None:
+        """
+        Fold a (num_rows, num_values) array of unit-weight values into the sketch.
+        """
+        self._fold(values, np.ones_like(values))
+
+    def merge(self, other: "QuantileSketch") -> None:
+        self._fold(other._means, other._weights)
+
+    def _fold(self, means: np.ndarray, weights: np.ndarray) -> None:
+        if not len(means):  # no years, e.g. an empty segment after retirement
+            return
+
+        means = np.concatenate([self._means, means], axis=1)
+        weights = np.concatenate([self._weights, weights], axis=1)
+
+        order = np.argsort(means, axis=1)
+        means = np.take_along_axis(means, order, axis=1)
+        weights = np.take_along_axis(weights, order, axis=1)
+
+        # every row holds the same total weight (one unit per scenario)
+        total_weight = weights[0].sum()
+        num_rows = means.shape[0]
+
+        # assign each centroid to the equal-weight bucket in which it starts
+        weight_before = np.cumsum(weights, axis=1) - weights
+        buckets = (weight_before / total_weight * self.num_centroids).astype(np.intp)
+        np.minimum(buckets, self.num_centroids - 1, out=buckets)
+        buckets += np.arange(num_rows)[:, np.newaxis] * self.num_centroids
+
+        size = num_rows * self.num_centroids
+        bucket_weights = np.bincount(buckets.ravel(), weights=weights.ravel(), minlength=size)
+        bucket_sums = np.bincount(buckets.ravel(), weights=(means * weights).ravel(),
+                                  minlength=size)
+
+        self._weights = bucket_weights.reshape(num_rows, self.num_centroids)
+        self._means = np.divide(bucket_sums.reshape(num_rows, self.num_centroids),
+                                self._weights,
+                                out=np.zeros_like(self._weights),
+                                where=self._weights > 0)
+
+    def quantile(self, q: float) -> np.ndarray:
+        """
+        Interpolated q-quantile of every row.
+        Matches linear interpolation of `np.quantile` while values are uncompressed.
+        """
+        result = np.empty(self._means.shape[0])
+
+        for row, (row_means, row_weights) in enumerate(zip(self._means, self._weights,
+                                                            strict=True)):
+            non_empty = row_weights > 0
+            means, weights = row_means[non_empty], row_weights[non_empty]
+            midpoints = np.cumsum(weights) - weights / 2
+            target = 0.5 + q * (weights.sum() - 1)
+            result[row] = np.interp(target, midpoints, means)
+
+        return result
+
+class _PathTracker:
     """
-    Simulate portfolio values and compute statistics on them.
+    Path-dependent state of every scenario, folded one year at a time: the running peak
+    of the portfolio value, the maximum drawdown from it so far and whether the
+    portfolio has been ruined (had a negative value) before.
+    """
+
+    def __init__(self, shape: int | tuple[int, ...]):
+        self.peaks = np.full(shape, -np.inf)
+        self.max_drawdowns = np.zeros(shape)
+        self.ruined = np.zeros(shape, dtype=bool)
+
+    @property
+    def nbytes(self) -> int:
+        return self.peaks.nbytes + self.max_drawdowns.nbytes + self.ruined.nbytes
+
+    def copy(self) -> "_PathTracker":
+        tracker = _PathTracker(0)
+        tracker.peaks = self.peaks.copy()
+        tracker.max_drawdowns = self.max_drawdowns.copy()
+        tracker.ruined = self.ruined.copy()
+
+        return tracker
+
+    def update(self, values: np.ndarray) -> np.ndarray:
+        """
+        Fold the portfolio values of the next year.
+        Returns the number of scenarios (along the last axis) ruined for the first time.
+        """
+        np.maximum(self.peaks, values, out=self.peaks)
+
+        # drawdown from the running peak, 100% once the portfolio is depleted
+        drawdowns = np.divide(values, self.peaks,
+                              out=np.ones_like(self.peaks),
+                              where=self.peaks > 0)
+        np.subtract(1.0, drawdowns, out=drawdowns)
+        np.clip(drawdowns, 0.0, 1.0, out=drawdowns)
+        np.maximum(self.max_drawdowns, drawdowns, out=self.max_drawdowns)
+
+        ruined = values < 0
+        first_ruins = np.count_nonzero(ruined & ~self.ruined, axis=-1)
+        self.ruined |= ruined
+
+        return first_ruins
+
+class StreamingStats:
     """
-    scenarios, metadata = simulate_portfolio_values(hist_values=hist_values,
-                                                    start_value=start_value,
-                                                    years_before_ret=years_before_ret,
-                                                    years_after_ret=years_after_ret,
-                                                    yearly_installment=yearly_installment,
-                                                    yearly_withdrawls=yearly_withdrawls,
-                                                    num_scenarios=num_scenarios,
-                                                    mean=mean,
-                                                    volatility=volatility)
+    Per-year statistics folded chunk by chunk from simulated portfolio paths.
+    """
+
+    def __init__(self, num_years: int, num_centroids: int = 1_000):
+        self.num_scenarios = 0
+        self._value_sums = np.zeros(num_years + 1)
+        self._growth_sums = np.zeros(num_years + 1)
+        self._ruin_counts = np.zeros(num_years + 1, dtype=np.int64)
+        self._first_ruin_counts = np.zeros(num_years + 1, dtype=np.int64)
+        self._values = QuantileSketch(num_years + 1, num_centroids)
+        self._growth = QuantileSketch(num_years + 1, num_centroids)
+        self._drawdowns = QuantileSketch(num_years + 1, num_centroids)
+
+    def update(self,
+               values: np.ndarray,
+               growth: np.ndarray,
+               tracker: _PathTracker | None = None) -> None:
+        """
+        Fold a chunk of paths, both arrays of shape (num_years + 1, chunk_size).
+        `tracker` carries path-dependent state over from earlier years of the same
+        scenarios and is updated in place.
+        """
+        if tracker is None:
+            tracker = _PathTracker(values.shape[1])
+
+        max_drawdowns = np.empty(values.shape)
+        for t, year_values in enumerate(values):
+            self._first_ruin_counts[t] += tracker.update(year_values)
+            max_drawdowns[t] = tracker.max_drawdowns
+
+        self.num_scenarios += values.shape[1]
+        self._value_sums += values.sum(axis=1)
+        self._growth_sums += growth.sum(axis=1)
+        self._ruin_counts += (values < 0).sum(axis=1)
+        self._values.update(values)
+        self._growth.update(growth)
+        self._drawdowns.update(max_drawdowns)
+
+    def merge(self, other: "StreamingStats") -> None:
+        self.num_scenarios += other.num_scenarios
+        self._value_sums += other._value_sums
+        self._growth_sums += other._growth_sums
+        self._ruin_counts += other._ruin_counts
+        self._first_ruin_counts += other._first_ruin_counts
+        self._values.merge(other._values)
+        self._growth.merge(other._growth)
+        self._drawdowns.merge(other._drawdowns)
+
+    @property
+    def num_rows(self) -> int:
+        return len(self._value_sums)
+
+    @property
+    def nbytes(self) -> int:
+        return (self._value_sums.nbytes + self._growth_sums.nbytes + self._ruin_counts.nbytes
+                + self._first_ruin_counts.nbytes + self._values.nbytes + self._growth.nbytes
+                + self._drawdowns.nbytes)
+
+    def take_rows(self, rows: slice) -> "StreamingStats":
+        stats = StreamingStats(-1, self._values.num_centroids)
+        stats.num_scenarios = self.num_scenarios
+        stats._value_sums = self._value_sums[rows]
+        stats._growth_sums = self._growth_sums[rows]
+        stats._ruin_counts = self._ruin_counts[rows]
+        stats._first_ruin_counts = self._first_ruin_counts[rows]
+        stats._values = self._values.take_rows(rows)
+        stats._growth = self._growth.take_rows(rows)
+        stats._drawdowns = self._drawdowns.take_rows(rows)
+
+        return stats
+
+    @staticmethod
+    def stack(parts: list["StreamingStats"]) -> "StreamingStats":
+        """
+        Stack statistics of consecutive years of the same scenarios.
+        """
+        parts = [part for part in parts if part.num_rows] or parts[:1]
+        stats = StreamingStats(-1, parts[0]._values.num_centroids)
+        stats.num_scenarios = parts[0].num_scenarios
+        stats._value_sums = np.concatenate([part._value_sums for part in parts])
+        stats._growth_sums = np.concatenate([part._growth_sums for part in parts])
+        stats._ruin_counts = np.concatenate([part._ruin_counts for part in parts])
+        stats._first_ruin_counts = np.concatenate([part._first_ruin_counts for part in parts])
+        stats._values = QuantileSketch.stack([part._values for part in parts])
+        stats._growth = QuantileSketch.stack([part._growth for part in parts])
+        stats._drawdowns = QuantileSketch.stack([part._drawdowns for part in parts])
 
+        return stats
+
+    @property
+    def mean(self) -> np.ndarray:
+        return self._value_sums / self.num_scenarios
+
+    @property
+    def mean_growth(self) -> np.ndarray:
+        return self._growth_sums / self.num_scenarios
+
+    @property
+    def ruin_counts(self) -> np.ndarray:
+        """
+        Number of scenarios with a negative portfolio value, per year.
+        """
+        return self._ruin_counts
+
+    @property
+    def first_ruin_counts(self) -> np.ndarray:
+        """
+        Number of scenarios with a negative portfolio value for the first time, per year.
+        """
+        return self._first_ruin_counts
+
+    def quantile(self, q: float) -> np.ndarray:
+        return self._values.quantile(q)
+
+    def growth_quantile(self, q: float) -> np.ndarray:
+        return self._growth.quantile(q)
+
+    def drawdown_quantile(self, q: float) -> np.ndarray:
+        """
+        q-quantile of the maximum drawdown up to every year.
+        """
+        return self._drawdowns.quantile(q)
+
+def _risk_columns(num_scenarios: int,
+                  ruin_counts: np.ndarray,
+                  first_ruin_counts: np.ndarray,
+                  drawdown_quantile: Callable[[float], np.ndarray]) -> dict[str, np.ndarray]:
+    return {
+        "Probability of ruin": ruin_counts / num_scenarios,
+        # distribution of the time to ruin
+        "Probability of first ruin": first_ruin_counts / num_scenarios,
+        "Max drawdown median": drawdown_quantile(0.5),
+        "Max drawdown percentile 95": drawdown_quantile(0.95),
+    }
+
+def _stats_frame(mean: np.ndarray,
+                 quantile: Callable[[float], np.ndarray],
+                 metadata: dict[str, list[float]],
+                 risk: dict[str, np.ndarray]) -> pd.DataFrame:
     stats = pd.DataFrame({
-        "Mean": scenarios.mean(axis=1),
-        "Median": scenarios.median(axis=1),
-        "Percentile 5": scenarios.quantile(0.05, axis=1),
-        "Percentile 25": scenarios.quantile(0.25, axis=1),
-        "Percentile 75": scenarios.quantile(0.75, axis=1),
-        "Percentile 95": scenarios.quantile(0.95, axis=1),
+        "Mean": mean,
+        "Median": quantile(0.5),
+        "Percentile 5": quantile(0.05),
+        "Percentile 25": quantile(0.25),
+        "Percentile 75": quantile(0.75),
+        "Percentile 95": quantile(0.95),
         "Total invested": np.cumsum(metadata["Invested per year"]),
         "Total withdrawn": np.cumsum(metadata["Withdrawn per year"]),
         "Total mean return": np.cumsum(metadata["Mean earnings per year"]),
         "Total median return": np.cumsum(metadata["Median earnings per year"]),
         **metadata,
+        **risk,
     })
+    stats.index.name = "Year"
+
+    return stats
+
+@dataclass
+class _Checkpoint:
+    """
+    State of one chunk of scenarios after simulating some years: the portfolio values,
+    path-dependent state and generator state at the last year, plus statistics of the
+    simulated years.
+    """
+
+    values: np.ndarray
+    tracker: _PathTracker
+    rng_state: dict
+    stats: StreamingStats
+
+    @property
+    def num_years(self) -> int:
+        return self.stats.num_rows
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + self.tracker.nbytes + self.stats.nbytes
+
+# checkpoints at retirement (prefix) and at the end of the horizon (suffix) per chunk
+_checkpoints = LRUCache(max_bytes=256 * 2**20, sizeof=lambda checkpoint: checkpoint.nbytes)
+
+# finished results of the public simulate_* functions, see `configure_result_cache`
+result_cache = ResultCache(max_bytes=64 * 2**20)
+
+def configure_result_cache(max_bytes: int,
+                           disk_path: str | None = None,
+                           disk_max_bytes: int = 1024 * 2**20) -> None:
+    """
+    Bound the in-memory result cache and optionally share results between processes
+    through a sqlite file at `disk_path`.
+    """
+    result_cache.configure(max_bytes=max_bytes,
+                           disk_path=disk_path,
+                           disk_max_bytes=disk_max_bytes)
+
+# samplers whose draws for consecutive years can be split over several generator calls
+_INCREMENTAL_SAMPLERS = {"iid", "antithetic"}
+
+def _is_incremental(seed: int | None,
+                    sampler: str,
+                    backend: str,
+                    hist_values: pd.Series | pd.DataFrame,
+                    mean: float | np.ndarray,
+                    volatility: float | np.ndarray) -> bool:
+    # checkpoints split the horizon, so per-year returns or targets are simulated in full,
+    # and the counter-based streams of the numba backend restart at every segment
+    return (seed is not None
+            and sampler in _INCREMENTAL_SAMPLERS
+            and backend == "numpy"
+            and hist_values.ndim == 1
+            and np.ndim(mean) == 0
+            and np.ndim(volatility) == 0)
+
+def _simulate_checkpoint(checkpoint: _Checkpoint,
+                         cashflows: np.ndarray,
+                         num_centroids: int,
+                         **segment_kwargs: object) -> _Checkpoint:
+    """
+    Continue a checkpoint by len(cashflows) years. Statistics cover the new years only.
+    """
+    rng = np.random.default_rng()
+    rng.bit_generator.state = checkpoint.rng_state
+    # cached checkpoints stay untouched
+    tracker = checkpoint.tracker.copy()
+
+    values, growth = _simulate_segment(**segment_kwargs,
+                                       start_values=checkpoint.values,
+                                       cashflows=cashflows,
+                                       num_scenarios=len(checkpoint.values),
+                                       rng=rng)
+
+    stats = StreamingStats(len(cashflows) - 1, num_centroids)
+    stats.update(values[1:], growth[1:], tracker)
+
+    return _Checkpoint(values=values[-1].copy(),
+                       tracker=tracker,
+                       rng_state=rng.bit_generator.state,
+                       stats=stats)
+
+def _simulate_chunk_stats_incremental(chunk_size: int,
+                                      seed_sequence: np.random.SeedSequence,
+                                      num_centroids: int,
+                                      hist_values: np.ndarray,
+                                      start_value: float,
+                                      years_before_ret: int,
+                                      years_after_ret: int,
+                                      yearly_installment: float,
+                                      yearly_withdrawls: float,
+                                      **segment_kwargs: object) -> StreamingStats:
+    """
+    Same as `_simulate_chunk_stats`, but reuses checkpoints at retirement and at the end
+    of the horizon. Changing only post-retirement parameters simulates just the years
+    after retirement, and a longer retirement extends the previous run.
+    Draws for consecutive years compose exactly, so results equal a full simulation.
+    """
+    segment_kwargs = {"hist_values": hist_values, **segment_kwargs}
+    prefix_key = (hashlib.blake2b(hist_values.tobytes(), digest_size=16).digest(),
+                  tuple(sorted((name, str(value)) for name, value in segment_kwargs.items()
+                               if name != "hist_values")),
+                  start_value, years_before_ret, yearly_installment,
+                  num_centroids, chunk_size, seed_sequence.entropy, seed_sequence.spawn_key)
+
+    prefix = _checkpoints.get(prefix_key)
+    if prefix is None:
+        rng = np.random.default_rng(seed_sequence)
+        tracker = _PathTracker(chunk_size)
+
+        # year 0 is part of the prefix statistics
+        values, growth = _simulate_segment(**segment_kwargs,
+                                           start_values=float(start_value),
+                                           cashflows=np.full(years_before_ret,
+                                                             float(yearly_installment)),
+                                           num_scenarios=chunk_size,
+                                           rng=rng)
+        stats = StreamingStats(years_before_ret, num_centroids)
+        stats.update(values, growth, tracker)
+
+        prefix = _Checkpoint(values=values[-1].copy(),
+                             tracker=tracker,
+                             rng_state=rng.bit_generator.state,
+                             stats=stats)
+        _checkpoints.put(prefix_key, prefix)
+
+    suffix_key = (prefix_key, yearly_withdrawls)
+    suffix = _checkpoints.get(suffix_key)
+    if suffix is None or suffix.num_years < years_after_ret:
+        start = suffix or _Checkpoint(values=prefix.values,
+                                      tracker=prefix.tracker,
+                                      rng_state=prefix.rng_state,
+                                      stats=StreamingStats(-1, num_centroids))
+        extension = _simulate_checkpoint(start,
+                                         cashflows=np.full(years_after_ret - start.num_years,
+                                                           -float(yearly_withdrawls)),
+                                         num_centroids=num_centroids,
+                                         **segment_kwargs)
+        suffix = _Checkpoint(values=extension.values,
+                             tracker=extension.tracker,
+                             rng_state=extension.rng_state,
+                             stats=StreamingStats.stack([start.stats, extension.stats]))
+        _checkpoints.put(suffix_key, suffix)
+
+    return StreamingStats.stack([prefix.stats, suffix.stats.take_rows(slice(years_after_ret))])
+
+@traced("finance.simulate_chunk")
+def _simulate_chunk_stats(chunk_size: int,
+                          seed_sequence: np.random.SeedSequence,
+                          num_centroids: int,
+                          dtype: npt.DTypeLike,
+                          incremental: bool = False,
+                          **simulation_kwargs: object) -> StreamingStats:
+    if incremental:
+        return _simulate_chunk_stats_incremental(chunk_size=chunk_size,
+                                                 seed_sequence=seed_sequence,
+                                                 num_centroids=num_centroids,
+                                                 dtype=dtype,
+                                                 **simulation_kwargs)
+
+    values, growth = _simulate_paths(**simulation_kwargs,
+                                     num_scenarios=chunk_size,
+                                     rng=np.random.default_rng(seed_sequence),
+                                     dtype=dtype)
+
+    stats = StreamingStats(values.shape[0] - 1, num_centroids)
+    stats.update(values, growth)
+
+    return stats
+
+@traced("finance.statistics")
+def _streaming_stats_frame(streaming_stats: StreamingStats,
+                           years_before_ret: int,
+                           years_after_ret: int,
+                           yearly_installment: float,
+                           yearly_withdrawls: float) -> pd.DataFrame:
+    cashflows = _cashflow_metadata(years_before_ret=years_before_ret,
+                                   years_after_ret=years_after_ret,
+                                   yearly_installment=yearly_installment,
+                                   yearly_withdrawls=yearly_withdrawls)
+
+    metadata = {
+        "Invested per year": cashflows["Invested per year"],
+        "Mean earnings per year": streaming_stats.mean_growth.tolist(),
+        "Median earnings per year": streaming_stats.growth_quantile(0.5).tolist(),
+        "Withdrawn per year": cashflows["Withdrawn per year"],
+    }
+
+    risk = _risk_columns(num_scenarios=streaming_stats.num_scenarios,
+                         ruin_counts=streaming_stats.ruin_counts,
+                         first_ruin_counts=streaming_stats.first_ruin_counts,
+                         drawdown_quantile=streaming_stats.drawdown_quantile)
+
+    return _stats_frame(mean=streaming_stats.mean,
+                        quantile=streaming_stats.quantile,
+                        metadata=metadata,
+                        risk=risk)
+
+@traced("finance.statistics")
+def _paths_stats_frame(values: np.ndarray,
+                       growth: np.ndarray,
+                       years_before_ret: int,
+                       years_after_ret: int,
+                       yearly_installment: float,
+                       yearly_withdrawls: float) -> pd.DataFrame:
+    """
+    Exact statistics of simulated paths in a single pass over the years.
+    Every year takes one multi-q `np.quantile` of the values, one of the running maximum
+    drawdowns and a median of the growth. No frame of all paths is built.
+    """
+    quantiles = [0.05, 0.25, 0.5, 0.75, 0.95]
+    drawdown_quantiles = [0.5, 0.95]
+
+    value_quantiles = np.quantile(values, quantiles, axis=1)
+
+    tracker = _PathTracker(values.shape[1])
+    first_ruin_counts = np.empty(len(values), dtype=np.int64)
+    max_drawdown_quantiles = np.empty((len(drawdown_quantiles), len(values)))
+
+    for t, year_values in enumerate(values):
+        first_ruin_counts[t] = tracker.update(year_values)
+        max_drawdown_quantiles[:, t] = np.quantile(tracker.max_drawdowns, drawdown_quantiles)
+
+    cashflows = _cashflow_metadata(years_before_ret=years_before_ret,
+                                   years_after_ret=years_after_ret,
+                                   yearly_installment=yearly_installment,
+                                   yearly_withdrawls=yearly_withdrawls)
+
+    metadata = {
+        "Invested per year": cashflows["Invested per year"],
+        "Mean earnings per year": growth.mean(axis=1).tolist(),
+        "Median earnings per year": np.median(growth, axis=1).tolist(),
+        "Withdrawn per year": cashflows["Withdrawn per year"],
+    }
+
+    risk = _risk_columns(
+        num_scenarios=values.shape[1],
+        ruin_counts=np.count_nonzero(values < 0, axis=1),
+        first_ruin_counts=first_ruin_counts,
+        drawdown_quantile=lambda q: max_drawdown_quantiles[drawdown_quantiles.index(q)])
+
+    return _stats_frame(mean=values.mean(axis=1),
+                        quantile=lambda q: value_quantiles[quantiles.index(q)],
+                        metadata=metadata,
+                        risk=risk)
+
+def _chunk_sizes(num_scenarios: int, chunk_size: int) -> list[int]:
+    """
+    Sizes of the fewest chunks of at most `chunk_size` scenarios, differing by one at most.
+    Every chunk is moment-matched on its own, so a small remainder chunk would skew
+    its scenarios (and a single one has no volatility to match).
+    """
+    num_chunks = -(-num_scenarios // chunk_size)
+    base_size, num_larger = divmod(num_scenarios, num_chunks)
+
+    return [base_size + 1] * num_larger + [base_size] * (num_chunks - num_larger)
+
+def simulate_streaming_stats(hist_values: pd.Series | pd.DataFrame,
+                             start_value: float,
+                             years_before_ret: int,
+                             years_after_ret: int,
+                             yearly_installment: float,
+                             yearly_withdrawls: float,
+                             num_scenarios: int,
+                             mean: float | np.ndarray,
+                             volatility: float | np.ndarray,
+                             chunk_size: int,
+                             num_centroids: int = 1_000,
+                             seed: int | None = None,
+                             dtype: npt.DTypeLike = np.float64,
+                             workers: int = 1,
+                             sampler: str = "iid",
+                             backend: str = "numpy") -> StreamingStats:
+    """
+    Simulate portfolio paths in chunks of `chunk_size` scenarios and fold every chunk
+    into online per-year statistics. Peak memory is bounded by the chunk size
+    (times the number of workers).
+    Every chunk draws from its own stream spawned from `seed` and chunk statistics
+    are merged in chunk order, so the result does not depend on `workers`.
+    Seeded runs keep per-chunk checkpoints at retirement and at the end of the horizon,
+    so reruns that only change post-retirement parameters skip the years before it.
+    """
+    chunk_sizes = _chunk_sizes(num_scenarios, chunk_size)
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+
+    simulate_chunk = partial(_simulate_chunk_stats,
+                             num_centroids=num_centroids,
+                             dtype=dtype,
+                             incremental=_is_incremental(seed, sampler, backend, hist_values,
+                                                         mean, volatility),
+                             hist_values=hist_values.to_numpy(),
+                             start_value=start_value,
+                             years_before_ret=years_before_ret,
+                             years_after_ret=years_after_ret,
+                             yearly_installment=yearly_installment,
+                             yearly_withdrawls=yearly_withdrawls,
+                             mean=mean,
+                             volatility=volatility,
+                             sampler=sampler,
+                             backend=backend)
+
+    stats = StreamingStats(years_before_ret + years_after_ret, num_centroids)
+
+    # NumPy releases the GIL in the heavy kernels (gather, arithmetic, sorting),
+    # so a thread pool is enough to keep several cores busy
+    with ThreadPoolExecutor(max_workers=_max_workers(workers, backend, sampler)) as executor:
+        for chunk_stats in executor.map(simulate_chunk, chunk_sizes, seed_sequences):
+            stats.merge(chunk_stats)
 
     return stats
+
+@cached(result_cache, ignore=("workers",))
+def simulate_and_stats(hist_values: pd.Series | pd.DataFrame,
+                       start_value: float,
+                       years_before_ret: int,
+                       years_after_ret: int,
+                       yearly_installment: float,
+                       yearly_withdrawls: float,
+                       num_scenarios: int,
+                       mean: float | np.ndarray,
+                       volatility: float | np.ndarray,
+                       chunk_size: int | None = None,
+                       seed: int | None = None,
+                       dtype: npt.DTypeLike = np.float64,
+                       workers: int = 1,
+                       sampler: str = "iid",
+                       backend: str = "numpy") -> pd.DataFrame:
+    """
+    Simulate portfolio values and compute statistics on them.
+    If `chunk_size` is given, scenarios are simulated in chunks and percentiles
+    are estimated with a mergeable sketch instead of keeping all paths in memory.
+    Chunks are then spread over `workers` threads.
+    `dtype=np.float32` halves memory use of the simulated paths.
+    `sampler` selects a variance reduction scheme, see `bootstrap_returns`.
+    """
+    if chunk_size is None:
+        values, growth = _simulate_paths(hist_values=hist_values,
+                                         start_value=start_value,
+                                         years_before_ret=years_before_ret,
+                                         years_after_ret=years_after_ret,
+                                         yearly_installment=yearly_installment,
+                                         yearly_withdrawls=yearly_withdrawls,
+                                         num_scenarios=num_scenarios,
+                                         mean=mean,
+                                         volatility=volatility,
+                                         rng=np.random.default_rng(seed),
+                                         dtype=dtype,
+                                         sampler=sampler,
+                                         backend=backend)
+
+        return _paths_stats_frame(values=values,
+                                  growth=growth,
+                                  years_before_ret=years_before_ret,
+                                  years_after_ret=years_after_ret,
+                                  yearly_installment=yearly_installment,
+                                  yearly_withdrawls=yearly_withdrawls)
+
+    streaming_stats = simulate_streaming_stats(hist_values=hist_values,
+                                               start_value=start_value,
+                                               years_before_ret=years_before_ret,
+                                               years_after_ret=years_after_ret,
+                                               yearly_installment=yearly_installment,
+                                               yearly_withdrawls=yearly_withdrawls,
+                                               num_scenarios=num_scenarios,
+                                               mean=mean,
+                                               volatility=volatility,
+                                               chunk_size=chunk_size,
+                                               seed=seed,
+                                               dtype=dtype,
+                                               workers=workers,
+                                               sampler=sampler,
+                                               backend=backend)
+
+    return _streaming_stats_frame(streaming_stats=streaming_stats,
+                                  years_before_ret=years_before_ret,
+                                  years_after_ret=years_after_ret,
+                                  yearly_installment=yearly_installment,
+                                  yearly_withdrawls=yearly_withdrawls)
+
+def rolling_returns(hist_returns: np.ndarray | pd.Series | pd.DataFrame,
+                    num_years: int) -> np.ndarray:
+    """
+    Returns of every run of `num_years` consecutive historical years, shape
+    (num_years, num_windows) with a column per starting year. A view of `hist_returns`,
+    nothing is copied. A (num_hist, num_years) history takes year t of every run from
+    column t, as in `bootstrap_returns`.
+    """
+    if isinstance(hist_returns, pd.Series | pd.DataFrame):
+        hist_returns = hist_returns.to_numpy()
+
+    if hist_returns.ndim == 2 and hist_returns.shape[1] != num_years:
+        msg = f"""Historical returns have {hist_returns.shape[1]} yearly columns,
+                    but {num_years} years are simulated"""
+
+        raise ValueError(msg)
+
+    if len(hist_returns) < num_years:
+        msg = (f"Backtesting {num_years} years needs as many historical years, "
+               f"not {len(hist_returns)}")
+        raise ValueError(msg)
+
+    windows = sliding_window_view(hist_returns, num_years, axis=0)
+
+    if hist_returns.ndim == 2:
+        # windows[s, t, k] is row s + k of column t, year t of run s is on the diagonal
+        return np.diagonal(windows, axis1=1, axis2=2).T
+
+    return windows.T
+
+@traced("finance.backtest")
+def _backtest_paths(hist_values: np.ndarray | pd.Series | pd.DataFrame,
+                    start_value: float,
+                    cashflows: np.ndarray,
+                    mean: float | np.ndarray | None,
+                    volatility: float | np.ndarray | None,
+                    dtype: npt.DTypeLike) -> tuple[np.ndarray, np.ndarray]:
+    windows = rolling_returns(hist_values, len(cashflows))
+
+    portfolio_values = np.empty((len(cashflows) + 1, windows.shape[1]), dtype=dtype)
+    portfolio_growth = np.empty_like(portfolio_values)
+    portfolio_values[0, :] = start_value
+    portfolio_growth[0, :] = 0.0
+    returns = portfolio_growth[1:]
+    returns[:] = windows
+
+    if mean is not None or volatility is not None:
+        # the whole history is shifted and scaled, so the sequences keep their shape
+        hist_values = np.asarray(hist_values, dtype=np.float64)
+        hist_mean = hist_values.mean(axis=0)
+        hist_volatility = hist_values.std(axis=0, ddof=1)
+
+        if hist_values.ndim == 2:
+            hist_mean = hist_mean[:, np.newaxis]
+            hist_volatility = hist_volatility[:, np.newaxis]
+        if np.ndim(mean) > 0:
+            mean = np.asarray(mean)[:, np.newaxis]
+        if np.ndim(volatility) > 0:
+            volatility = np.asarray(volatility)[:, np.newaxis]
+
+        returns -= hist_mean
+        if volatility is not None:
+            returns *= volatility / hist_volatility
+        returns += hist_mean if mean is None else mean
+
+        np.clip(returns, a_min=-1.0, a_max=None, out=returns)
+
+    _compound(portfolio_values, portfolio_growth, cashflows)
+
+    return portfolio_values, portfolio_growth
+
+@cached(result_cache)
+def backtest_and_stats(hist_values: pd.Series | pd.DataFrame,
+                       start_value: float,
+                       years_before_ret: int,
+                       years_after_ret: int,
+                       yearly_installment: float,
+                       yearly_withdrawls: float,
+                       mean: float | np.ndarray | None = None,
+                       volatility: float | np.ndarray | None = None,
+                       dtype: npt.DTypeLike = np.float64) -> pd.DataFrame:
+    """
+    Historical backtest: the cash flows of `simulate_and_stats` applied to every run of
+    consecutive historical years (`rolling_returns`), a scenario per starting year.
+    Unlike bootstrapping, this keeps the order and autocorrelation of real returns.
+    Given `mean` or `volatility`, the history is first moved to them as a whole.
+    Statistics are those of `simulate_and_stats`.
+    """
+    cashflows = _yearly_cashflows(years_before_ret=years_before_ret,
+                                  years_after_ret=years_after_ret,
+                                  yearly_installment=yearly_installment,
+                                  yearly_withdrawls=yearly_withdrawls)
+
+    values, growth = _backtest_paths(hist_values=hist_values,
+                                     start_value=start_value,
+                                     cashflows=cashflows,
+                                     mean=mean,
+                                     volatility=volatility,
+                                     dtype=dtype)
+
+    return _paths_stats_frame(values=values,
+                              growth=growth,
+                              years_before_ret=years_before_ret,
+                              years_after_ret=years_after_ret,
+                              yearly_installment=yearly_installment,
+                              yearly_withdrawls=yearly_withdrawls)
+
+@dataclass
+class ConvergenceReport:
+    """
+    Achieved precision of an adaptive simulation.
+    `standard_errors` holds the per-year standard error of every reported percentile
+    and of the probability of ruin.
+    """
+
+    num_scenarios: int
+    converged: bool
+    standard_errors: pd.DataFrame
+
+REPORTED_QUANTILES = {
+    "Median": 0.5,
+    "Percentile 5": 0.05,
+    "Percentile 25": 0.25,
+    "Percentile 75": 0.75,
+    "Percentile 95": 0.95,
+}
+
+@cached(result_cache, ignore=("workers",))
+def simulate_and_stats_adaptive(hist_values: pd.Series | pd.DataFrame,
+                                start_value: float,
+                                years_before_ret: int,
+                                years_after_ret: int,
+                                yearly_installment: float,
+                                yearly_withdrawls: float,
+                                mean: float | np.ndarray,
+                                volatility: float | np.ndarray,
+                                tolerance: float = 0.01,
+                                ruin_tolerance: float = 0.005,
+                                batch_size: int = 5_000,
+                                max_scenarios: int = 100_000,
+                                min_batches: int = 4,
+                                seed: int | None = None,
+                                dtype: npt.DTypeLike = np.float64,
+                                workers: int = 1,
+                                sampler: str = "iid",
+                                backend: str = "numpy") -> tuple[pd.DataFrame, ConvergenceReport]:
+    """
+    Simulate batches of at most `batch_size` scenarios until all reported statistics
+    converge.
+    The standard error of a percentile is estimated from the spread of per-batch
+    estimates (batch means) and has to be within `tolerance` relative to the percentile
+    (or to the interquartile range of the same year for percentiles close to zero).
+    The standard error of the probability of ruin has to be within `ruin_tolerance`.
+    Simulation stops after `max_scenarios` otherwise, split into balanced batches.
+    Convergence is checked after every batch in order, so the result does not
+    depend on `workers`. Seeded runs reuse checkpoints like `simulate_streaming_stats`.
+    """
+    batch_sizes = _chunk_sizes(max_scenarios, batch_size)
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+
+    simulate_batch = partial(_simulate_chunk_stats,
+                             num_centroids=1_000,
+                             dtype=dtype,
+                             incremental=_is_incremental(seed, sampler, backend, hist_values,
+                                                         mean, volatility),
+                             hist_values=hist_values.to_numpy(),
+                             start_value=start_value,
+                             years_before_ret=years_before_ret,
+                             years_after_ret=years_after_ret,
+                             yearly_installment=yearly_installment,
+                             yearly_withdrawls=yearly_withdrawls,
+                             mean=mean,
+                             volatility=volatility,
+                             sampler=sampler,
+                             backend=backend)
+
+    stats = StreamingStats(years_before_ret + years_after_ret)
+    batch_estimates = {column: [] for column in REPORTED_QUANTILES}
+    converged = False
+
+    max_workers = _max_workers(workers, backend, sampler)
+    batches = zip(batch_sizes, seed_sequences, strict=True)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # one batch in flight per worker, the next one is submitted after every
+        # convergence check, so stopping early only waits for the running batches
+        futures = deque(executor.submit(simulate_batch, *batch)
+                        for batch in islice(batches, max_workers))
+        batches_done = 0
+
+        while futures:
+            batch_stats = futures.popleft().result()
+            batches_done += 1
+            stats.merge(batch_stats)
+
+            for column, q in REPORTED_QUANTILES.items():
+                batch_estimates[column].append(batch_stats.quantile(q))
+
+            standard_errors = _standard_errors(stats, batch_estimates)
+
+            if batches_done >= min_batches:
+                converged = _is_converged(stats, standard_errors, tolerance, ruin_tolerance)
+
+                if converged:
+                    break
+
+            batch = next(batches, None)
+            if batch is not None:
+                futures.append(executor.submit(simulate_batch, *batch))
+
+    portfolio_stats = _streaming_stats_frame(streaming_stats=stats,
+                                             years_before_ret=years_before_ret,
+                                             years_after_ret=years_after_ret,
+                                             yearly_installment=yearly_installment,
+                                             yearly_withdrawls=yearly_withdrawls)
+
+    report = ConvergenceReport(num_scenarios=stats.num_scenarios,
+                               converged=converged,
+                               standard_errors=standard_errors)
+
+    return portfolio_stats, report
+
+def _standard_errors(stats: StreamingStats,
+                     batch_estimates: dict[str, list[np.ndarray]]) -> pd.DataFrame:
+    num_batches = len(next(iter(batch_estimates.values())))
+    ddof = 1 if num_batches > 1 else 0
+
+    standard_errors = pd.DataFrame({
+        column: np.std(estimates, axis=0, ddof=ddof) / np.sqrt(num_batches)
+        for column, estimates in batch_estimates.items()
+    })
+
+    ruin_probability = stats.ruin_counts / stats.num_scenarios
+    standard_errors["Probability of ruin"] = np.sqrt(ruin_probability * (1 - ruin_probability)
+                                                     / stats.num_scenarios)
+    standard_errors.index.name = "Year"
+
+    return standard_errors
+
+def _is_converged(stats: StreamingStats,
+                  standard_errors: pd.DataFrame,
+                  tolerance: float,
+                  ruin_tolerance: float) -> bool:
+    interquartile_range = stats.quantile(0.75) - stats.quantile(0.25)
+    percentiles = np.column_stack([stats.quantile(q) for q in REPORTED_QUANTILES.values()])
+    scale = np.maximum(np.abs(percentiles), interquartile_range[:, np.newaxis])
+    percentile_errors = standard_errors[list(REPORTED_QUANTILES)].to_numpy()
+
+    return bool(np.all(percentile_errors <= tolerance * scale)
+                and np.all(standard_errors["Probability of ruin"] <= ruin_tolerance))
+
+def effective_sample_size(hist_values: pd.Series | pd.DataFrame,
+                          start_value: float,
+                          years_before_ret: int,
+                          years_after_ret: int,
+                          yearly_installment: float,
+                          yearly_withdrawls: float,
+                          num_scenarios: int,
+                          mean: float | np.ndarray,
+                          volatility: float | np.ndarray,
+                          sampler: str,
+                          num_replications: int = 32,
+                          seed: int | None = None,
+                          backend: str = "numpy") -> pd.DataFrame:
+    """
+    Measure the effective sample size of `sampler` for the last year statistics.
+    Both `sampler` and i.i.d. bootstrapping are replicated `num_replications` times with
+    `num_scenarios` each. The effective sample size of a statistic is `num_scenarios`
+    scaled by the ratio of its i.i.d. variance to its variance under `sampler`.
+    """
+    seed_sequences = iter(np.random.SeedSequence(seed).spawn(2 * num_replications))
+    quantiles = list(REPORTED_QUANTILES.values())
+
+    def replicate(replication_sampler: str) -> np.ndarray:
+        estimates = []
+
+        for _ in range(num_replications):
+            values, _ = _simulate_paths(hist_values=hist_values,
+                                        start_value=start_value,
+                                        years_before_ret=years_before_ret,
+                                        years_after_ret=years_after_ret,
+                                        yearly_installment=yearly_installment,
+                                        yearly_withdrawls=yearly_withdrawls,
+                                        num_scenarios=num_scenarios,
+                                        mean=mean,
+                                        volatility=volatility,
+                                        rng=np.random.default_rng(next(seed_sequences)),
+                                        sampler=replication_sampler,
+                                        backend=backend)
+
+            estimates.append([values[-1].mean(), *np.quantile(values[-1], quantiles)])
+
+        return np.var(estimates, axis=0, ddof=1)
+
+    iid_variance = replicate("iid")
+    sampler_variance = replicate(sampler)
+
+    report = pd.DataFrame({
+        "Variance iid": iid_variance,
+        "Variance": sampler_variance,
+        "Effective sample size": num_scenarios * iid_variance / sampler_variance,
+    }, index=["Mean", *REPORTED_QUANTILES])
+    report.index.name = "Statistic"
+
+    return report
+
+@dataclass
+class TerminalValueDecomposition:
+    """
+    Terminal portfolio values of fixed return paths as an affine function of cash flows:
+    V(T) = base + yearly_installment * installment_factor - yearly_withdrawls * withdrawl_factor.
+    A scenario succeeds if V(T) >= 0.
+    """
+
+    base: np.ndarray
+    installment_factor: np.ndarray
+    withdrawl_factor: np.ndarray
+
+    def terminal_values(self, yearly_installment: float, yearly_withdrawls: float) -> np.ndarray:
+        return (self.base
+                + yearly_installment * self.installment_factor
+                - yearly_withdrawls * self.withdrawl_factor)
+
+    def success_probability(self,
+                            yearly_installment: float | np.ndarray,
+                            yearly_withdrawls: float) -> float | np.ndarray:
+        """
+        Probability that V(T) >= 0, vectorized over yearly installments.
+        """
+        breakeven = np.sort(self._breakeven_installments(yearly_withdrawls))
+        num_successes = np.searchsorted(breakeven, yearly_installment, side="right")
+
+        return num_successes / len(breakeven)
+
+    def required_installment(self, success_probability: float, yearly_withdrawls: float) -> float:
+        """
+        Smallest yearly installment with V(T) >= 0 in at least `success_probability` of
+        scenarios. Infinite if no installment can achieve it.
+        """
+        breakeven = self._breakeven_installments(yearly_withdrawls)
+
+        return float(_order_statistic(breakeven, success_probability))
+
+    def max_withdrawl(self, success_probability: float, yearly_installment: float) -> float:
+        """
+        Largest yearly withdrawl with V(T) >= 0 in at least `success_probability` of
+        scenarios. Negative if even withdrawing nothing is not enough.
+        """
+        breakeven = _safe_divide(self.base + yearly_installment * self.installment_factor,
+                                 self.withdrawl_factor)
+
+        return float(-_order_statistic(-breakeven, success_probability))
+
+    def _breakeven_installments(self, yearly_withdrawls: float) -> np.ndarray:
+        # a scenario succeeds iff the installment is at least its breakeven installment
+        return _safe_divide(yearly_withdrawls * self.withdrawl_factor - self.base,
+                            self.installment_factor)
+
+def _safe_divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """
+    Division where x / 0 is -inf for x <= 0 and +inf otherwise.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = numerator / denominator
+
+    zero_denominator = denominator == 0
+    result[zero_denominator] = np.where(numerator[zero_denominator] > 0, np.inf, -np.inf)
+
+    return result
+
+def _order_statistic(values: np.ndarray, fraction: float) -> float:
+    """
+    Smallest value v such that at least `fraction` of `values` are <= v.
+    """
+    k = min(max(int(np.ceil(fraction * len(values))), 1), len(values)) - 1
+
+    return np.partition(values, k)[k]
+
+@traced("finance.simulate_chunk")
+def _simulate_decomposition_chunk(chunk_size: int,
+                                  seed_sequence: np.random.SeedSequence | int | None,
+                                  hist_values: np.ndarray,
+                                  start_value: float,
+                                  years_before_ret: int,
+                                  years_after_ret: int,
+                                  mean: float | np.ndarray,
+                                  volatility: float | np.ndarray,
+                                  sampler: str,
+                                  backend: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    num_years = years_before_ret + years_after_ret
+    growth_factors = bootstrap_returns(hist_returns=hist_values,
+                                       num_years=num_years,
+                                       num_scenarios=chunk_size,
+                                       mean=mean,
+                                       volatility=volatility,
+                                       rng=np.random.default_rng(seed_sequence),
+                                       sampler=sampler,
+                                       backend=backend)
+    growth_factors += 1.0
+
+    base = np.full(chunk_size, float(start_value))
+    installment_factor = np.zeros(chunk_size)
+    withdrawl_factor = np.zeros(chunk_size)
+
+    for t in range(1, num_years + 1):
+        base *= growth_factors[t - 1]
+        installment_factor *= growth_factors[t - 1]
+        withdrawl_factor *= growth_factors[t - 1]
+
+        if t <= years_before_ret:
+            installment_factor += 1.0
+        else:
+            withdrawl_factor += 1.0
+
+    return base, installment_factor, withdrawl_factor
+
+@cached(result_cache, ignore=("workers",))
+def simulate_terminal_decomposition(hist_values: pd.Series | pd.DataFrame,
+                                    start_value: float,
+                                    years_before_ret: int,
+                                    years_after_ret: int,
+                                    num_scenarios: int,
+                                    mean: float | np.ndarray,
+                                    volatility: float | np.ndarray,
+                                    chunk_size: int | None = None,
+                                    seed: int | None = None,
+                                    workers: int = 1,
+                                    sampler: str = "iid",
+                                    backend: str = "numpy") -> TerminalValueDecomposition:
+    """
+    Simulate return paths once and decompose terminal portfolio values into the parts
+    driven by the start value, the installments and the withdrawls.
+    Installment and withdrawl are not inputs, so goal-seeking over them needs no
+    re-simulation. Paths (and chunking) are the same as in `simulate_and_stats` with
+    the same seed (common random numbers).
+    """
+    simulate_chunk = partial(_simulate_decomposition_chunk,
+                             hist_values=hist_values.to_numpy(),
+                             start_value=start_value,
+                             years_before_ret=years_before_ret,
+                             years_after_ret=years_after_ret,
+                             mean=mean,
+                             volatility=volatility,
+                             sampler=sampler,
+                             backend=backend)
+
+    if chunk_size is None:
+        chunks = [simulate_chunk(num_scenarios, seed)]
+    else:
+        chunk_sizes = _chunk_sizes(num_scenarios, chunk_size)
+        seed_sequences = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+
+        with ThreadPoolExecutor(max_workers=_max_workers(workers, backend, sampler)) as executor:
+            chunks = list(executor.map(simulate_chunk, chunk_sizes, seed_sequences))
+
+    base, installment_factor, withdrawl_factor = (np.concatenate(parts)
+                                                  for parts in zip(*chunks, strict=True))
+
+    return TerminalValueDecomposition(base=base,
+                                      installment_factor=installment_factor,
+                                      withdrawl_factor=withdrawl_factor)
+
+def _simulate_scenarios_chunk(values: np.ndarray,
+                              chunk_start: int,
+                              chunk_size: int,
+                              seed_sequence: np.random.SeedSequence | int | None,
+                              **simulation_kwargs: object) -> None:
+    chunk_values, _ = _simulate_paths(**simulation_kwargs,
+                                      num_scenarios=chunk_size,
+                                      rng=np.random.default_rng(seed_sequence))
+    values[:, chunk_start:chunk_start + chunk_size] = chunk_values
+
+def simulate_scenarios(hist_values: pd.Series | pd.DataFrame,
+                       start_value: float,
+                       years_before_ret: int,
+                       years_after_ret: int,
+                       yearly_installment: float,
+                       yearly_withdrawls: float,
+                       num_scenarios: int,
+                       mean: float | np.ndarray,
+                       volatility: float | np.ndarray,
+                       chunk_size: int | None = None,
+                       seed: int | None = None,
+                       dtype: npt.DTypeLike = np.float64,
+                       workers: int = 1,
+                       sampler: str = "iid",
+                       backend: str = "numpy") -> Scenarios:
+    """
+    Simulated portfolio values of every scenario, as float32. Paths (and chunking) are
+    the same as in `simulate_and_stats` with the same seed.
+    Seeded runs are kept in the scenario store, see `configure_scenario_store`, and read
+    back memory-mapped on later calls, so drilling into a run does not simulate it again.
+    """
+    key = fingerprint("simulate_scenarios", hist_values, start_value, years_before_ret,
+                      years_after_ret, yearly_installment, yearly_withdrawls, num_scenarios,
+                      mean, volatility, chunk_size, seed, np.dtype(dtype).str, sampler, backend)
+    store = scenario_store if seed is not None else ScenarioStore()
+
+    scenarios = store.get(key)
+    if scenarios is not None:
+        return scenarios
+
+    simulate_chunk = partial(_simulate_scenarios_chunk,
+                             hist_values=hist_values.to_numpy(),
+                             start_value=start_value,
+                             years_before_ret=years_before_ret,
+                             years_after_ret=years_after_ret,
+                             yearly_installment=yearly_installment,
+                             yearly_withdrawls=yearly_withdrawls,
+                             mean=mean,
+                             volatility=volatility,
+                             dtype=dtype,
+                             sampler=sampler,
+                             backend=backend)
+
+    with store.write(key, (years_before_ret + years_after_ret + 1, num_scenarios)) as values:
+        if chunk_size is None:
+            simulate_chunk(values, 0, num_scenarios, seed)
+        else:
+            chunk_sizes = _chunk_sizes(num_scenarios, chunk_size)
+            chunk_starts = np.cumsum([0, *chunk_sizes[:-1]]).tolist()
+            seed_sequences = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+
+            # chunks fill their own columns
+            max_workers = _max_workers(workers, backend, sampler)
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                list(executor.map(partial(simulate_chunk, values),
+                                  chunk_starts, chunk_sizes, seed_sequences))
+
+    # the stored file, unless another process pruned it right away
+    return store.get(key) or Scenarios(values)
+
+PROFILE_COLUMNS = [
+    "start_value",
+    "years_before_ret",
+    "years_after_ret",
+    "yearly_installment",
+    "yearly_withdrawls",
+    "mean",
+    "volatility",
+]
+
+@traced("finance.simulate_profiles")
+def _simulate_profile_group(hist_values: np.ndarray,
+                            profiles: pd.DataFrame,
+                            num_scenarios: int,
+                            mean: float,
+                            volatility: float,
+                            rng: np.random.Generator,
+                            sampler: str,
+                            backend: str) -> dict[Hashable, pd.DataFrame]:
+    """
+    Simulate profiles sharing one bootstrapped return matrix.
+    Values of all profiles form a (num_profiles, num_scenarios) array and every year
+    is a single broadcast update. Profiles are ordered by horizon (longest first),
+    so profiles that are still running are always a leading slice.
+    """
+    horizons = profiles["years_before_ret"] + profiles["years_after_ret"]
+    profiles = profiles.assign(horizon=horizons).sort_values("horizon",
+                                                             ascending=False,
+                                                             kind="stable")
+    years_before_ret = profiles["years_before_ret"].to_numpy()
+    horizons = profiles["horizon"].to_numpy()
+    installments = profiles["yearly_installment"].to_numpy(dtype=float)
+    withdrawls = profiles["yearly_withdrawls"].to_numpy(dtype=float)
+
+    num_profiles = len(profiles)
+    num_years = int(horizons.max())
+    quantiles = list(REPORTED_QUANTILES.values())
+
+    returns = bootstrap_returns(hist_returns=hist_values,
+                                num_years=num_years,
+                                num_scenarios=num_scenarios,
+                                mean=mean,
+                                volatility=volatility,
+                                rng=rng,
+                                sampler=sampler,
+                                backend=backend)
+
+    values = np.repeat(profiles["start_value"].to_numpy(dtype=float)[:, np.newaxis],
+                       num_scenarios, axis=1)
+    growth = np.empty_like(values)
+
+    drawdown_quantiles = [0.5, 0.95]
+
+    value_means = np.zeros((num_years + 1, num_profiles))
+    value_quantiles = np.zeros((num_years + 1, len(quantiles), num_profiles))
+    growth_means = np.zeros((num_years + 1, num_profiles))
+    growth_medians = np.zeros((num_years + 1, num_profiles))
+    ruin_counts = np.zeros((num_years + 1, num_profiles), dtype=np.int64)
+    first_ruin_counts = np.zeros((num_years + 1, num_profiles), dtype=np.int64)
+    max_drawdown_quantiles = np.zeros((num_years + 1, len(drawdown_quantiles), num_profiles))
+
+    # profiles past their horizon keep their values, which leaves their state unchanged
+    tracker = _PathTracker(values.shape)
+
+    value_means[0] = values[:, 0]
+    value_quantiles[0] = values[:, 0]
+    ruin_counts[0] = np.count_nonzero(values < 0, axis=1)
+    first_ruin_counts[0] = tracker.update(values)
+
+    for t in range(1, num_years + 1):
+        active = np.searchsorted(-horizons, -t, side="right")
+        active_values, active_growth = values[:active], growth[:active]
+
+        np.multiply(active_values, returns[t - 1], out=active_growth)
+        active_values += active_growth
+
+        cashflows = np.where(t <= years_before_ret[:active],
+                             installments[:active],
+                             -withdrawls[:active])
+        active_values += cashflows[:, np.newaxis]
+
+        value_means[t, :active] = active_values.mean(axis=1)
+        value_quantiles[t, :, :active] = np.quantile(active_values, quantiles, axis=1)
+        growth_means[t, :active] = active_growth.mean(axis=1)
+        growth_medians[t, :active] = np.median(active_growth, axis=1)
+        ruin_counts[t, :active] = np.count_nonzero(active_values < 0, axis=1)
+        first_ruin_counts[t] = tracker.update(values)
+        max_drawdown_quantiles[t, :, :active] = np.quantile(tracker.max_drawdowns[:active],
+                                                            drawdown_quantiles,
+                                                            axis=1)
+
+    results = {}
+
+    for position, (index, profile) in enumerate(profiles.iterrows()):
+        rows = slice(0, int(profile["horizon"]) + 1)
+        cashflows = _cashflow_metadata(years_before_ret=int(profile["years_before_ret"]),
+                                       years_after_ret=int(profile["years_after_ret"]),
+                                       yearly_installment=profile["yearly_installment"],
+                                       yearly_withdrawls=profile["yearly_withdrawls"])
+
+        metadata = {
+            "Invested per year": cashflows["Invested per year"],
+            "Mean earnings per year": growth_means[rows, position].tolist(),
+            "Median earnings per year": growth_medians[rows, position].tolist(),
+            "Withdrawn per year": cashflows["Withdrawn per year"],
+        }
+
+        profile_quantiles = value_quantiles[rows, :, position]
+        profile_drawdowns = max_drawdown_quantiles[rows, :, position]
+        risk = _risk_columns(
+            num_scenarios=num_scenarios,
+            ruin_counts=ruin_counts[rows, position],
+            first_ruin_counts=first_ruin_counts[rows, position],
+            drawdown_quantile=lambda q, qs=profile_drawdowns: qs[:, drawdown_quantiles.index(q)])
+
+        results[index] = _stats_frame(
+            mean=value_means[rows, position],
+            quantile=lambda q, qs=profile_quantiles: qs[:, quantiles.index(q)],
+            metadata=metadata,
+            risk=risk)
+
+    return results
+
+def simulate_profiles_and_stats(hist_values: pd.Series,
+                                profiles: pd.DataFrame,
+                                num_scenarios: int,
+                                seed: int | None = None,
+                                sampler: str = "iid",
+                                backend: str = "numpy") -> dict[Hashable, pd.DataFrame]:
+    """
+    Simulate many client profiles in one pass.
+    `profiles` has one row per profile with PROFILE_COLUMNS. Profiles with the same
+    mean and volatility share one bootstrapped return matrix (common random numbers),
+    so every extra profile costs one vectorized recurrence.
+    Returns a stats frame (as from `simulate_and_stats`) per profile index.
+    """
+    missing_columns = set(PROFILE_COLUMNS) - set(profiles.columns)
+    if missing_columns:
+        msg = f"Profiles are missing columns: {sorted(missing_columns)}"
+        raise ValueError(msg)
+
+    groups = profiles.groupby(["mean", "volatility"], sort=False)
+    seed_sequences = np.random.SeedSequence(seed).spawn(groups.ngroups)
+    hist_values = hist_values.to_numpy()
+
+    results = {}
+    for ((mean, volatility), group), seed_sequence in zip(groups, seed_sequences, strict=True):
+        results.update(_simulate_profile_group(hist_values=hist_values,
+                                               profiles=group,
+                                               num_scenarios=num_scenarios,
+                                               mean=mean,
+                                               volatility=volatility,
+                                               rng=np.random.default_rng(seed_sequence),
+                                               sampler=sampler,
+                                               backend=backend))
+
+    return {index: results[index] for index in profiles.index}
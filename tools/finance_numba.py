@@ -0,0 +1,210 @@
+"""
+Fused numba kernels for the finance engine (the "numba" backend).
+
+Returns are never stored as a separate matrix: the historical index of every
+(year, scenario) pair comes from a counter-based generator (SplitMix64 of a key drawn
+from the caller's generator, the year and the scenario), so a first pass computes
+per-year moments of the drawn returns and a second pass draws the same returns again,
+moment-matches, clips and runs the portfolio recurrence in one loop per scenario.
+"""
+import threading
+
+import numba
+import numpy as np
+import numpy.typing as npt
+
+# every kernel already uses all cores, so launches are serialized: the workqueue layer
+# is not safe for concurrent launches, and TBB, which can hang at exit after launches
+# from other threads, comes last. The finance engine runs chunks of this backend on one
+# thread (see `finance._max_workers`), so the lock only guards direct callers.
+_kernel_lock = threading.Lock()
+
+# scenarios simulated together by one thread of the fused kernel
+SCENARIO_BLOCK = 256
+
+if numba.config.THREADING_LAYER == "default":
+    numba.config.THREADING_LAYER_PRIORITY = ["omp", "workqueue", "tbb"]
+
+@numba.njit(inline="always")
+def _uniform(key: np.uint64, year: int, scenario: int) -> float:
+    state = key + np.uint64(year) * np.uint64(0xD1B54A32D192ED03) \
+        + np.uint64(scenario) * np.uint64(0x9E3779B97F4A7C15)
+    state = (state ^ (state >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    state = (state ^ (state >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    state = state ^ (state >> np.uint64(31))
+
+    return (state >> np.uint64(11)) * (1.0 / 9007199254740992.0)  # 53 bits in [0, 1)
+
+@numba.njit(inline="always")
+def _drawn_return(hist: np.ndarray, key: np.uint64, year: int, scenario: int) -> float:
+    num_hist, num_columns = hist.shape
+    row = min(np.int64(_uniform(key, year, scenario) * num_hist), num_hist - 1)
+    # one column per year for glide paths, a single column otherwise
+    # (prange indices may be unsigned, mixing them with signed integers gives floats)
+    column = np.int64(year) if num_columns > 1 else np.int64(0)
+
+    return hist[row, column]
+
+@numba.njit(parallel=True, cache=True)
+def _year_moments(hist: np.ndarray,
+                  key: np.uint64,
+                  num_years: int,
+                  num_drawn: int) -> tuple[np.ndarray, np.ndarray]:
+    shift = hist.mean()
+    means = np.empty(num_years)
+    stds = np.empty(num_years)
+
+    for year in numba.prange(num_years):
+        total = 0.0
+        total_squares = 0.0
+
+        for scenario in range(num_drawn):
+            value = _drawn_return(hist, key, year, scenario) - shift
+            total += value
+            total_squares += value * value
+
+        mean = total / num_drawn
+        means[year] = shift + mean
+        stds[year] = np.sqrt(max(total_squares / num_drawn - mean * mean, 0.0))
+
+    return means, stds
+
+@numba.njit(inline="always")
+def _matched_return(hist: np.ndarray,
+                    key: np.uint64,
+                    year: int,
+                    scenario: int,
+                    num_drawn: int,
+                    means: np.ndarray,
+                    stds: np.ndarray,
+                    target_means: np.ndarray,
+                    target_volatilities: np.ndarray) -> float:
+    # the antithetic half mirrors the drawn half around the target mean
+    mirrored = scenario >= num_drawn
+    drawn_scenario = scenario - num_drawn if mirrored else scenario
+
+    standardized = (_drawn_return(hist, key, year, drawn_scenario) - means[year]) / stds[year]
+    matched = standardized * target_volatilities[year]
+
+    if mirrored:
+        matched = -matched
+
+    return max(matched + target_means[year], -1.0)
+
+@numba.njit(parallel=True, cache=True)
+def _bootstrap_kernel(hist: np.ndarray,
+                      key: np.uint64,
+                      num_drawn: int,
+                      means: np.ndarray,
+                      stds: np.ndarray,
+                      target_means: np.ndarray,
+                      target_volatilities: np.ndarray,
+                      out: np.ndarray) -> None:
+    num_years, num_scenarios = out.shape
+
+    for year in numba.prange(num_years):
+        for scenario in range(num_scenarios):
+            out[year, scenario] = _matched_return(hist, key, year, scenario, num_drawn,
+                                                  means, stds,
+                                                  target_means, target_volatilities)
+
+@numba.njit(parallel=True, cache=True)
+def _segment_kernel(hist: np.ndarray,
+                    key: np.uint64,
+                    num_drawn: int,
+                    means: np.ndarray,
+                    stds: np.ndarray,
+                    target_means: np.ndarray,
+                    target_volatilities: np.ndarray,
+                    start_values: np.ndarray,
+                    cashflows: np.ndarray,
+                    portfolio_values: np.ndarray,
+                    portfolio_growth: np.ndarray) -> None:
+    num_scenarios = portfolio_values.shape[1]
+    num_blocks = (num_scenarios + SCENARIO_BLOCK - 1) // SCENARIO_BLOCK
+
+    # blocks of scenarios in parallel, each running all years, so every year reads and
+    # writes a contiguous part of the rows of its block
+    for block in numba.prange(num_blocks):
+        start = np.int64(block) * SCENARIO_BLOCK
+        stop = min(start + SCENARIO_BLOCK, num_scenarios)
+
+        for scenario in range(start, stop):
+            portfolio_values[0, scenario] = start_values[scenario]
+            portfolio_growth[0, scenario] = 0.0
+
+        for year in range(len(cashflows)):
+            for scenario in range(start, stop):
+                value = portfolio_values[year, scenario]
+                growth = value * _matched_return(hist, key, year, scenario, num_drawn,
+                                                 means, stds,
+                                                 target_means, target_volatilities)
+
+                portfolio_values[year + 1, scenario] = value + growth + cashflows[year]
+                portfolio_growth[year + 1, scenario] = growth
+
+def _prepare(hist_returns: np.ndarray,
+             num_years: int,
+             num_scenarios: int,
+             mean: float | np.ndarray,
+             volatility: float | np.ndarray,
+             rng: np.random.Generator,
+             sampler: str) -> tuple:
+    hist = np.ascontiguousarray(hist_returns, dtype=np.float64)
+    hist = hist.reshape(len(hist), -1)
+    key = np.uint64(rng.integers(np.iinfo(np.int64).max, dtype=np.int64))
+
+    num_drawn = (num_scenarios + 1) // 2 if sampler == "antithetic" else num_scenarios
+    means, stds = _year_moments(hist, key, num_years, num_drawn)
+
+    target_means = np.broadcast_to(np.asarray(mean, dtype=np.float64), num_years)
+    target_volatilities = np.broadcast_to(np.asarray(volatility, dtype=np.float64), num_years)
+
+    return (hist, key, num_drawn, means, stds,
+            np.ascontiguousarray(target_means), np.ascontiguousarray(target_volatilities))
+
+def bootstrap_returns(hist_returns: np.ndarray,
+                      num_years: int,
+                      num_scenarios: int,
+                      mean: float | np.ndarray,
+                      volatility: float | np.ndarray,
+                      rng: np.random.Generator,
+                      out: np.ndarray,
+                      sampler: str) -> np.ndarray:
+    """
+    Same as `finance.bootstrap_returns` for the "iid" and "antithetic" samplers.
+    """
+    with _kernel_lock:
+        _bootstrap_kernel(*_prepare(hist_returns, num_years, num_scenarios,
+                                    mean, volatility, rng, sampler),
+                          out)
+
+    return out
+
+def simulate_segment(hist_values: np.ndarray,
+                     start_values: float | np.ndarray,
+                     cashflows: np.ndarray,
+                     num_scenarios: int,
+                     mean: float | np.ndarray,
+                     volatility: float | np.ndarray,
+                     rng: np.random.Generator,
+                     dtype: npt.DTypeLike,
+                     sampler: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Same as `finance._simulate_segment`, bootstrapping and the recurrence fused into
+    one pass over every scenario.
+    """
+    num_years = len(cashflows)
+    portfolio_values = np.empty((num_years + 1, num_scenarios), dtype=dtype)
+    portfolio_growth = np.empty((num_years + 1, num_scenarios), dtype=dtype)
+    start_values = np.broadcast_to(np.asarray(start_values, dtype=np.float64), num_scenarios)
+
+    with _kernel_lock:
+        _segment_kernel(*_prepare(hist_values, num_years, num_scenarios,
+                                  mean, volatility, rng, sampler),
+                        np.ascontiguousarray(start_values),
+                        np.asarray(cashflows, dtype=np.float64),
+                        portfolio_values,
+                        portfolio_growth)
+
+    return portfolio_values, portfolio_growth
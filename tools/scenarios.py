@@ -0,0 +1,161 @@
+"""
+Simulated portfolio paths kept on disk, so follow-up questions about a run (the values in
+some year, the paths that went bankrupt) read them back instead of simulating again.
+"""
+import os
+import threading
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from .tracing import span
+
+
+@dataclass
+class Scenarios:
+    """
+    Portfolio values of shape (num_years + 1, num_scenarios), a read-only float32
+    `np.memmap` when the run is stored. Years are rows, so a year is one contiguous read.
+    """
+
+    values: np.ndarray
+
+    @property
+    def num_years(self) -> int:
+        return len(self.values) - 1
+
+    @property
+    def num_scenarios(self) -> int:
+        return self.values.shape[1]
+
+    def year(self, t: int) -> np.ndarray:
+        """
+        Values of all scenarios in year `t`, a view without copying.
+        """
+        return self.values[t]
+
+    def paths(self, scenarios: slice) -> np.ndarray:
+        """
+        Values of a range of scenarios in every year, a view without copying.
+        """
+        return self.values[:, scenarios]
+
+    def first_ruin_years(self) -> np.ndarray:
+        """
+        First year with a negative value per scenario, -1 for scenarios never ruined.
+        Reads one year at a time, so memory use does not grow with the horizon.
+        """
+        first_ruin = np.full(self.num_scenarios, -1, dtype=np.int64)
+
+        for t, year_values in enumerate(self.values):
+            first_ruin[(first_ruin < 0) & (year_values < 0)] = t
+
+        return first_ruin
+
+    def ruined(self) -> np.ndarray:
+        """
+        Mask of the scenarios that are negative in some year.
+        """
+        return self.first_ruin_years() >= 0
+
+class ScenarioStore:
+    """
+    Scenarios of runs as `.npy` files in `directory`, keyed by a fingerprint of the run
+    (including its seed). Once the files exceed `max_bytes`, the least recently used
+    ones are deleted. Without a directory nothing is stored.
+    """
+
+    def __init__(self, directory: str | None = None, max_bytes: int = 1024 * 2**20):
+        self.max_bytes = max_bytes
+        self._directory = None
+        self._lock = threading.Lock()
+        self.configure(directory, max_bytes)
+
+    @property
+    def enabled(self) -> bool:
+        return self._directory is not None
+
+    @property
+    def directory(self) -> str | None:
+        return None if self._directory is None else str(self._directory)
+
+    def configure(self, directory: str | None, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._directory = None if directory is None else Path(directory)
+
+        if self._directory is not None:
+            self._directory.mkdir(parents=True, exist_ok=True)
+
+    def get(self, key: str) -> Scenarios | None:
+        if self._directory is None:
+            return None
+
+        path = self._directory / f"{key}.npy"
+        try:
+            with span("scenarios.open"):
+                values = np.load(path, mmap_mode="r")
+            os.utime(path)  # marks it as recently used for pruning
+        except FileNotFoundError:
+            return None
+
+        return Scenarios(values)
+
+    @contextmanager
+    def write(self, key: str, shape: tuple[int, int]) -> Iterator[np.ndarray]:
+        """
+        Memory-mapped float32 array to fill with the values of a run. The file is stored
+        under `key` once the block exits, so readers never see a partly written run.
+        """
+        if self._directory is None:
+            yield np.empty(shape, dtype=np.float32)
+            return
+
+        path = self._directory / f"{key}.npy"
+        temp_path = self._directory / f"{key}.{uuid.uuid4().hex}.tmp"
+        values = np.lib.format.open_memmap(temp_path, mode="w+", dtype=np.float32, shape=shape)
+
+        try:
+            yield values
+            values.flush()
+            os.replace(temp_path, path)
+        finally:
+            del values
+            temp_path.unlink(missing_ok=True)
+
+        self._prune(keep=path)
+
+    def clear(self) -> None:
+        if self._directory is not None:
+            for path in self._directory.glob("*.npy"):
+                path.unlink(missing_ok=True)
+
+    def _prune(self, keep: Path) -> None:
+        with self._lock:
+            files = []
+            for path in self._directory.glob("*.npy"):
+                try:
+                    files.append((path.stat(), path))
+                except FileNotFoundError:  # pruned by another process
+                    continue
+
+            # newest first, the run just written stays even if it exceeds the budget alone
+            files.sort(key=lambda item: (item[1] != keep, -item[0].st_mtime))
+            total_bytes = 0
+            for stat, path in files:
+                total_bytes += stat.st_size
+                if total_bytes > self.max_bytes and path != keep:
+                    # readers keep their mapping of a deleted file
+                    path.unlink(missing_ok=True)
+
+# scenarios of `finance.simulate_scenarios`, see `configure_scenario_store`
+scenario_store = ScenarioStore()
+
+def configure_scenario_store(directory: str | None, max_bytes: int = 1024 * 2**20) -> None:
+    """
+    Keep simulated scenarios as files in `directory`, at most `max_bytes` of them.
+    """
+    scenario_store.configure(directory, max_bytes)
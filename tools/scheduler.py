@@ -0,0 +1,301 @@
+"""
+Continuous batching of translation requests from all sessions of a worker process.
+
+Requests wait in a bounded queue. Worker threads decode the sentences of many requests
+in one batch and admit waiting requests between decoding steps, so a new request does
+not wait for the running ones to finish and the model sees few, large runs instead of
+many batch-1 runs contending for the same threads.
+"""
+import queue
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from .configuration import load_config
+from .tracing import span
+from .translation import DecodingBatch, Translator, get_translator, normalize_sentence
+
+
+@dataclass
+class SchedulerStats:
+    queue_depth: int  # requests waiting for a place in a batch
+    in_flight: int  # requests being decoded
+    occupancy: float  # mean share of the batch size in use per step, over recent steps
+    p50_latency_seconds: float  # from submission to translation, over recent requests
+    p99_latency_seconds: float
+    completed: int
+
+@dataclass(eq=False)
+class _Request:
+    src_ids: list[int]
+    max_tgt_length: int
+    cache_key: str | None
+    future: Future = field(default_factory=Future)
+    submitted: float = field(default_factory=time.perf_counter)
+    cancel: threading.Event = field(default_factory=threading.Event)
+    partials: queue.SimpleQueue | None = None  # tokens after every step, for streaming
+
+_STOP = None  # queued once per worker on close
+
+class TranslationScheduler:
+    """
+    Translate sentences with a shared translator in continuous batches of up to
+    `max_batch_size` rows per worker. Submitting blocks while `max_queue_size` requests
+    are waiting (backpressure).
+    """
+
+    def __init__(self,
+                 translator: Translator,
+                 max_batch_size: int = 16,
+                 num_workers: int = 1,
+                 max_queue_size: int = 256):
+        self.translator = translator
+        self.max_batch_size = min(max_batch_size, translator.max_batch_size or max_batch_size)
+        self._queue: queue.Queue[_Request | None] = queue.Queue(maxsize=max_queue_size)
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._occupancy: deque[float] = deque(maxlen=1000)
+        self._latencies: deque[float] = deque(maxlen=1000)
+
+        self._workers = [threading.Thread(target=self._work, name=f"translation-{i}", daemon=True)
+                         for i in range(num_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self,
+               src_sentence: str,
+               max_tgt_length: int = 100,
+               timeout: float | None = None) -> Future:
+        """
+        Future of the translation of a sentence. Cached translations are returned done.
+        Raises queue.Full if the queue stays full for `timeout` seconds.
+        """
+        return self._submit(src_sentence, max_tgt_length, timeout).future
+
+    def translate(self, src_sentences: list[str], max_tgt_length: int = 100) -> list[str]:
+        futures = [self.submit(sentence, max_tgt_length) for sentence in src_sentences]
+
+        return [future.result() for future in futures]
+
+    def stream(self,
+               src_sentence: str,
+               max_tgt_length: int = 100,
+               cancel: threading.Event | None = None) -> Iterator[str]:
+        """
+        Translate a sentence, yielding the translation so far whenever a generated token
+        changes it, as `Translator.translate_stream` does. Once `cancel` is set or the
+        generator is closed, the sentence leaves its batch at the next step.
+        """
+        request = self._submit(src_sentence, max_tgt_length, timeout=None,
+                               partials=queue.SimpleQueue())
+        translation = ""
+
+        try:
+            if request.future.done():
+                yield request.future.result()
+                return
+
+            while (tokens := request.partials.get()) is not None:
+                if cancel is not None and cancel.is_set():
+                    return
+
+                with span("translation.detokenize"):
+                    partial = self.translator.tgt_lang.decode(tokens, skip_special_tokens=True)
+
+                if partial != translation:
+                    translation = partial
+                    yield translation
+
+            request.future.result()  # raises if decoding failed
+        finally:
+            request.cancel.set()
+
+    def stats(self) -> SchedulerStats:
+        with self._lock:
+            occupancy = np.mean(self._occupancy) if self._occupancy else 0.0
+            latencies = np.array(self._latencies)
+            in_flight, completed = self._in_flight, self._completed
+
+        p50, p99 = np.quantile(latencies, [0.5, 0.99]) if len(latencies) else (0.0, 0.0)
+
+        return SchedulerStats(queue_depth=self._queue.qsize(),
+                              in_flight=in_flight,
+                              occupancy=float(occupancy),
+                              p50_latency_seconds=float(p50),
+                              p99_latency_seconds=float(p99),
+                              completed=completed)
+
+    def close(self) -> None:
+        """
+        Stop the workers once the queued requests are translated.
+        """
+        for _ in self._workers:
+            self._queue.put(_STOP)
+
+        for worker in self._workers:
+            worker.join()
+
+    def _submit(self,
+                src_sentence: str,
+                max_tgt_length: int,
+                timeout: float | None,
+                partials: queue.SimpleQueue | None = None) -> _Request:
+        cache = self.translator.cache
+        cache_key = None
+
+        if cache is not None:
+            src_sentence = normalize_sentence(src_sentence)
+            cache_key = self.translator.cache_key(src_sentence, max_tgt_length)
+
+            with span("translation.cache_get"):
+                translation = cache.get(cache_key)
+
+            if translation is not None:
+                request = _Request(src_ids=[], max_tgt_length=max_tgt_length, cache_key=cache_key)
+                request.future.set_result(translation)
+                return request
+
+        src_ids = self.translator.encode([src_sentence])[0]
+        request = _Request(src_ids=src_ids,
+                           max_tgt_length=max_tgt_length,
+                           cache_key=cache_key,
+                           partials=partials)
+        self._queue.put(request, timeout=timeout)
+
+        return request
+
+    def _admit(self, batch: DecodingBatch, running: dict[int, _Request]) -> bool:
+        """
+        Add waiting requests to the batch while it has room, waiting for one if the batch
+        is empty. Returns False once the scheduler is closing and the batch is empty.
+        """
+        admitted = []
+
+        while len(running) + len(admitted) < self.max_batch_size:
+            try:
+                request = self._queue.get(block=not (running or admitted))
+            except queue.Empty:
+                break
+
+            if request is _STOP:
+                if running or admitted:
+                    self._queue.put(_STOP)  # again after the running requests
+                    break
+
+                return False
+
+            if request.cancel.is_set():
+                request.future.cancel()
+            else:
+                admitted.append(request)
+
+        if admitted:
+            with self._lock:
+                self._in_flight += len(admitted)
+
+            keys = [id(request) for request in admitted]
+            try:
+                # runs the encoder of split graphs, before the batch is changed
+                batch.add(keys, [request.src_ids for request in admitted],
+                          [request.max_tgt_length for request in admitted])
+            except Exception as e:  # noqa: BLE001 (failed requests get the error)
+                for request in admitted:
+                    request.future.set_exception(e)
+                self._retire(admitted)
+                return True
+
+            running.update(zip(keys, admitted, strict=True))
+
+        return True
+
+    def _work(self) -> None:
+        batch = self.translator.decoding_batch()
+        running: dict[int, _Request] = {}
+
+        while self._admit(batch, running):
+            cancelled = {key for key, request in running.items() if request.cancel.is_set()}
+            if cancelled:
+                batch.remove(cancelled)
+                for key in cancelled:
+                    running[key].future.cancel()
+                self._retire([running.pop(key) for key in cancelled])
+
+            if not running:
+                continue
+
+            with self._lock:
+                self._occupancy.append(len(running) / self.max_batch_size)
+
+            try:
+                decoded = batch.step()
+            except Exception as e:  # noqa: BLE001 (failed requests get the error)
+                for request in running.values():
+                    request.future.set_exception(e)
+                self._retire(list(running.values()))
+                running.clear()
+                batch = self.translator.decoding_batch()
+                continue
+
+            for row in decoded:
+                request = running.pop(row.key)
+                self._finish(request, row.tokens.tolist())
+
+            for key, request in running.items():
+                if request.partials is not None:
+                    request.partials.put(batch.tokens(key).tolist())
+
+    def _finish(self, request: _Request, tokens: list[int]) -> None:
+        with span("translation.detokenize"):
+            translation = self.translator.tgt_lang.decode(tokens, skip_special_tokens=True)
+
+        if request.cache_key is not None:
+            self.translator.cache.put(request.cache_key, translation)
+
+        if request.partials is not None:
+            request.partials.put(tokens)
+
+        request.future.set_result(translation)
+        self._retire([request])
+
+        with self._lock:
+            self._latencies.append(time.perf_counter() - request.submitted)
+            self._completed += 1
+
+    def _retire(self, requests: list[_Request]) -> None:
+        for request in requests:
+            if request.partials is not None:
+                request.partials.put(None)
+
+        with self._lock:
+            self._in_flight -= len(requests)
+
+_scheduler: TranslationScheduler | None = None
+_scheduler_created = False
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> TranslationScheduler | None:
+    """
+    Scheduler of the app configuration, created on first use and shared by all sessions.
+    None if `translation_workers` is 0, then every session decodes on its own.
+    """
+    global _scheduler, _scheduler_created  # noqa: PLW0603
+
+    if not _scheduler_created:
+        with _scheduler_lock:
+            if not _scheduler_created:
+                config = load_config()
+                if config.translation_workers > 0:
+                    _scheduler = TranslationScheduler(get_translator(),
+                                                      max_batch_size=config.translation_batch_size,
+                                                      num_workers=config.translation_workers,
+                                                      max_queue_size=config.translation_queue_size)
+                _scheduler_created = True
+
+    return _scheduler
@@ -0,0 +1,180 @@
+import contextlib
+import functools
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+SUMMARY_QUANTILES = (0.5, 0.99)
+
+@dataclass
+class SpanStats:
+    """
+    Totals of a span since start up and its most recent durations for quantiles.
+    """
+
+    count: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    allocated_bytes: int = 0  # net growth of traced memory, when memory is traced
+    recent_seconds: deque = field(default_factory=lambda: deque(maxlen=1000))
+
+    def add(self, seconds: float, allocated_bytes: int) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.allocated_bytes += allocated_bytes
+        self.recent_seconds.append(seconds)
+
+class Tracer:
+    """
+    Records durations (and optionally allocations) of named spans of the hot paths.
+    Spans are flat and keyed by name only, so nested and concurrent spans each count
+    their full duration. When disabled, `span` returns a shared no-op context and
+    `traced` functions are called straight away.
+    """
+
+    def __init__(self, enabled: bool = False, trace_memory: bool = False):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self._spans: dict[str, SpanStats] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: bool, trace_memory: bool = False) -> None:
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def span(self, name: str) -> contextlib.AbstractContextManager:
+        if not self.enabled:
+            return _NO_SPAN
+
+        return self._record(name)
+
+    def traced(self, name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        """
+        Decorator recording every call of a function as span `name`.
+        """
+        def decorator(function: Callable[..., Any]) -> Callable[..., Any]:
+            @functools.wraps(function)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                if not self.enabled:
+                    return function(*args, **kwargs)
+
+                with self._record(name):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    @contextlib.contextmanager
+    def _record(self, name: str) -> Iterator[None]:
+        trace_memory = self.trace_memory and tracemalloc.is_tracing()
+        start_bytes = tracemalloc.get_traced_memory()[0] if trace_memory else 0
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            allocated_bytes = tracemalloc.get_traced_memory()[0] - start_bytes \
+                if trace_memory else 0
+
+            with self._lock:
+                self._spans.setdefault(name, SpanStats()).add(seconds, allocated_bytes)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._spans.clear()
+
+    def summary(self) -> "pd.DataFrame":
+        """
+        One row per span: call count, total, mean and max seconds, quantiles of the
+        recent durations and the net allocated bytes.
+        """
+        import pandas as pd  # only for reports, the translator page does not need it otherwise
+
+        with self._lock:
+            spans = {name: (stats.count, stats.total_seconds, stats.max_seconds,
+                            stats.allocated_bytes, np.array(stats.recent_seconds))
+                     for name, stats in self._spans.items()}
+
+        rows = {}
+        for name, (count, total_seconds, max_seconds, allocated_bytes, recent) in spans.items():
+            quantiles = np.quantile(recent, SUMMARY_QUANTILES)
+            rows[name] = {"Count": count,
+                          "Total seconds": total_seconds,
+                          "Mean seconds": total_seconds / count,
+                          "Median seconds": quantiles[0],
+                          "Percentile 99 seconds": quantiles[1],
+                          "Max seconds": max_seconds,
+                          "Allocated bytes": allocated_bytes}
+
+        summary = pd.DataFrame.from_dict(rows, orient="index")
+        summary.index.name = "Span"
+
+        return summary.sort_index()
+
+    def to_prometheus(self) -> str:
+        """
+        Spans in the Prometheus text exposition format: a summary of the durations
+        (quantiles over the recent ones) and a counter of the allocated bytes.
+        """
+        summary = self.summary()
+        lines = ["# HELP koala_span_seconds Duration of instrumented stages.",
+                 "# TYPE koala_span_seconds summary"]
+
+        for name, row in summary.iterrows():
+            labels = f'span="{name}"'
+            lines += [f'koala_span_seconds{{{labels},quantile="0.5"}} {row["Median seconds"]:.9g}',
+                      f'koala_span_seconds{{{labels},quantile="0.99"}} '
+                      f'{row["Percentile 99 seconds"]:.9g}',
+                      f"koala_span_seconds_sum{{{labels}}} {row['Total seconds']:.9g}",
+                      f"koala_span_seconds_count{{{labels}}} {int(row['Count'])}"]
+
+        if self.trace_memory:
+            lines += ["# HELP koala_span_allocated_bytes_total Net memory allocated by stages.",
+                      "# TYPE koala_span_allocated_bytes_total counter"]
+            lines += [f'koala_span_allocated_bytes_total{{span="{name}"}} '
+                      f'{int(row["Allocated bytes"])}'
+                      for name, row in summary.iterrows()]
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """
+        Write `to_prometheus` to `path` atomically, for a node exporter textfile collector.
+        """
+        metrics_path = Path(path)
+        metrics_path.parent.mkdir(parents=True, exist_ok=True)
+
+        temp_path = metrics_path.with_suffix(f".{os.getpid()}.tmp")
+        temp_path.write_text(self.to_prometheus())
+        temp_path.replace(metrics_path)
+
+_NO_SPAN = contextlib.nullcontext()
+
+# spans of the whole process, see `configure_tracing`
+tracer = Tracer()
+span = tracer.span
+traced = tracer.traced
+
+def configure_tracing(enabled: bool, trace_memory: bool = False) -> None:
+    """
+    Turn span recording on or off. Tracing memory starts tracemalloc, which slows
+    allocations down, so it is meant for diagnosing rather than for production.
+    """
+    tracer.configure(enabled=enabled, trace_memory=trace_memory)
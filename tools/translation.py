@@ -1,26 +1,647 @@
+"""
+Greedy translation with ONNX models.
+
+Two kinds of models are supported:
+- a single graph (the default) mapping the padded source l_src_ and target l_tgt_,
+  both of shape (batch, 128), to logits of shape (batch, 128, vocab_size). It is run on
+  the whole target once per generated token.
+- split encoder and decoder graphs for incremental decoding. The encoder maps src_ids of
+  shape (batch, src_length), padded with <PAD>, to any outputs (for example the encoder
+  memory). The decoder takes the last tokens tgt_ids of shape (batch, 1), the encoder
+  inputs and outputs it declares by name and past_key_values.* tensors of shape
+  (batch, num_heads, past_length, head_dim). Its first output holds the logits of the
+  last position and every present.* output feeds past_key_values.* of the next step.
+
+All inputs have the batch on the first axis, and a static batch size caps the batches.
+"""
+import hashlib
+import os
+import platform
+import re
+import threading
+import unicodedata
+import warnings
+from collections.abc import Hashable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
 import numpy as np
 import onnxruntime
 from tokenizers import Tokenizer
 
-from .configuration import load_config
+from .cache import ResultCache, fingerprint
+from .configuration import InferenceProfile, load_config
+from .tracing import span, traced
+
+if TYPE_CHECKING:
+    from .scheduler import TranslationScheduler
+
+# source tokens kept when the encoder accepts any length, as for the single graph
+MAX_SRC_LENGTH = 128
+
+_PAST_PREFIX = "past_key_values"
+_PRESENT_PREFIX = "present"
+_ONNX_FLOAT_TYPES = {"tensor(float)": np.float32,
+                     "tensor(float16)": np.float16,
+                     "tensor(double)": np.float64}
+
+# quantized models are written here when no optimized model directory is configured
+TRANSLATOR_CACHE_DIR = ".cache/translator"
+
+_PROVIDERS = ["CPUExecutionProvider"]
+_OPTIMIZATION_LEVELS = {"disabled": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+                        "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+                        "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+                        "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL}
+
+def _session_options(profile: InferenceProfile) -> onnxruntime.SessionOptions:
+    if profile.optimization_level not in _OPTIMIZATION_LEVELS:
+        msg = f"""Unknown optimization level {profile.optimization_level},
+                    expected one of {list(_OPTIMIZATION_LEVELS)}"""
+        raise ValueError(msg)
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = profile.intra_op_threads
+    options.inter_op_num_threads = profile.inter_op_threads
+    options.enable_cpu_mem_arena = profile.memory_arena
+    options.graph_optimization_level = _OPTIMIZATION_LEVELS[profile.optimization_level]
+
+    return options
+
+def _model_key(model_path: str, *settings: object) -> str:
+    """
+    Identifies a derived model: the source file version, the settings it was derived
+    with and the ONNX Runtime version and machine, as optimized graphs may be specific
+    to both.
+    """
+    source = Path(model_path).stat()
+    parts = (Path(model_path).resolve(), source.st_mtime_ns, source.st_size,
+             onnxruntime.__version__, platform.machine(), *settings)
+
+    return hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+
+def _quantized_model(model_path: str, cache_dir: str) -> str:
+    """
+    Path of the int8 dynamically quantized copy of a model, quantized on first use.
+    Falls back to the model itself if quantization is not available.
+    """
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError:
+        warnings.warn("onnx is not installed, falling back to the unquantized model",
+                      stacklevel=4)
+        return model_path
+
+    quantized_path = Path(cache_dir) / f"{Path(model_path).stem}-{_model_key(model_path)}-int8.onnx"
+
+    if not quantized_path.exists():
+        quantized_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = quantized_path.with_suffix(f".{os.getpid()}.tmp")
+        quantize_dynamic(model_path, temp_path, weight_type=QuantType.QInt8)
+        temp_path.replace(quantized_path)
+
+    return str(quantized_path)
+
+def _session(model_path: str,
+             profile: InferenceProfile | None = None) -> onnxruntime.InferenceSession:
+    """
+    Inference session of a model with the settings of `profile`. With an optimized model
+    directory, the first session saves its optimized graph there and later sessions
+    (also after restarts) load it without optimizing again.
+    """
+    profile = profile or InferenceProfile()
+    options = _session_options(profile)
+
+    if profile.quantize:
+        model_path = _quantized_model(model_path, profile.optimized_model_dir
+                                      or TRANSLATOR_CACHE_DIR)
+
+    if profile.optimized_model_dir is None:
+        return onnxruntime.InferenceSession(model_path, options, providers=_PROVIDERS)
+
+    key = _model_key(model_path, profile.optimization_level)
+    optimized_path = Path(profile.optimized_model_dir) / f"{Path(model_path).stem}-{key}.onnx"
+
+    if optimized_path.exists():
+        options.graph_optimization_level = _OPTIMIZATION_LEVELS["disabled"]
+
+        return onnxruntime.InferenceSession(str(optimized_path), options, providers=_PROVIDERS)
+
+    optimized_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = optimized_path.with_suffix(f".{os.getpid()}.tmp")
+    options.optimized_model_filepath = str(temp_path)
+
+    session = onnxruntime.InferenceSession(model_path, options, providers=_PROVIDERS)
+    temp_path.replace(optimized_path)
+
+    return session
+
+class Translator:
+    """
+    Tokenizers and ONNX sessions of a translation model, created with `profile`.
+    Split encoder and decoder graphs are used if both exist, the single graph otherwise.
+    With a `cache`, sentences are translated once per model and normalized text.
+    """
+
+    def __init__(self,
+                 model_path: str,
+                 src_tokenizer_path: str,
+                 tgt_tokenizer_path: str,
+                 encoder_path: str | None = None,
+                 decoder_path: str | None = None,
+                 profile: InferenceProfile | None = None,
+                 cache: ResultCache | None = None):
+        # we need our tokenizers which original model used for training
+        self.src_lang = Tokenizer.from_file(src_tokenizer_path)
+        self.tgt_lang = Tokenizer.from_file(tgt_tokenizer_path)
+
+        self._src_pad_id = self.src_lang.token_to_id("<PAD>")
+        self._tgt_pad_id = self.tgt_lang.token_to_id("<PAD>")
+        self._bos_id = self.tgt_lang.token_to_id("<BOS>")
+        self._eos_id = self.tgt_lang.token_to_id("<EOS>")
+
+        split_paths = [path for path in (encoder_path, decoder_path) if path is not None]
+        self.incremental = len(split_paths) == 2 and all(Path(path).exists()
+                                                         for path in split_paths)
+
+        if split_paths and not self.incremental:
+            warnings.warn("Split encoder and decoder models not found, "
+                          "falling back to the single graph model", stacklevel=2)
+
+        self.cache = cache
+        model_paths = [encoder_path, decoder_path] if self.incremental else [model_path]
+        # cached translations are only valid for the same files and weights
+        self.model_id = fingerprint(*(_model_key(path) for path in model_paths),
+                                    src_tokenizer_path, tgt_tokenizer_path,
+                                    profile is not None and profile.quantize)
+
+        if self.incremental:
+            self._init_split(encoder_path, decoder_path, profile)
+        else:
+            self._session = _session(model_path, profile)
+            self._src_seq_length = self._session.get_inputs()[0].shape[1]
+            self._tgt_seq_length = self._session.get_inputs()[1].shape[1]
+            self._max_batch_size = _static_dim(self._session.get_inputs()[0].shape[0])
+
+    def _init_split(self,
+                    encoder_path: str,
+                    decoder_path: str,
+                    profile: InferenceProfile | None) -> None:
+        self._encoder = _session(encoder_path, profile)
+        self._decoder = _session(decoder_path, profile)
+
+        batch_size, src_length = self._encoder.get_inputs()[0].shape[:2]
+        # a static source length is padded to, a dynamic one only truncated at
+        self._src_seq_length = _static_dim(src_length) or MAX_SRC_LENGTH
+        self._pad_source = _static_dim(src_length) is not None
+        self._max_batch_size = _static_dim(batch_size)
+
+        self._decoder_inputs = {info.name for info in self._decoder.get_inputs()}
+        self._past_inputs = [info for info in self._decoder.get_inputs()
+                             if info.name.startswith(_PAST_PREFIX)]
+        self._present_names = {info.name: _PAST_PREFIX + info.name.removeprefix(_PRESENT_PREFIX)
+                               for info in self._decoder.get_outputs()
+                               if info.name.startswith(_PRESENT_PREFIX)}
+
+    @property
+    def max_batch_size(self) -> int | None:
+        """
+        Static batch size of the model, if any.
+        """
+        return self._max_batch_size
+
+    def cache_key(self, src_sentence: str, max_tgt_length: int) -> str:
+        return fingerprint(self.model_id, normalize_sentence(src_sentence), max_tgt_length)
+
+    def encode(self, src_sentences: list[str]) -> list[list[int]]:
+        """
+        Source token ids, truncated to the maximum source length.
+        """
+        with span("translation.encode"):
+            encodings = self.src_lang.encode_batch(src_sentences)
+
+        return [encoding.ids[:self._src_seq_length] for encoding in encodings]
+
+    def decoding_batch(self) -> "DecodingBatch":
+        """
+        An empty batch to decode rows in step by step, see `DecodingBatch`.
+        """
+        if self.incremental:
+            return _SplitGraphBatch(self)
+
+        return _SingleGraphBatch(self)
+
+    def translate(self, src_sentence: str, max_tgt_length: int = 100) -> str:
+        return self.translate_batch([src_sentence], max_tgt_length)[0]
+
+    def translate_batch(self,
+                        src_sentences: list[str],
+                        max_tgt_length: int = 100,
+                        batch_size: int = 16) -> list[str]:
+        """
+        Translate sentences in batches of similar lengths, so little padding is decoded.
+        Sentences leave their batch as soon as they reach <EOS>.
+        Batches are capped at the batch size of the model if it is static.
+        Only sentences missing from the cache are translated, each distinct one once.
+        """
+        if self.cache is None:
+            return self._translate_batch(src_sentences, max_tgt_length, batch_size)
+
+        src_sentences = [normalize_sentence(sentence) for sentence in src_sentences]
+        keys = [fingerprint(self.model_id, sentence, max_tgt_length) for sentence in src_sentences]
+
+        with span("translation.cache_get"):
+            translations = {key: self.cache.get(key) for key in dict.fromkeys(keys)}
+
+        missing = {key: sentence for key, sentence in zip(keys, src_sentences, strict=True)
+                   if translations[key] is None}
+
+        if missing:
+            translated = self._translate_batch(list(missing.values()), max_tgt_length, batch_size)
+
+            with span("translation.cache_put"):
+                for key, translation in zip(missing, translated, strict=True):
+                    self.cache.put(key, translation)
+                    translations[key] = translation
+
+        return [translations[key] for key in keys]
+
+    def _translate_batch(self,
+                         src_sentences: list[str],
+                         max_tgt_length: int,
+                         batch_size: int) -> list[str]:
+        input_ids = self.encode(src_sentences)
+
+        if self._max_batch_size is not None:
+            batch_size = min(batch_size, self._max_batch_size)
+
+        # length buckets: consecutive sentences in the order of their lengths
+        order = sorted(range(len(input_ids)), key=lambda i: len(input_ids[i]))
+        tgt_indices = [[] for _ in input_ids]  # type: list[list[int]]
+
+        for start in range(0, len(order), batch_size):
+            bucket = order[start:start + batch_size]
+            batch = self.decoding_batch()
+            batch.add(bucket, [input_ids[i] for i in bucket], max_tgt_length)
+
+            while len(batch):
+                for row in batch.step():
+                    tgt_indices[row.key] = row.tokens.tolist()
+
+        with span("translation.detokenize"):
+            sentences = self.tgt_lang.decode_batch(tgt_indices, skip_special_tokens=True)
+
+        return sentences
+
+    def translate_stream(self,
+                         src_sentence: str,
+                         max_tgt_length: int = 100,
+                         cancel: threading.Event | None = None) -> Iterator[str]:
+        """
+        Translate a sentence, yielding the translation so far whenever a generated token
+        changes it. Decoding stops once `cancel` is set or the generator is closed,
+        and only complete translations are cached.
+        """
+        if self.cache is not None:
+            src_sentence = normalize_sentence(src_sentence)
+            key = fingerprint(self.model_id, src_sentence, max_tgt_length)
+            translation = self.cache.get(key)
+
+            if translation is not None:
+                yield translation
+                return
+
+        batch = self.decoding_batch()
+        batch.add([0], self.encode([src_sentence]), max_tgt_length)
+        translation = ""
+
+        while len(batch):
+            if cancel is not None and cancel.is_set():
+                return
+
+            finished = batch.step()
+            tokens = finished[0].tokens if finished else batch.tokens(0)
+
+            with span("translation.detokenize"):
+                partial = self.tgt_lang.decode(tokens.tolist(), skip_special_tokens=True)
+
+            if partial != translation:
+                translation = partial
+                yield translation
+
+        if self.cache is not None:
+            self.cache.put(key, translation)
+
+@dataclass
+class DecodedRow:
+    key: Hashable
+    tokens: np.ndarray  # from <BOS> up to <EOS> or the maximum length
+
+class DecodingBatch:
+    """
+    Rows decoded greedily together, one token per row and step. Rows can be added
+    between steps and leave the batch once finished (continuous batching).
+    """
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def add(self,
+            keys: list[Hashable],
+            batch_ids: list[list[int]],
+            max_tgt_length: int | list[int]) -> None:
+        """
+        Add rows to decode, up to `max_tgt_length` tokens each (one for all or per row).
+        """
+        raise NotImplementedError
+
+    def remove(self, keys: set[Hashable]) -> None:
+        raise NotImplementedError
+
+    def tokens(self, key: Hashable) -> np.ndarray:
+        """
+        Tokens generated so far by a running row.
+        """
+        raise NotImplementedError
+
+    def step(self) -> list[DecodedRow]:
+        """
+        Generate the next token of every row and return the rows that finished.
+        """
+        raise NotImplementedError
+
+class _SingleGraphBatch(DecodingBatch):
+    """
+    Rows of the single graph, which re-encodes the sources and re-decodes all previous
+    positions for every token. Each row keeps its own position, so rows join any time.
+    """
+
+    def __init__(self, translator: Translator):
+        self._translator = translator
+        self._keys: list[Hashable] = []
+        self._input_ids = np.empty((0, translator._src_seq_length), dtype=np.int64)
+        self._tokens = np.empty((0, translator._tgt_seq_length), dtype=np.int64)
+        self._positions = np.empty(0, dtype=np.int64)  # of the last token of every row
+        self._last_positions = np.empty(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self,
+            keys: list[Hashable],
+            batch_ids: list[list[int]],
+            max_tgt_length: int | list[int]) -> None:
+        translator = self._translator
+        tokens = np.full((len(keys), translator._tgt_seq_length), translator._tgt_pad_id,
+                         dtype=np.int64)
+        tokens[:, 0] = translator._bos_id
+        # the target holds at most tgt_seq_length tokens including <BOS>
+        last_positions = np.clip(np.broadcast_to(max_tgt_length, len(keys)),
+                                 1, translator._tgt_seq_length - 1)
+
+        self._keys += keys
+        self._input_ids = np.concatenate([
+            self._input_ids,
+            _pad_batch(batch_ids, translator._src_seq_length, translator._src_pad_id)])
+        self._tokens = np.concatenate([self._tokens, tokens])
+        self._positions = np.concatenate([self._positions, np.zeros(len(keys), dtype=np.int64)])
+        self._last_positions = np.concatenate([self._last_positions, last_positions])
+
+    def remove(self, keys: set[Hashable]) -> None:
+        self._keep(np.array([key not in keys for key in self._keys], dtype=bool))
+
+    def tokens(self, key: Hashable) -> np.ndarray:
+        i = self._keys.index(key)
+
+        return self._tokens[i, :self._positions[i] + 1]
+
+    def step(self) -> list[DecodedRow]:
+        # shape (batch_size, 128, 8000) -> (batch_size, seq_length, tgt_vocab_size)
+        with span("translation.decode_step"):
+            model_outputs = self._translator._session.run(None, {"l_src_": self._input_ids,
+                                                                 "l_tgt_": self._tokens})[0]
+
+        # we take the best prediction at the position of every row only
+        # (generating autoregressivly)
+        rows = np.arange(len(self._keys))
+        predictions = model_outputs[rows, self._positions].argmax(axis=-1)
+        self._positions += 1
+        self._tokens[rows, self._positions] = predictions
+
+        finished = ((predictions == self._translator._eos_id)
+                    | (self._positions >= self._last_positions))
+        if not finished.any():
+            return []
+
+        decoded = [DecodedRow(key=self._keys[i], tokens=self._tokens[i, :self._positions[i] + 1])
+                   for i in np.flatnonzero(finished)]
+        self._keep(~finished)
+
+        return decoded
+
+    def _keep(self, rows: np.ndarray) -> None:
+        self._keys = [key for key, keep in zip(self._keys, rows, strict=True) if keep]
+        self._input_ids = self._input_ids[rows]
+        self._tokens = self._tokens[rows]
+        self._positions = self._positions[rows]
+        self._last_positions = self._last_positions[rows]
+
+@dataclass
+class _Cohort:
+    """
+    Rows of the split graphs that joined together and so share the length of their past.
+    """
+
+    keys: list[Hashable]
+    context: dict[str, np.ndarray]  # encoder inputs and outputs the decoder takes
+    past: dict[str, np.ndarray]
+    tokens: np.ndarray
+    last_positions: np.ndarray
+    position: int = 0
+
+    def keep(self, rows: np.ndarray) -> None:
+        self.keys = [key for key, keep in zip(self.keys, rows, strict=True) if keep]
+        self.context = {name: value[rows] for name, value in self.context.items()}
+        self.past = {name: value[rows] for name, value in self.past.items()}
+        self.tokens = self.tokens[rows]
+        self.last_positions = self.last_positions[rows]
+
+class _SplitGraphBatch(DecodingBatch):
+    """
+    Rows of the split graphs: the encoder runs once per added cohort and every decoder step
+    only processes the last tokens, reusing the keys and values of previous steps.
+    Pasts of different lengths cannot be stacked without an attention mask, so every
+    cohort runs its own decoder step.
+    """
+
+    def __init__(self, translator: Translator):
+        self._translator = translator
+        self._cohorts: list[_Cohort] = []
+        self._output_names = [info.name for info in translator._decoder.get_outputs()]
+
+    def __len__(self) -> int:
+        return sum(len(cohort.keys) for cohort in self._cohorts)
+
+    def add(self,
+            keys: list[Hashable],
+            batch_ids: list[list[int]],
+            max_tgt_length: int | list[int]) -> None:
+        translator = self._translator
+        src_length = (translator._src_seq_length if translator._pad_source
+                      else max(map(len, batch_ids)))
+        encoder_feeds = {translator._encoder.get_inputs()[0].name:
+                         _pad_batch(batch_ids, src_length, translator._src_pad_id)}
+
+        with span("translation.encoder"):
+            encoder_outputs = translator._encoder.run(None, encoder_feeds)
+
+        encoder_feeds |= {info.name: output for info, output
+                          in zip(translator._encoder.get_outputs(), encoder_outputs, strict=True)}
+
+        # no past yet: shape (batch, num_heads, 0, head_dim)
+        past = {info.name: np.zeros((len(keys), info.shape[1], 0, info.shape[3]),
+                                    dtype=_ONNX_FLOAT_TYPES.get(info.type, np.float32))
+                for info in translator._past_inputs}
+
+        last_positions = np.maximum(np.broadcast_to(max_tgt_length, len(keys)), 1)
+        tokens = np.full((len(keys), last_positions.max() + 1), translator._tgt_pad_id,
+                         dtype=np.int64)
+        tokens[:, 0] = translator._bos_id
+
+        self._cohorts.append(_Cohort(keys=list(keys),
+                                     context={name: value for name, value in encoder_feeds.items()
+                                              if name in translator._decoder_inputs},
+                                     past=past,
+                                     tokens=tokens,
+                                     last_positions=last_positions))
+
+    def remove(self, keys: set[Hashable]) -> None:
+        for cohort in self._cohorts:
+            cohort.keep(np.array([key not in keys for key in cohort.keys], dtype=bool))
+
+        self._cohorts = [cohort for cohort in self._cohorts if cohort.keys]
 
-BASE_DIR = "utils/assets"
-config = load_config()
+    def tokens(self, key: Hashable) -> np.ndarray:
+        for cohort in self._cohorts:
+            if key in cohort.keys:
+                return cohort.tokens[cohort.keys.index(key), :cohort.position + 1]
 
-model_path = f"{BASE_DIR}/translator_transformer_v4_2_layers.onnx"
+        raise KeyError(key)
 
-ort_session = onnxruntime.InferenceSession(config.translator_model_path,
-                                           providers=["CPUExecutionProvider"])
+    def step(self) -> list[DecodedRow]:
+        decoded = []
 
-ort_inputs_info = ort_session.get_inputs()
-src_seq_length = ort_inputs_info[0].shape[1]
-tgt_seq_length = ort_inputs_info[1].shape[1]
+        for cohort in self._cohorts:
+            decoded += self._step(cohort)
 
-# we need our tokenizers which original model used for training
-src_lang = Tokenizer.from_file(config.de_tokenizer_path)
-tgt_lang = Tokenizer.from_file(config.en_tokenizer_path)
+        self._cohorts = [cohort for cohort in self._cohorts if cohort.keys]
 
+        return decoded
 
+    def _step(self, cohort: _Cohort) -> list[DecodedRow]:
+        translator = self._translator
+        position = cohort.position
+
+        with span("translation.decode_step"):
+            logits, *presents = translator._decoder.run(
+                None, cohort.context | cohort.past
+                | {"tgt_ids": cohort.tokens[:, position:position + 1]})
+
+        cohort.past = {translator._present_names[name]: present
+                       for name, present in zip(self._output_names[1:], presents, strict=True)
+                       if name in translator._present_names}
+
+        num_rows = len(cohort.keys)
+        predictions = logits.reshape(num_rows, -1, logits.shape[-1])[:, -1].argmax(axis=-1)
+        cohort.position += 1
+        cohort.tokens[:, cohort.position] = predictions
+
+        finished = (predictions == translator._eos_id) | (cohort.position >= cohort.last_positions)
+        if not finished.any():
+            return []
+
+        decoded = [DecodedRow(key=cohort.keys[i], tokens=cohort.tokens[i, :cohort.position + 1])
+                   for i in np.flatnonzero(finished)]
+        cohort.keep(~finished)
+
+        return decoded
+
+def _static_dim(dim: int | str | None) -> int | None:
+    return dim if isinstance(dim, int) else None
+
+def _pad_batch(batch_ids: list[list[int]], length: int, pad_id: int) -> np.ndarray:
+    padded = np.full((len(batch_ids), length), pad_id, dtype=np.int64)
+    for row, ids in zip(padded, batch_ids, strict=True):
+        row[:len(ids)] = ids
+
+    return padded
+
+def normalize_sentence(sentence: str) -> str:
+    """
+    Sentence with unicode normalized (NFC) and whitespace collapsed, so texts that only
+    differ in these share their cached translation.
+    """
+    return unicodedata.normalize("NFC", " ".join(sentence.split()))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+def split_sentences(text: str) -> list[list[str]]:
+    """
+    Split text into paragraphs (at line breaks) of sentences (after ., !, ? or …).
+    """
+    paragraphs = (paragraph.strip() for paragraph in text.splitlines())
+
+    return [_SENTENCE_END.split(paragraph) for paragraph in paragraphs if paragraph]
+
+def _join_paragraphs(paragraphs: list[list[str]]) -> str:
+    return "\n".join(" ".join(paragraph) for paragraph in paragraphs)
+
+# translations by model and sentence, see `configure_translation_cache`
+translation_cache = ResultCache(max_bytes=8 * 2**20)
+
+def configure_translation_cache(max_bytes: int,
+                                disk_path: str | None = None,
+                                disk_max_bytes: int = 256 * 2**20,
+                                max_entries: int | None = None) -> None:
+    """
+    Bound the in-memory translation cache and optionally share translations between
+    processes through a sqlite file at `disk_path`.
+    """
+    translation_cache.configure(max_bytes=max_bytes,
+                                disk_path=disk_path,
+                                disk_max_bytes=disk_max_bytes,
+                                max_entries=max_entries)
+
+_translator: Translator | None = None
+_translator_lock = threading.Lock()
+
+def get_translator() -> Translator:
+    """
+    Translator of the app configuration, created on first use and shared by all threads.
+    """
+    global _translator  # noqa: PLW0603
+
+    if _translator is None:
+        with _translator_lock:
+            if _translator is None:
+                config = load_config()
+                _translator = Translator(model_path=config.translator_model_path,
+                                         src_tokenizer_path=config.de_tokenizer_path,
+                                         tgt_tokenizer_path=config.en_tokenizer_path,
+                                         encoder_path=config.translator_encoder_path,
+                                         decoder_path=config.translator_decoder_path,
+                                         profile=config.translator_profile,
+                                         cache=translation_cache)
+
+    return _translator
+
+def _get_scheduler() -> "TranslationScheduler | None":
+    from .scheduler import get_scheduler  # the scheduler module builds on this one
+
+    return get_scheduler()
+
+@traced("translation.translate")
 def translate(src_sentence: str,
               max_tgt_length: int = 100) -> str:
     """
@@ -28,31 +649,58 @@ def translate(src_sentence: str,
     We pass one token at a time, i.e. generating autoregressively
     using model's own outputs as inputs.
     """
-    input_ids = src_lang.encode(src_sentence).ids[:src_seq_length]
-    input_ids = np.pad(input_ids, (0, src_seq_length - len(input_ids)),
-                       constant_values=src_lang.token_to_id("<PAD>"))
+    scheduler = _get_scheduler()
+    if scheduler is not None:
+        return scheduler.submit(src_sentence, max_tgt_length).result()
+
+    return get_translator().translate(src_sentence, max_tgt_length)
 
-    input_ids = np.reshape(input_ids, (1, -1))
+@traced("translation.translate_document")
+def translate_document(text: str,
+                       max_tgt_length: int = 100,
+                       batch_size: int = 16) -> str:
+    """
+    Translate text of any length: sentences are translated separately in batches
+    and reassembled in their paragraphs.
+    With the scheduler, they join the batches shared with other sessions instead.
+    """
+    paragraphs = split_sentences(text)
+    src_sentences = [sentence for paragraph in paragraphs for sentence in paragraph]
 
-    tgt_indices = [tgt_lang.token_to_id("<BOS>")]  # type: list[int]
+    scheduler = _get_scheduler()
+    if scheduler is not None:
+        sentences = scheduler.translate(src_sentences, max_tgt_length)
+    else:
+        sentences = get_translator().translate_batch(src_sentences,
+                                                     max_tgt_length=max_tgt_length,
+                                                     batch_size=batch_size)
 
-    for t in range(max_tgt_length):
-        tgt_ids = np.array(tgt_indices)
-        tgt_ids = np.pad(tgt_ids, (0, tgt_seq_length - len(tgt_ids)),
-                         constant_values=tgt_lang.token_to_id("<PAD>"))
-        tgt_ids = np.reshape(tgt_ids, (1, -1))
+    translated = iter(sentences)
+
+    return _join_paragraphs([[next(translated) for _ in paragraph] for paragraph in paragraphs])
+
+def translate_stream(text: str,
+                     max_tgt_length: int = 100,
+                     cancel: threading.Event | None = None) -> Iterator[str]:
+    """
+    Translate text of any length sentence by sentence, yielding the whole translation
+    so far as tokens are generated, so the first words show up after a few decoding
+    steps. Stops once `cancel` is set or the generator is closed.
+    """
+    scheduler = _get_scheduler()
+    stream = scheduler.stream if scheduler is not None else get_translator().translate_stream
+    done = []  # type: list[list[str]]
 
-        # shape (1, 128, 8000) -> (batch_size, seq_length, tgt_vocab_size)
-        model_outputs = ort_session.run(None, {"l_src_": input_ids,
-                                        "l_tgt_": tgt_ids})[0]
+    for paragraph in split_sentences(text):
+        done.append([])
 
-        # we take the best prediction for step t only (generating autoregressivly)
-        prediction = model_outputs[0, t].argmax()  # type: int
-        tgt_indices.append(prediction)
+        for sentence in paragraph:
+            partial = ""
 
-        if prediction == tgt_lang.token_to_id("<EOS>"):
-            break
+            for partial in stream(sentence, max_tgt_length, cancel):
+                yield _join_paragraphs([*done[:-1], [*done[-1], partial]])
 
-    sentence = tgt_lang.decode(tgt_indices, skip_special_tokens=True)
+            if cancel is not None and cancel.is_set():
+                return
 
-    return sentence
+            done[-1].append(partial)